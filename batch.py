@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+批量占卜模块
+Batch Divination
+
+从 JSONL 文件或标准输入流式读取问题，按可配置的并发度调用AI模型，
+每完成一条即写出一行 JSONL 结果；内存占用与输入规模无关，
+并支持在崩溃后从检查点续跑。
+
+输入每行可以是 JSON 字符串 "问题"，或对象 {"id": ..., "question": "问题"}。
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from history_store import HistoryStore
+from main import IChing
+from metrics import MetricsRegistry, start_http_server
+from output_sink import OutputSink
+from profiling import RequestProfiler
+
+
+def parse_input_line(line):
+    """
+    解析一行输入
+
+    Args:
+        line: 原始输入行
+
+    Returns:
+        dict: {'id': ..., 'question': ...}，空行返回None
+
+    Raises:
+        ValueError: 无法解析的输入行
+    """
+    line = line.strip()
+    if not line:
+        return None
+    obj = json.loads(line)
+    if isinstance(obj, str):
+        return {'question': obj}
+    if isinstance(obj, dict):
+        return obj
+    raise ValueError(f"不支持的输入类型: {type(obj).__name__}")
+
+
+class Checkpoint:
+    """
+    批处理检查点
+
+    记录已连续完成的最小行号、其后零散完成的行号，以及对应的输出文件偏移量。
+    续跑时将输出文件截断到该偏移量，因此检查点之后写出的结果会被重新生成，
+    不会出现重复或缺失。
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """读取检查点，不存在时返回None"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, next_index, done, output_offset):
+        """原子写入检查点"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'next_index': next_index,
+                'done': sorted(done),
+                'output_offset': output_offset
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        """批处理完成后删除检查点"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class BatchRunner:
+    """批量占卜执行器"""
+
+    def __init__(self, iching, parallelism=4, window=None,
+                 checkpoint=None, checkpoint_interval=1.0):
+        """
+        初始化批量占卜执行器
+
+        Args:
+            iching: IChing 实例（verbose 应为 False）
+            parallelism: 同时进行的AI请求数
+            window: 最早未完成行与最新提交行之间允许的最大距离，
+                    用于限制乱序完成时的内存占用，默认 parallelism * 8
+            checkpoint: Checkpoint 实例，None 表示不记录检查点
+            checkpoint_interval: 检查点写入的最小间隔（秒）
+        """
+        self.iching = iching
+        self.parallelism = max(1, parallelism)
+        self.window = window or self.parallelism * 8
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._next_index = 0
+        self._done = set()
+        self._offset = 0
+        self._last_checkpoint = 0.0
+        self._output = None
+        self._error = None      # 写出结果或检查点时的首个错误，由 run() 抛出
+        self.completed = 0
+        self.failed = 0
+
+    def run(self, input_stream, output_stream, resume_state=None, output_offset=0):
+        """
+        执行批处理
+
+        Args:
+            input_stream: 文本输入流（逐行读取）
+            output_stream: 二进制输出流
+            resume_state: 检查点内容，None 表示从头开始
+            output_offset: 输出流当前的字节偏移量
+
+        Returns:
+            tuple: (完成条数, 失败条数)
+
+        Raises:
+            OSError: 写出结果或检查点失败（如磁盘已满），此时保留检查点以便续跑
+        """
+        # 结果合并写出；写检查点前先刷新，保证检查点中的偏移量不超过已写出的数据
+        self._output = OutputSink(output_stream)
+        self._offset = output_offset
+        if resume_state:
+            self._next_index = resume_state['next_index']
+            self._done = set(resume_state['done'])
+
+        with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+            for index, line in enumerate(input_stream):
+                if index < self._next_index or index in self._done:
+                    continue
+                if not line.strip():
+                    with self._cond:
+                        self._mark_done(index)
+                    continue
+
+                with self._cond:
+                    while self._error is None and (self._in_flight >= self.parallelism
+                                                   or index >= self._next_index + self.window):
+                        self._cond.wait()
+                    if self._error is not None:
+                        break
+                    self._in_flight += 1
+                pool.submit(self._process, index, line, time.perf_counter())
+
+            with self._cond:
+                while self._in_flight:
+                    self._cond.wait()
+
+        if self._error is not None:
+            raise self._error
+        self._output.close()
+        if self.checkpoint:
+            self.checkpoint.remove()
+        return self.completed, self.failed
+
+    def _process(self, index, line, submitted):
+        """处理单条输入并写出结果"""
+        self.iching.metrics.observe_stage("queue_wait", time.perf_counter() - submitted)
+        try:
+            try:
+                item = parse_input_line(line)
+            except ValueError as e:
+                record = {'error': f"无法解析输入行: {e}"}
+                item = {}
+            else:
+                record = self.iching.divine_record(str(item.get('question', '')))
+            result = {'index': index, 'id': item.get('id', index)}
+            result.update(record)
+        except Exception as e:
+            result = {'index': index, 'id': index, 'error': f"{type(e).__name__}: {e}"}
+
+        data = (json.dumps(result, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._cond:
+            try:
+                if self._error is None:
+                    self._output.write(data)
+                    self._offset += len(data)
+                    if result.get('error'):
+                        self.failed += 1
+                    else:
+                        self.completed += 1
+                    self._mark_done(index)
+            except Exception as e:
+                # 已提交的行照常结束，run() 不再提交新行并抛出该错误
+                self._error = e
+            finally:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def _mark_done(self, index):
+        """标记某行完成并推进检查点（需持有锁）"""
+        self._done.add(index)
+        while self._next_index in self._done:
+            self._done.remove(self._next_index)
+            self._next_index += 1
+
+        now = time.monotonic()
+        if self.checkpoint and now - self._last_checkpoint >= self.checkpoint_interval:
+            self._output.flush()
+            self.checkpoint.save(self._next_index, self._done, self._offset)
+            self._last_checkpoint = now
+
+
+def run_batch(input_path, output_path, parallelism=4, resume=False,
+              ollama_url="http://localhost:11434", model="FortuneQwen3_q8:4b",
+              history_path=None, metrics=None, profiler=None, pregenerated_path=None,
+              cache_threshold=None, timeout=None):
+    """
+    批量占卜入口
+
+    Args:
+        input_path: 输入 JSONL 路径，"-" 表示标准输入
+        output_path: 输出 JSONL 路径，"-" 表示标准输出（不支持续跑）
+        parallelism: 并发度
+        resume: 是否从检查点续跑
+        history_path: 历史记录数据库路径，None 表示不记录
+        metrics: 可选的 MetricsRegistry
+        profiler: 可选的 RequestProfiler
+        pregenerated_path: 预生成解卦文件路径，问题为空的行直接取用
+        cache_threshold: 相似问题缓存的相似度阈值，None 表示不启用
+        timeout: 单条占卜时限（秒），超时输出参考解读 ('fallback' 为 true)
+
+    Returns:
+        tuple: (完成条数, 失败条数)
+    """
+    history = HistoryStore(history_path) if history_path else None
+    pregenerated = None
+    if pregenerated_path:
+        from pregenerated import PregeneratedStore
+        pregenerated = PregeneratedStore(pregenerated_path)
+    cache = None
+    if cache_threshold is not None:
+        from semantic_cache import SemanticCache
+        cache = SemanticCache(threshold=cache_threshold)
+    iching = IChing(ollama_url=ollama_url, model=model, verbose=False, concise=True,
+                    history=history, metrics=metrics, profiler=profiler,
+                    pregenerated=pregenerated, cache=cache, timeout=timeout)
+    if not iching.ollama.check_connection():
+        raise ConnectionError(f"无法连接到Ollama服务 ({ollama_url})")
+
+    to_stdout = output_path == "-"
+    checkpoint = None if to_stdout else Checkpoint(f"{output_path}.ckpt")
+    resume_state = checkpoint.load() if (resume and checkpoint) else None
+
+    if to_stdout:
+        output_stream = sys.stdout.buffer
+        offset = 0
+    else:
+        output_stream = open(output_path, 'ab' if resume_state else 'wb')
+        if resume_state:
+            # 丢弃检查点之后写出的结果，这些行会被重新处理
+            output_stream.truncate(resume_state['output_offset'])
+            output_stream.seek(resume_state['output_offset'])
+        offset = output_stream.tell()
+
+    input_stream = sys.stdin if input_path == "-" else open(input_path, 'r', encoding='utf-8')
+    runner = BatchRunner(iching, parallelism=parallelism, checkpoint=checkpoint)
+    try:
+        return runner.run(input_stream, output_stream,
+                          resume_state=resume_state, output_offset=offset)
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if not to_stdout:
+            output_stream.close()
+        if history is not None:
+            history.close()
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="批量周易占卜 (JSONL 输入/输出)")
+    parser.add_argument("input", nargs="?", default="-", help="输入 JSONL 文件，默认标准输入")
+    parser.add_argument("-o", "--output", default="-", help="输出 JSONL 文件，默认标准输出")
+    parser.add_argument("-j", "--parallelism", type=int, default=4, help="并发请求数 (默认: 4)")
+    parser.add_argument("--resume", action="store_true", help="从检查点续跑")
+    parser.add_argument("--url", default="http://localhost:11434", help="Ollama服务地址")
+    parser.add_argument("--model", default="FortuneQwen3_q8:4b", help="使用的AI模型")
+    parser.add_argument("--history", help="将结果写入历史记录数据库 (SQLite)")
+    parser.add_argument("--pregenerated", help="预生成解卦文件，问题为空的行直接取用")
+    parser.add_argument("--cache-threshold", type=float,
+                        help="启用相似问题缓存，余弦相似度达到该值即复用解卦 (建议 0.55)")
+    parser.add_argument("--timeout", type=float, help="单条占卜时限（秒），超时输出依据原文的参考解读")
+    parser.add_argument("--metrics-port", type=int, help="在该端口导出 Prometheus 指标 (/metrics)")
+    parser.add_argument("--profile-dir", help="启用请求剖析，报告写入该目录")
+    parser.add_argument("--profile-every", type=int, default=100, help="每 N 条剖析一次 (默认: 100)")
+    args = parser.parse_args()
+
+    metrics = None
+    if args.metrics_port:
+        metrics = MetricsRegistry()
+        start_http_server(metrics, port=args.metrics_port)
+    profiler = None
+    if args.profile_dir:
+        profiler = RequestProfiler(directory=args.profile_dir, every=args.profile_every)
+
+    start = time.perf_counter()
+    try:
+        completed, failed = run_batch(args.input, args.output, parallelism=args.parallelism,
+                                      resume=args.resume, ollama_url=args.url, model=args.model,
+                                      history_path=args.history, metrics=metrics,
+                                      profiler=profiler, pregenerated_path=args.pregenerated,
+                                      cache_threshold=args.cache_threshold, timeout=args.timeout)
+    except ConnectionError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+    print(f"完成 {completed} 条，失败 {failed} 条，耗时 {elapsed:.1f} 秒", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
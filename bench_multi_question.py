@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+多问题合并请求基准
+Multi-Question Benchmark
+
+比较同一卦象下 K 个问题“逐个请求”与“合并为一次请求”时，
+每个回答平均需要模型评估的 prompt token 数、生成 token 数与耗时。
+token 数取自 Ollama 响应中的 prompt_eval_count / eval_count；
+未指定 --url 时在进程内启动 fake_ollama（其 prompt_eval_count 为字符数）。
+
+    python bench_multi_question.py --k 1 2 4 8
+    python bench_multi_question.py --url http://localhost:11434 --k 1 4
+"""
+
+import time
+
+from prompt_templates import PromptTemplates
+
+
+QUESTIONS = (
+    "我的事业发展如何？", "这段感情能否长久？", "今年财运怎么样？", "近期适合跳槽吗？",
+    "考研能否上岸？", "家人健康是否平安？", "这笔投资能赚钱吗？", "搬家去外地好不好？",
+)
+
+
+def _generate(iching, prompt, system_prompt, max_tokens, stop):
+    stats = {}
+    start = time.perf_counter()
+    response = iching.ollama.generate(prompt=prompt, system_prompt=system_prompt, stream=False,
+                                      stats=stats, max_tokens=max_tokens, stop=stop)
+    if response.startswith("错误:"):
+        raise RuntimeError(response)
+    return stats, time.perf_counter() - start
+
+
+def bench(iching, k, lines=None):
+    """
+    对同一爻象的前 k 个问题分别测量两种方式
+
+    Returns:
+        dict: {'single': {...}, 'multi': {...}}，各项为每个回答的平均值
+    """
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(k)]
+    reading = iching.prepare(lines=lines) if lines else iching.prepare()
+    lines = reading['divination_result']['original_lines']
+    interpretation = reading['interpretation']
+
+    single = {'prompt_tokens': 0, 'eval_tokens': 0, 'seconds': 0.0}
+    for question in questions:
+        r = iching.prepare(question, lines=lines)
+        stats, seconds = _generate(iching, r['user_prompt'], r['system_prompt'],
+                                   PromptTemplates.MAX_TOKENS_CONCISE,
+                                   PromptTemplates.STOP_SEQUENCES_CONCISE)
+        single['prompt_tokens'] += stats.get('prompt_eval_count', 0)
+        single['eval_tokens'] += stats.get('eval_count', 0)
+        single['seconds'] += seconds
+
+    prompt, system_prompt = PromptTemplates.build_multi_question_prompt(
+        questions, reading['hexagram_info'], interpretation['original_text'],
+        interpretation['changed_text'])
+    stats, seconds = _generate(iching, prompt, system_prompt,
+                               PromptTemplates.MAX_TOKENS_CONCISE * k,
+                               PromptTemplates.multi_question_stop(k))
+    multi = {'prompt_tokens': stats.get('prompt_eval_count', 0),
+             'eval_tokens': stats.get('eval_count', 0), 'seconds': seconds}
+
+    return {name: {key: value / k for key, value in totals.items()}
+            for name, totals in (('single', single), ('multi', multi))}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from main import IChing
+
+    parser = argparse.ArgumentParser(description="多问题合并请求基准")
+    parser.add_argument("--url", help="Ollama服务地址，不指定时使用进程内替身")
+    parser.add_argument("--model", default="FortuneQwen3_q8:4b", help="使用的AI模型")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 4, 8], help="每次合并的问题数")
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        from fake_ollama import FakeOllamaConfig, start_fake_ollama
+        server = start_fake_ollama(config=FakeOllamaConfig(ttft=0.05, tokens_per_second=500))
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        print(f"使用进程内 Ollama 替身 {url}（token 数为字符数）")
+
+    iching = IChing(ollama_url=url, model=args.model, verbose=False, concise=True)
+    lines = iching.prepare()['divination_result']['original_lines']
+
+    print(f"\n{'K':>3} | {'prompt/回答 逐个':>14} {'合并':>8} {'节省':>6} | "
+          f"{'生成/回答 逐个':>13} {'合并':>8} | {'耗时/回答 逐个':>13} {'合并':>8}")
+    for k in args.k:
+        result = bench(iching, k, lines=lines)
+        single, multi = result['single'], result['multi']
+        saved = 1 - multi['prompt_tokens'] / single['prompt_tokens'] if single['prompt_tokens'] else 0.0
+        print(f"{k:>3} | {single['prompt_tokens']:>14.0f} {multi['prompt_tokens']:>8.0f} {saved:>6.0%} | "
+              f"{single['eval_tokens']:>13.0f} {multi['eval_tokens']:>8.0f} | "
+              f"{single['seconds'] * 1000:>11.0f}ms {multi['seconds'] * 1000:>6.0f}ms")
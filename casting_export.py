@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+起卦数据集导出
+Casting Dataset Export
+
+以大衍筮法批量起卦，按列分块写出定长整数列，供研究与模型微调使用：
+
+    line_state   uint16  爻象编号 (0-4095，见 line_state_to_index)
+    original     uint8   本卦卦序 (1-64)
+    changed      uint8   之卦卦序 (1-64，无变爻时与本卦相同)
+    moving_mask  uint8   变爻掩码（第 i 位为第 i+1 爻）
+    seed         uint64  该次起卦的随机种子
+
+第 i 行的种子为 seed + i，
+DayanDivination(verbose=False, rng=random.Random(seed)).simulate() 可复现该行。
+
+每个分块只在 Python 中逐行采样爻象，其余各列由 hexagram_relations 的查表以 numpy
+向量化得到，写出为顺序追加，因此吞吐量由采样决定，内存占用与总行数无关；
+多进程采样 (-j) 时结果与单进程逐位相同。
+
+输出格式：
+- npy：目录下每列一个 .npy 文件，可用 numpy.load(path, mmap_mode="r") 映射读取；
+- parquet：安装了 pyarrow 时可用，每个分块写为一个 row group。
+
+    python casting_export.py -n 10000000 -o castings/ -j 4
+    python casting_export.py -n 10000000 -o castings.parquet --format parquet
+"""
+
+import json
+import os
+import random
+import time
+from array import array
+
+from dayan_divination import DayanDivination
+from hexagram_relations import CODE_TO_NUMBER, STATE_CHANGED, STATE_MOVING, STATE_ORIGINAL
+
+
+COLUMNS = (
+    ("line_state", "uint16"),
+    ("original", "uint8"),
+    ("changed", "uint8"),
+    ("moving_mask", "uint8"),
+    ("seed", "uint64"),
+)
+DEFAULT_CHUNK_SIZE = 65536
+META_FILE = "meta.json"
+
+
+def _numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("导出起卦数据需要 numpy: pip install numpy") from None
+    return np
+
+
+def sample_states(start_seed, count):
+    """
+    以种子 start_seed, start_seed+1, ... 逐次起卦
+
+    Returns:
+        array: 'H' 类型的爻象编号数组
+    """
+    rng = random.Random()
+    divination = DayanDivination(verbose=False, rng=rng)
+    calculate_line = divination._calculate_line
+    states = array("H", bytes(2 * count))
+    for i in range(count):
+        rng.seed(start_seed + i)
+        state = 0
+        for shift in (0, 2, 4, 6, 8, 10):
+            state |= (calculate_line()[0] - 6) << shift
+        states[i] = state
+    return states
+
+
+def _sample_chunk(task):
+    return sample_states(*task)
+
+
+def iter_castings(count, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, processes=1):
+    """
+    分块生成起卦数据
+
+    Args:
+        count: 总行数
+        seed: 第一行的种子（非负整数）
+        chunk_size: 每块行数
+        processes: 采样进程数，1 表示在当前进程中采样
+
+    Yields:
+        dict: {列名: numpy 数组}，各列等长
+    """
+    np = _numpy()
+    if seed < 0:
+        raise ValueError("seed 必须为非负整数")
+    number = np.frombuffer(CODE_TO_NUMBER, dtype=np.uint8)
+    original = number[np.frombuffer(STATE_ORIGINAL, dtype=np.uint8)]
+    changed = number[np.frombuffer(STATE_CHANGED, dtype=np.uint8)]
+    moving = np.frombuffer(STATE_MOVING, dtype=np.uint8)
+
+    tasks = [(seed + offset, min(chunk_size, count - offset)) for offset in range(0, count, chunk_size)]
+    pool = None
+    if processes > 1 and len(tasks) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap(_sample_chunk, tasks)
+    else:
+        results = map(_sample_chunk, tasks)
+    try:
+        for (start, n), states in zip(tasks, results):
+            state = np.frombuffer(states, dtype=np.uint16)
+            yield {
+                "line_state": state,
+                "original": original[state],
+                "changed": changed[state],
+                "moving_mask": moving[state],
+                "seed": np.arange(start, start + n, dtype=np.uint64),
+            }
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def export_npy(directory, count, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, processes=1, progress=None):
+    """
+    导出为每列一个 .npy 文件
+
+    先写入含最终行数的文件头，再逐块追加数据；全部完成后才将临时文件改名，
+    因此中断时不会留下不完整的 .npy 文件。
+
+    Args:
+        directory: 输出目录
+        count: 总行数
+        seed: 第一行的种子
+        chunk_size: 每块行数
+        processes: 采样进程数
+        progress: 可选回调 (已写出行数)
+
+    Returns:
+        dict: {'rows', 'seconds', 'write_seconds'}
+    """
+    np = _numpy()
+    os.makedirs(directory, exist_ok=True)
+    paths = {name: os.path.join(directory, f"{name}.npy") for name, _ in COLUMNS}
+    files = {}
+    start = time.perf_counter()
+    write_seconds = 0.0
+    rows = 0
+    try:
+        for name, dtype in COLUMNS:
+            f = files[name] = open(paths[name] + ".tmp", "wb")
+            np.lib.format.write_array_header_1_0(f, {
+                "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                "fortran_order": False,
+                "shape": (count,),
+            })
+        for chunk in iter_castings(count, seed, chunk_size, processes):
+            written = time.perf_counter()
+            for name, _ in COLUMNS:
+                chunk[name].tofile(files[name])
+            write_seconds += time.perf_counter() - written
+            rows += len(chunk["seed"])
+            if progress is not None:
+                progress(rows)
+    finally:
+        for f in files.values():
+            f.close()
+        if rows != count:
+            for path in paths.values():
+                if os.path.exists(path + ".tmp"):
+                    os.remove(path + ".tmp")
+
+    for path in paths.values():
+        os.replace(path + ".tmp", path)
+    with open(os.path.join(directory, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"rows": count, "seed": seed, "columns": dict(COLUMNS)}, f, indent=2)
+    return {"rows": rows, "seconds": time.perf_counter() - start, "write_seconds": write_seconds}
+
+
+def export_parquet(path, count, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, processes=1, progress=None):
+    """
+    导出为 Parquet 文件（需要 pyarrow），每块一个 row group
+
+    参数与返回值同 export_npy()
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet 导出需要 pyarrow: pip install pyarrow") from None
+
+    schema = pa.schema([(name, getattr(pa, dtype)()) for name, dtype in COLUMNS])
+    schema = schema.with_metadata({"seed": str(seed)})
+    start = time.perf_counter()
+    write_seconds = 0.0
+    rows = 0
+    tmp_path = path + ".tmp"
+    try:
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for chunk in iter_castings(count, seed, chunk_size, processes):
+                written = time.perf_counter()
+                writer.write_table(pa.table({name: chunk[name] for name, _ in COLUMNS}, schema=schema))
+                write_seconds += time.perf_counter() - written
+                rows += len(chunk["seed"])
+                if progress is not None:
+                    progress(rows)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return {"rows": rows, "seconds": time.perf_counter() - start, "write_seconds": write_seconds}
+
+
+def load_npy(directory):
+    """
+    以内存映射方式打开 export_npy() 的输出
+
+    Returns:
+        dict: {列名: 只读 numpy.memmap}
+    """
+    np = _numpy()
+    return {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name, _ in COLUMNS}
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="批量起卦并导出列式数据集")
+    parser.add_argument("-n", "--count", type=int, required=True, help="起卦次数")
+    parser.add_argument("-o", "--output", required=True, help="输出目录 (npy) 或文件 (parquet)")
+    parser.add_argument("--format", choices=("npy", "parquet"), default="npy", help="输出格式 (默认: npy)")
+    parser.add_argument("--seed", type=int, default=0, help="第一行的种子 (默认: 0)")
+    parser.add_argument("-j", "--processes", type=int, default=1, help="采样进程数 (默认: 1)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"每块行数 (默认: {DEFAULT_CHUNK_SIZE})")
+    args = parser.parse_args()
+
+    def progress(rows):
+        print(f"\r已导出 {rows}/{args.count}", end="", file=sys.stderr, flush=True)
+
+    export = export_npy if args.format == "npy" else export_parquet
+    result = export(args.output, args.count, seed=args.seed, chunk_size=args.chunk_size,
+                    processes=args.processes, progress=progress)
+    print(file=sys.stderr)
+    seconds = result["seconds"]
+    print(f"完成 {result['rows']} 行，耗时 {seconds:.1f} 秒 ({result['rows'] / seconds:,.0f} 行/秒)，"
+          f"其中写出 {result['write_seconds']:.2f} 秒", file=sys.stderr)
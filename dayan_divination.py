@@ -12,19 +12,102 @@ import time
 import sys
 
 
+# 六爻各取 6/7/8/9 四种爻值，共 4^6 = 4096 种爻象
+LINE_STATE_COUNT = 4096
+
+
+def line_state_to_index(lines):
+    """
+    将六爻爻值编码为 0-4095 的整数（初爻占最低两位）
+
+    Args:
+        lines: 六爻爻值列表，如 [7, 8, 9, 6, 7, 7]
+
+    Returns:
+        int: 爻象编号
+    """
+    index = 0
+    for i, val in enumerate(lines):
+        index |= (val - 6) << (2 * i)
+    return index
+
+
+def index_to_line_state(index):
+    """
+    将爻象编号还原为六爻爻值列表
+
+    Args:
+        index: 0-4095 的爻象编号
+
+    Returns:
+        list: 六爻爻值列表（初爻在前）
+    """
+    return [((index >> (2 * i)) & 3) + 6 for i in range(6)]
+
+
+def hexagram_result(lines):
+    """
+    根据六爻爻值计算卦象结果，格式同 DayanDivination.get_hexagram_result()
+
+    Args:
+        lines: 六爻爻值列表（初爻在前）
+
+    Returns:
+        dict: 卦象结果字典
+    """
+    # 计算本卦和之卦的二进制表示
+    # 特别注意：BINARY_TO_NUMBER 表中是以 654321 (从上往下) 的顺序存储的
+    original_binary = ""
+    changed_binary = ""
+    changing_lines = []
+    
+    # 1. 记录变爻位置（基于 1-6 顺序）
+    for idx, val in enumerate(lines):
+        if val == 6 or val == 9:
+            changing_lines.append(idx + 1)
+    
+    # 2. 构建二进制字符串（必须倒序，从第六爻到第一爻）
+    for val in reversed(lines):
+        # 本卦：7,9为阳(1)，6,8为阴(0)
+        if val in [7, 9]:
+            original_binary += "1"
+        else:
+            original_binary += "0"
+        
+        # 之卦：老阴(6)变阳，老阳(9)变阴
+        if val == 6:  # 老阴变阳
+            changed_binary += "1"
+        elif val == 9:  # 老阳变阴
+            changed_binary += "0"
+        elif val == 7:  # 少阳不变
+            changed_binary += "1"
+        else:  # val == 8, 少阴不变
+            changed_binary += "0"
+    
+    return {
+        'original_lines': list(lines),
+        'original_binary': original_binary,
+        'changed_binary': changed_binary,
+        'changing_lines': changing_lines,
+        'has_change': len(changing_lines) > 0
+    }
+
+
 class DayanDivination:
     """大衍筮法模拟器"""
     
-    def __init__(self, verbose=True):
+    def __init__(self, verbose=True, rng=None):
         """
         初始化大衍筮法模拟器
         
         Args:
             verbose: 是否显示详细过程，默认True
+            rng: 可选的 random.Random 实例，用于可复现的起卦；默认使用全局随机数
         """
         self.lines = []  # 存储六爻结果
         self.total_stalks = 50
         self.verbose = verbose
+        self.rng = rng if rng is not None else random
 
     def type_print(self, text, speed=0.01):
         """打字机效果，模拟叙述感"""
@@ -47,7 +130,7 @@ class DayanDivination:
         """
         half = total / 2
         # 模拟人手误差，大部分时候在中间，偶尔偏多偏少
-        left = int(random.gauss(half, 2.0))
+        left = int(self.rng.gauss(half, 2.0))
         
         # 边界修正：任何一堆至少要有1根
         if left < 1: left = 1
@@ -145,7 +228,8 @@ class DayanDivination:
             })
             
         self.lines = final_lines
-        hex_result = self.get_hexagram_result()
+        # 直接由局部结果计算，多线程共用同一实例时互不干扰
+        hex_result = hexagram_result(final_lines)
         
         return {
             "hex_result": hex_result,
@@ -159,66 +243,9 @@ class DayanDivination:
         if not self.verbose:
             return
 
-        print("\n" + "="*60)
-        print("          大 衍 筮 法 · 全 过 程 模 拟")
-        print("="*60)
-        self.type_print("大衍之数五十，其用四十有九。")
-        self.type_print("分而为二以象两，挂一以象三，")
-        self.type_print("揲之以四以象四时，归奇于扐以象润。")
-        print("="*60)
-        self.wait(1)
-
-        pos_names = ["初", "二", "三", "四", "五", "上"]
-        process_log = simulation_data["process_log"]
-
-        for line_step in process_log:
-            line_idx = line_step["line_idx"]
-            val = line_step["value"]
-            changes = line_step["changes"]
-            
-            print("\n" + "#" * 60)
-            print(f"###  正在演算：{pos_names[line_idx-1]}爻  ###")
-            print("#" * 60)
-            
-            current_total = 49 # 每次都从49开始描述吗？不对，是每一爻开始都是49
-            
-            for change_idx, change in enumerate(changes, 1):
-                print(f"    < 第 {line_idx} 爻 - 第 {change_idx} 变 >")
-                
-                # 回放：分二
-                print(f"      [分二]  左手: {change['left']}  |  右手: {change['right']}  (总: {current_total})")
-                self.wait(0.3)
-                
-                # 回放：挂一
-                print(f"      [挂一]  取右一策，挂于左手小指")
-                
-                # 回放：揲四 (这里需要模拟视觉效果)
-                self._display_physical_count("左", change['left'])
-                
-                # 右手实际上是减了1之后再去揲四的
-                self._display_physical_count("右", change['right'] - 1)
-                
-                # 回放：归奇
-                print(f"      [归奇]  挂1 + 左余{change['left_rem']} + 右余{change['right_rem']} = 去掉 {change['removed']} 策")
-                print(f"      [结余]  当前剩余: {change['new_total']} 策")
-                print("-" * 60)
-                self.wait(0.5)
-                
-                current_total = change['new_total']
-
-            # 显示该爻结果
-            result_text = ""
-            if val == 6: result_text = "老阴 (六) -> 变"
-            elif val == 7: result_text = "少阳 (七) -> 不变"
-            elif val == 8: result_text = "少阴 (八) -> 不变"
-            elif val == 9: result_text = "老阳 (九) -> 变"
-            
-            print(f"  >>> {pos_names[line_idx-1]}爻 结果判定: 剩 {current_total} 策 ÷ 4 = {val}")
-            print(f"  >>> 获得: {result_text}")
-            self.wait(1.5)
-
-        # 显示最终卦象
-        self.display_hexagram()
+        from hexagram_renderer import play_frames, render_process_frames
+        play_frames(render_process_frames(simulation_data))
+        self.analyze_summary()
 
     def run(self):
         """
@@ -244,82 +271,17 @@ class DayanDivination:
                 'has_change': True                 # 是否有变爻
             }
         """
-        # 计算本卦和之卦的二进制表示
-        # 特别注意：BINARY_TO_NUMBER 表中是以 654321 (从上往下) 的顺序存储的
-        original_binary = ""
-        changed_binary = ""
-        changing_lines = []
-        
-        # 1. 记录变爻位置（基于 1-6 顺序）
-        for idx, val in enumerate(self.lines):
-            if val == 6 or val == 9:
-                changing_lines.append(idx + 1)
-        
-        # 2. 构建二进制字符串（必须倒序，从第六爻到第一爻）
-        for val in reversed(self.lines):
-            # 本卦：7,9为阳(1)，6,8为阴(0)
-            if val in [7, 9]:
-                original_binary += "1"
-            else:
-                original_binary += "0"
-            
-            # 之卦：老阴(6)变阳，老阳(9)变阴
-            if val == 6:  # 老阴变阳
-                changed_binary += "1"
-            elif val == 9:  # 老阳变阴
-                changed_binary += "0"
-            elif val == 7:  # 少阳不变
-                changed_binary += "1"
-            else:  # val == 8, 少阴不变
-                changed_binary += "0"
-        
-        return {
-            'original_lines': self.lines.copy(),
-            'original_binary': original_binary,
-            'changed_binary': changed_binary,
-            'changing_lines': changing_lines,
-            'has_change': len(changing_lines) > 0
-        }
+        return hexagram_result(self.lines)
 
     def display_hexagram(self):
         """
         显示最终的本卦与之卦
         """
-        print("\n\n")
-        print("="*60)
-        print(f"{'【 本 卦 】':^28}")
-        print("="*60)
-        
-        pos_names = ["初", "二", "三", "四", "五", "上"]
-        
-        # 倒序遍历，因为画卦是从上往下画
-        for i in range(5, -1, -1):
-            num = self.lines[i]
-            p_name = pos_names[i]
-            
-            # 定义符号（短横，便于紧凑显示）
-            yin = "— —"
-            yang = "———"
-            
-            # 构建本卦的图形（仅显示本卦，去掉之卦）
-            if num == 6:  # 老阴 -> 变阳（显示为老阴的本卦形态）
-                left = f"{yin} x"
-                name = "老阴"
-            elif num == 7:  # 少阳 -> 不变
-                left = f"{yang}  "
-                name = "少阳"
-            elif num == 8:  # 少阴 -> 不变
-                left = f"{yin}  "
-                name = "少阴"
-            elif num == 9:  # 老阳 -> 变阴
-                left = f"{yang} o"
-                name = "老阳"
-                
-            # 格式化输出（仅本卦），对齐本卦图像并缩短横杠
-            label = f"{p_name}{'九' if num%2!=0 else '六'}:"
-            print(f"{label:<4} {left:<9} ({name})")
-            
-        print("="*60)
+        from hexagram_renderer import render_hexagram
+
+        # 图形取自预计算表，一次写出
+        sys.stdout.write(render_hexagram(self.lines))
+        sys.stdout.flush()
         self.analyze_summary()
         
     def analyze_summary(self):
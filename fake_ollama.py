@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+本地模型替身
+Fake Ollama Server
+
+模拟 Ollama 的 /api/tags 与 /api/generate 接口（含 NDJSON 流式输出与 done 统计字段），
+按可配置的首 token 延迟与生成速度返回固定格式的解卦文本，
+用于在没有真实模型的情况下压测服务端、回放流量与跑基准。
+可模拟模型加载：未驻留时首个请求额外等待 load_time，请求后按 keep_alive 驻留（默认 5 分钟）；
+空 prompt 的请求只加载模型，keep_alive 为 0 时卸载。
+"""
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ollama_client import keep_alive_seconds
+
+
+DEFAULT_RESPONSE = (
+    "一、结论\n"
+    "此事可成，但需循序渐进，不可急于求成。\n\n"
+    "二、原因\n"
+    "依据卦辞中“元亨利贞”的描述，说明事情的开端顺利、前景亨通，"
+    "而爻辞提醒时机尚未完全成熟，应当韬光养晦、积蓄力量，待时而动，方能水到渠成。"
+)
+
+
+# 多问题 prompt 中的问题编号行（见 PromptTemplates.build_multi_question_prompt）
+_QUESTION_LINE = re.compile(r"^问题\d+[：:]", re.MULTILINE)
+
+
+def split_tokens(text, size=2):
+    """将文本按固定字数切分为模拟 token"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeOllamaConfig:
+    """替身行为配置"""
+
+    def __init__(self, models=("FortuneQwen3_q8:4b",), response_text=DEFAULT_RESPONSE,
+                 ttft=0.2, tokens_per_second=50.0, load_time=0.0, keep_alive=300.0, script=None):
+        """
+        Args:
+            models: /api/tags 返回的模型列表
+            response_text: 生成的文本
+            ttft: 首 token 延迟（秒），模拟 prompt 评估
+            tokens_per_second: 生成速度
+            load_time: 模型未驻留时的加载耗时（秒）
+            keep_alive: 请求未指定 keep_alive 时的驻留时长（秒）
+            script: 可选回调 (请求 payload) -> [(token, 等待秒数), ...]，
+                    用于按录制的节奏回放；返回 None 时按上述参数生成
+        """
+        self.models = list(models)
+        self.response_text = response_text
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.load_time = load_time
+        self.keep_alive = keep_alive
+        self.script = script
+        self._loaded_until = 0.0
+        self._load_lock = threading.Lock()
+
+    def acquire_model(self):
+        """
+        确保模型已加载（并发请求共用同一次加载）
+
+        Returns:
+            float: 本次请求等待加载的秒数
+        """
+        if not self.load_time:
+            return 0.0
+        start = time.monotonic()
+        with self._load_lock:
+            if time.monotonic() >= self._loaded_until:
+                time.sleep(self.load_time)
+                self._loaded_until = float("inf")   # 请求结束时再按 keep_alive 计时
+        return time.monotonic() - start
+
+    def release_model(self, payload):
+        """请求结束后按 keep_alive 设置驻留截止时间"""
+        keep_alive = keep_alive_seconds(payload.get("keep_alive"))
+        if keep_alive is None:
+            keep_alive = self.keep_alive
+        with self._load_lock:
+            self._loaded_until = time.monotonic() + keep_alive
+
+    def plan(self, payload):
+        """
+        生成本次请求的 token 计划
+
+        Returns:
+            list: [(token, 等待秒数), ...]
+        """
+        if self.script is not None:
+            plan = self.script(payload)
+            if plan is not None:
+                return plan
+        text = self.response_text
+        count = len(_QUESTION_LINE.findall(payload.get("prompt", "")))
+        if count > 1:
+            # 多问题 prompt：按“【问题N】”格式逐一作答
+            text = "\n\n".join(f"【问题{i}】\n{self.response_text}" for i in range(1, count + 1))
+        tokens = split_tokens(text)
+        num_predict = (payload.get("options") or {}).get("num_predict")
+        if num_predict:
+            tokens = tokens[:num_predict]
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+        return [(tok, self.ttft if i == 0 else interval) for i, tok in enumerate(tokens)]
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """替身请求处理器"""
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            # 客户端进程退出时关闭了空闲的持久连接
+            pass
+
+    def _send_json(self, obj, status=200):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": name} for name in self.config.models]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != "/api/generate":
+            self._send_json({"error": "not found"}, status=404)
+            return
+
+        start = time.perf_counter()
+        load_seconds = self.config.acquire_model()
+        try:
+            self._generate(payload, start, load_seconds)
+        finally:
+            self.config.release_model(payload)
+
+    def _generate(self, payload, start, load_seconds):
+        if not payload.get("prompt") and not payload.get("system"):
+            # 空 prompt：仅加载（或卸载）模型
+            self._send_json({"model": payload.get("model"), "response": "", "done": True,
+                             "done_reason": "unload" if payload.get("keep_alive") == 0 else "load",
+                             "total_duration": int((time.perf_counter() - start) * 1e9),
+                             "load_duration": int(load_seconds * 1e9)})
+            return
+
+        plan = self.config.plan(payload)
+        prompt_chars = len(payload.get("prompt", "")) + len(payload.get("system", ""))
+        first_token_at = None
+
+        if payload.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for token, wait in plan:
+                    time.sleep(wait)
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    self._write_chunk({"model": payload.get("model"), "response": token, "done": False})
+                self._write_chunk(self._done_chunk(payload, plan, start, first_token_at, prompt_chars,
+                                                   load_seconds))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端提前断开：停止生成
+                self.close_connection = True
+        else:
+            for _, wait in plan:
+                time.sleep(wait)
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+            result = self._done_chunk(payload, plan, start, first_token_at, prompt_chars, load_seconds)
+            result["response"] = "".join(token for token, _ in plan)
+            self._send_json(result)
+
+    def _write_chunk(self, obj):
+        data = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def _done_chunk(payload, plan, start, first_token_at, prompt_chars, load_seconds=0.0):
+        """构造带统计字段的 done 数据块（时长单位为纳秒）"""
+        end = time.perf_counter()
+        first_token_at = first_token_at or end
+        return {
+            "model": payload.get("model"),
+            "response": "",
+            "done": True,
+            "total_duration": int((end - start) * 1e9),
+            "load_duration": int(load_seconds * 1e9),
+            "prompt_eval_count": prompt_chars,
+            "prompt_eval_duration": int((first_token_at - start - load_seconds) * 1e9),
+            "eval_count": len(plan),
+            "eval_duration": int((end - first_token_at) * 1e9),
+        }
+
+
+def start_fake_ollama(port=0, host="127.0.0.1", config=None):
+    """
+    在后台线程中启动替身服务
+
+    Args:
+        port: 监听端口，0 表示自动分配
+        host: 监听地址
+        config: FakeOllamaConfig，None 时使用默认配置
+
+    Returns:
+        ThreadingHTTPServer: 服务器对象，server.server_address[1] 为实际端口
+    """
+    server = ThreadingHTTPServer((host, port), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.config = config or FakeOllamaConfig()
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地 Ollama 替身服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=11434, help="监听端口 (默认: 11434)")
+    parser.add_argument("--ttft", type=float, default=0.2, help="首 token 延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="生成速度")
+    parser.add_argument("--load-time", type=float, default=0.0, help="模型未驻留时的加载耗时（秒）")
+    parser.add_argument("--keep-alive", type=float, default=300.0, help="默认驻留时长（秒）")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.config = FakeOllamaConfig(ttft=args.ttft, tokens_per_second=args.tokens_per_second,
+                                     load_time=args.load_time, keep_alive=args.keep_alive)
+    print(f"Ollama 替身已启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
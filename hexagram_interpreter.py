@@ -6,8 +6,18 @@ Hexagram Interpreter
 负责根据二进制卦象查找对应的64卦信息，并提取相关文本
 """
 
-import json
+import threading
 from pathlib import Path
+from types import MappingProxyType
+
+
+def _freeze(value):
+    """递归转换为只读结构（dict -> MappingProxyType，list -> tuple）"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
 
 
 class HexagramInterpreter:
@@ -81,6 +91,10 @@ class HexagramInterpreter:
         "101010": 64, # 火水未济
     }
     
+    # 进程内共享的只读实例：数据文件路径 -> HexagramInterpreter
+    _shared_instances = {}
+    _shared_lock = threading.Lock()
+    
     def __init__(self, data_path="hexagrams_data.json"):
         """
         初始化卦象解释器
@@ -88,16 +102,45 @@ class HexagramInterpreter:
         Args:
             data_path: 卦象数据JSON文件路径
         """
-        # 如果是相对路径，则相对于当前脚本所在目录
-        if not Path(data_path).is_absolute():
-            script_dir = Path(__file__).parent
-            self.data_path = script_dir / data_path
-        else:
-            self.data_path = Path(data_path)
+        self.data_path = self._resolve_path(data_path)
         self.hexagrams_data = self._load_data()
     
+    @staticmethod
+    def _resolve_path(data_path):
+        """如果是相对路径，则相对于当前脚本所在目录"""
+        if not Path(data_path).is_absolute():
+            return Path(__file__).parent / data_path
+        return Path(data_path)
+    
+    @classmethod
+    def shared(cls, data_path="hexagrams_data.json"):
+        """
+        获取进程内共享的只读实例
+        
+        同一数据文件只解析一次，数据被冻结为只读结构；
+        在父进程中预加载后 fork 的子进程可直接共享这些内存页。
+        
+        Args:
+            data_path: 卦象数据JSON文件路径
+            
+        Returns:
+            HexagramInterpreter: 共享实例
+        """
+        key = str(cls._resolve_path(data_path))
+        instance = cls._shared_instances.get(key)
+        if instance is None:
+            with cls._shared_lock:
+                instance = cls._shared_instances.get(key)
+                if instance is None:
+                    instance = cls(data_path)
+                    instance.hexagrams_data = _freeze(instance.hexagrams_data)
+                    cls._shared_instances[key] = instance
+        return instance
+    
     def _load_data(self):
         """加载卦象数据"""
+        import json
+
         try:
             with open(self.data_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -149,6 +192,96 @@ class HexagramInterpreter:
             return None
         return self.get_hexagram_by_number(number)
     
+    def number_by_name(self, name):
+        """
+        根据卦名获取卦序号
+        
+        Args:
+            name: 卦名，如 "乾"
+            
+        Returns:
+            int: 卦序号 (1-64)，未找到返回None
+        """
+        for number, hexagram_data in self.hexagrams_data.items():
+            if hexagram_data.get('name_cn') == name:
+                return int(number)
+        return None
+    
+    def _related(self, number, relation):
+        """经卦码查询一元关系，返回卦序号"""
+        import hexagram_relations as rel
+
+        if not 1 <= number <= rel.HEXAGRAM_COUNT:
+            return None
+        return rel.CODE_TO_NUMBER[rel.RELATIONS[relation][rel.NUMBER_TO_CODE[number]]]
+
+    def inverse_hexagram(self, number):
+        """错卦 (六爻阴阳全变) 的卦序号"""
+        return self._related(number, "inverse")
+
+    def reversed_hexagram(self, number):
+        """综卦 (上下颠倒) 的卦序号"""
+        return self._related(number, "reverse")
+
+    def nuclear_hexagram(self, number):
+        """互卦 (二三四爻为下卦、三四五爻为上卦) 的卦序号"""
+        return self._related(number, "nuclear")
+
+    def trigrams(self, number):
+        """
+        上下卦
+        
+        Args:
+            number: 卦序号 (1-64)
+            
+        Returns:
+            tuple: (上卦名, 下卦名)，如 ("坎", "震")，未找到返回None
+        """
+        import hexagram_relations as rel
+
+        if not 1 <= number <= rel.HEXAGRAM_COUNT:
+            return None
+        code = rel.NUMBER_TO_CODE[number]
+        return rel.TRIGRAM_NAMES[rel.UPPER[code]], rel.TRIGRAM_NAMES[rel.LOWER[code]]
+
+    def transitions(self, number, moving_count):
+        """
+        k 爻动时可变出的全部卦
+        
+        Args:
+            number: 卦序号 (1-64)
+            moving_count: 变爻数 (0-6)
+            
+        Returns:
+            list: 卦序号列表 (按变爻掩码从小到大)
+            
+        Raises:
+            ValueError: 变爻数不在 0-6 之间
+        """
+        import hexagram_relations as rel
+
+        if not 0 <= moving_count <= 6:
+            raise ValueError(f"变爻数必须在 0-6 之间: {moving_count}")
+        if not 1 <= number <= rel.HEXAGRAM_COUNT:
+            return []
+        return [rel.CODE_TO_NUMBER[code]
+                for code in rel.transitions(rel.NUMBER_TO_CODE[number], moving_count)]
+
+    def search(self, query, **kwargs):
+        """
+        全文检索卦辞、彖传、象传、爻辞与小象
+        
+        Args:
+            query: 查询串，如 "利见大人" 或 "无咎 君子"
+            **kwargs: 同 HexagramSearchIndex.search()
+            
+        Returns:
+            list: 检索结果 (卦序、爻位、字段与高亮片段)
+        """
+        from hexagram_search import get_index
+
+        return get_index(self.data_path).search(query, **kwargs)
+
     def format_hexagram_text(self, hexagram_data, include_lines=None):
         """
         格式化卦象文本用于prompt
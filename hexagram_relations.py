@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+卦象关系索引
+Hexagram Relations
+
+以 6 位整数编码卦象：第 i 位 (0-5) 表示第 i+1 爻，阳爻为 1。
+即 HexagramInterpreter.BINARY_TO_NUMBER 中的二进制串（从上往下）按二进制解析所得的整数。
+
+- 下卦 = code & 7，上卦 = code >> 3（卦码同样以初爻为最低位）
+- 错卦 = code ^ 63
+- 综卦 = 6 位倒序
+- 互卦 = 二三四爻为下卦、三四五爻为上卦
+
+所有一元关系预先计算为以卦码为下标的 bytes 表，变卦按变爻数预先计算，
+查询均为 O(1) 的下标访问；bulk() 在安装了 numpy 时提供向量化的批量查询。
+"""
+
+from dayan_divination import LINE_STATE_COUNT, index_to_line_state
+from hexagram_interpreter import HexagramInterpreter
+
+
+HEXAGRAM_COUNT = 64
+
+# 八卦卦码（初爻为最低位）
+TRIGRAM_CODES = {
+    "乾": 0b111, "兑": 0b011, "离": 0b101, "震": 0b001,
+    "巽": 0b110, "坎": 0b010, "艮": 0b100, "坤": 0b000,
+}
+TRIGRAM_NAMES = tuple(sorted(TRIGRAM_CODES, key=TRIGRAM_CODES.get))
+
+
+def _reverse_bits(code):
+    result = 0
+    for i in range(6):
+        if code >> i & 1:
+            result |= 1 << (5 - i)
+    return result
+
+
+def _nuclear(code):
+    return ((code >> 2) & 7) << 3 | ((code >> 1) & 7)
+
+
+# 卦码 <-> 卦序（NUMBER_TO_CODE[0] 不使用）
+CODE_TO_NUMBER = bytes(
+    HexagramInterpreter.BINARY_TO_NUMBER[format(code, "06b")] for code in range(HEXAGRAM_COUNT)
+)
+NUMBER_TO_CODE = bytes([0]) + bytes(
+    CODE_TO_NUMBER.index(number) for number in range(1, HEXAGRAM_COUNT + 1)
+)
+
+# 一元关系（以卦码为下标）
+INVERSE = bytes(code ^ 63 for code in range(HEXAGRAM_COUNT))          # 错卦
+REVERSE = bytes(_reverse_bits(code) for code in range(HEXAGRAM_COUNT))  # 综卦
+NUCLEAR = bytes(_nuclear(code) for code in range(HEXAGRAM_COUNT))       # 互卦
+LOWER = bytes(code & 7 for code in range(HEXAGRAM_COUNT))               # 下卦
+UPPER = bytes(code >> 3 for code in range(HEXAGRAM_COUNT))              # 上卦
+POPCOUNT = bytes(bin(code).count("1") for code in range(HEXAGRAM_COUNT))
+
+# 变爻掩码按变爻数分组；TRANSITIONS[k][code] 为 k 爻动时可变出的全部卦码
+MASKS_BY_COUNT = tuple(
+    tuple(mask for mask in range(HEXAGRAM_COUNT) if POPCOUNT[mask] == k) for k in range(7)
+)
+TRANSITIONS = tuple(
+    tuple(bytes(code ^ mask for mask in masks) for code in range(HEXAGRAM_COUNT))
+    for masks in MASKS_BY_COUNT
+)
+
+
+def _state_tables():
+    """由爻象编号 (0-4095) 得到本卦、之卦卦码与变爻掩码"""
+    original, changed, moving = bytearray(LINE_STATE_COUNT), bytearray(LINE_STATE_COUNT), bytearray(LINE_STATE_COUNT)
+    for state in range(LINE_STATE_COUNT):
+        for i, val in enumerate(index_to_line_state(state)):
+            if val in (7, 9):
+                original[state] |= 1 << i
+            if val in (6, 9):
+                moving[state] |= 1 << i
+        changed[state] = original[state] ^ moving[state]
+    return bytes(original), bytes(changed), bytes(moving)
+
+
+# 爻象关系（以爻象编号为下标）
+STATE_ORIGINAL, STATE_CHANGED, STATE_MOVING = _state_tables()
+
+RELATIONS = {
+    "number": CODE_TO_NUMBER,
+    "inverse": INVERSE,
+    "reverse": REVERSE,
+    "nuclear": NUCLEAR,
+    "lower": LOWER,
+    "upper": UPPER,
+    "popcount": POPCOUNT,
+    "state_original": STATE_ORIGINAL,
+    "state_changed": STATE_CHANGED,
+    "state_moving": STATE_MOVING,
+}
+
+
+def code_from_binary(binary_str):
+    """二进制串（从上往下）-> 卦码"""
+    return int(binary_str, 2)
+
+
+def binary_from_code(code):
+    """卦码 -> 二进制串（从上往下）"""
+    return format(code, "06b")
+
+
+def transitions(code, moving_count):
+    """
+    k 爻动时可变出的全部卦码
+
+    Args:
+        code: 卦码
+        moving_count: 变爻数 (0-6)
+
+    Returns:
+        bytes: 卦码序列，共 C(6, k) 个
+
+    Raises:
+        ValueError: 变爻数不在 0-6 之间
+    """
+    if not 0 <= moving_count <= 6:
+        raise ValueError(f"变爻数必须在 0-6 之间: {moving_count}")
+    return TRANSITIONS[moving_count][code]
+
+
+def moving_lines(from_code, to_code):
+    """本卦变为之卦所需的变爻掩码与变爻数"""
+    mask = from_code ^ to_code
+    return mask, POPCOUNT[mask]
+
+
+def relations(code):
+    """
+    卦码的全部一元关系
+
+    Returns:
+        dict: 各关系的卦码及上下卦名
+    """
+    return {
+        'code': code,
+        'number': CODE_TO_NUMBER[code],
+        'inverse': INVERSE[code],
+        'reverse': REVERSE[code],
+        'nuclear': NUCLEAR[code],
+        'lower': TRIGRAM_NAMES[LOWER[code]],
+        'upper': TRIGRAM_NAMES[UPPER[code]],
+    }
+
+
+def bulk(relation, codes):
+    """
+    批量查询关系（用于统计分析）
+
+    安装了 numpy 时返回 uint8 数组（以 fancy indexing 向量化完成），
+    否则返回列表。
+
+    Args:
+        relation: RELATIONS 中的关系名
+        codes: 卦码（或 state_* 关系的爻象编号）序列 / numpy 数组
+
+    Returns:
+        numpy.ndarray 或 list
+    """
+    table = RELATIONS[relation]
+    try:
+        import numpy as np
+    except ImportError:
+        return [table[c] for c in codes]
+    return np.frombuffer(table, dtype=np.uint8)[np.asarray(codes, dtype=np.intp)]
+
+
+def bulk_transitions(codes, moving_count):
+    """
+    批量查询 k 爻动时的全部变卦
+
+    Returns:
+        numpy.ndarray: 形状 (len(codes), C(6, k)) 的 uint8 数组；未安装 numpy 时为列表的列表
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return [list(TRANSITIONS[moving_count][c]) for c in codes]
+    masks = np.array(MASKS_BY_COUNT[moving_count], dtype=np.uint8)
+    return np.bitwise_xor(np.asarray(codes, dtype=np.uint8)[:, None], masks[None, :])
+
+
+if __name__ == "__main__":
+    import time
+
+    interpreter = HexagramInterpreter.shared()
+
+    def name(code):
+        return interpreter.get_hexagram_by_number(CODE_TO_NUMBER[code])['name_cn']
+
+    for number in (1, 3, 63):
+        code = NUMBER_TO_CODE[number]
+        r = relations(code)
+        print(f"{name(code)}卦 (第{number}卦): 上{r['upper']}下{r['lower']}，"
+              f"错{name(r['inverse'])}，综{name(r['reverse'])}，互{name(r['nuclear'])}")
+        print(f"  一爻动可变为: {'、'.join(name(c) for c in transitions(code, 1))}")
+
+    start = time.perf_counter()
+    for _ in range(100000):
+        NUCLEAR[INVERSE[REVERSE[37]]]
+    print(f"\n单次查询: {(time.perf_counter() - start) * 1e9 / 300000:.0f} ns")
+
+    try:
+        import numpy as np
+    except ImportError:
+        pass
+    else:
+        states = np.random.randint(0, LINE_STATE_COUNT, size=1_000_000)
+        start = time.perf_counter()
+        original = bulk("state_original", states)
+        nuclear = bulk("nuclear", original)
+        print(f"批量查询 100 万次爻象 -> 本卦 -> 互卦: {(time.perf_counter() - start) * 1000:.1f} ms")
+        top = np.bincount(nuclear, minlength=HEXAGRAM_COUNT).argsort()[::-1][:4]
+        print(f"最常见的互卦: {'、'.join(name(int(c)) for c in top)}")
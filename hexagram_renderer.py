@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+卦象渲染模块
+Hexagram Renderer
+
+将起卦过程与本卦图形渲染为文本缓冲区（或结构化帧），
+供命令行、服务端与批处理共用，无需捕获标准输出。
+"""
+
+import sys
+import time
+from collections import namedtuple
+
+from dayan_divination import LINE_STATE_COUNT, line_state_to_index, index_to_line_state
+
+
+# 一帧输出：text 为文本，delay 为输出后的停顿秒数，char_delay 为逐字输出的间隔（打字机效果）
+Frame = namedtuple("Frame", ["text", "delay", "char_delay"], defaults=(0.0, 0.0))
+
+POS_NAMES = ["初", "二", "三", "四", "五", "上"]
+
+# 爻值 -> (本卦图形, 名称)，符号使用短横，便于紧凑显示
+_LINE_SHAPES = {
+    6: ("— — x", "老阴"),  # 老阴 -> 变阳（显示为老阴的本卦形态）
+    7: ("———  ", "少阳"),  # 少阳 -> 不变
+    8: ("— —  ", "少阴"),  # 少阴 -> 不变
+    9: ("——— o", "老阳"),  # 老阳 -> 变阴
+}
+
+_LINE_RESULTS = {
+    6: "老阴 (六) -> 变",
+    7: "少阳 (七) -> 不变",
+    8: "少阴 (八) -> 不变",
+    9: "老阳 (九) -> 变",
+}
+
+# 4096 种爻象对应的本卦图形，首次使用时一次性计算
+_figure_table = None
+
+
+def _build_figure(lines):
+    """构建单个本卦图形文本"""
+    parts = ["\n\n\n", "=" * 60, "\n", f"{'【 本 卦 】':^28}", "\n", "=" * 60, "\n"]
+
+    # 倒序遍历，因为画卦是从上往下画
+    for i in range(5, -1, -1):
+        num = lines[i]
+        shape, name = _LINE_SHAPES[num]
+        label = f"{POS_NAMES[i]}{'九' if num % 2 != 0 else '六'}:"
+        parts.append(f"{label:<4} {shape:<9} ({name})\n")
+
+    parts.append("=" * 60)
+    parts.append("\n")
+    return "".join(parts)
+
+
+def _get_figure_table():
+    """获取（必要时构建）全部 4096 种本卦图形"""
+    global _figure_table
+    if _figure_table is None:
+        _figure_table = tuple(
+            _build_figure(index_to_line_state(idx)) for idx in range(LINE_STATE_COUNT)
+        )
+    return _figure_table
+
+
+def precompute_figures():
+    """预先构建全部本卦图形（可在 fork 前调用，子进程共享）"""
+    _get_figure_table()
+
+
+def render_hexagram(lines):
+    """
+    渲染本卦图形
+
+    Args:
+        lines: 六爻爻值列表（初爻在前），如 [7, 8, 9, 6, 7, 7]
+
+    Returns:
+        str: 本卦图形文本（取自预计算表）
+    """
+    return _get_figure_table()[line_state_to_index(lines)]
+
+
+def render_process_frames(simulation_data):
+    """
+    将 DayanDivination.simulate() 的结果渲染为结构化帧
+
+    Args:
+        simulation_data: simulate() 返回的字典
+
+    Returns:
+        list: Frame 列表，依次输出即得到完整的起卦过程
+    """
+    frames = [
+        Frame("\n" + "=" * 60 + "\n"
+              + "          大 衍 筮 法 · 全 过 程 模 拟\n"
+              + "=" * 60 + "\n"),
+        Frame("大衍之数五十，其用四十有九。\n", char_delay=0.01),
+        Frame("分而为二以象两，挂一以象三，\n", char_delay=0.01),
+        Frame("揲之以四以象四时，归奇于扐以象润。\n", char_delay=0.01),
+        Frame("=" * 60 + "\n", delay=1),
+    ]
+
+    for line_step in simulation_data["process_log"]:
+        line_idx = line_step["line_idx"]
+        val = line_step["value"]
+        pos_name = POS_NAMES[line_idx - 1]
+
+        frames.append(Frame("\n" + "#" * 60 + "\n"
+                            + f"###  正在演算：{pos_name}爻  ###\n"
+                            + "#" * 60 + "\n"))
+
+        # 每一爻都从49策开始
+        current_total = 49
+        for change_idx, change in enumerate(line_step["changes"], 1):
+            frames.append(Frame(
+                f"    < 第 {line_idx} 爻 - 第 {change_idx} 变 >\n"
+                f"      [分二]  左手: {change['left']}  |  右手: {change['right']}  (总: {current_total})\n",
+                delay=0.3,
+            ))
+            frames.append(Frame("      [挂一]  取右一策，挂于左手小指\n"))
+            # 右手实际上是减了1之后再去揲四的
+            frames.extend(_count_frames("左", change['left']))
+            frames.extend(_count_frames("右", change['right'] - 1))
+            frames.append(Frame(
+                f"      [归奇]  挂1 + 左余{change['left_rem']} + 右余{change['right_rem']} = 去掉 {change['removed']} 策\n"
+                f"      [结余]  当前剩余: {change['new_total']} 策\n"
+                + "-" * 60 + "\n",
+                delay=0.5,
+            ))
+            current_total = change['new_total']
+
+        frames.append(Frame(
+            f"  >>> {pos_name}爻 结果判定: 剩 {current_total} 策 ÷ 4 = {val}\n"
+            f"  >>> 获得: {_LINE_RESULTS.get(val, '')}\n",
+            delay=1.5,
+        ))
+
+    final_lines = [step["value"] for step in simulation_data["process_log"]]
+    frames.append(Frame(render_hexagram(final_lines)))
+    return frames
+
+
+def _count_frames(pile_name, count):
+    """揲四计数的帧：每一个点代表数走了4根"""
+    current = count
+    dots = 0
+    while current > 4:
+        current -= 4
+        dots += 1
+    remainder = 4 if current == 0 else current
+    return [
+        Frame(f"      [{pile_name}手] 揲四计数: "),
+        Frame("." * dots, char_delay=0.02),
+        Frame(f" 剩 {remainder} 策\n"),
+    ]
+
+
+def render_process(simulation_data):
+    """
+    将起卦过程渲染为完整文本
+
+    Returns:
+        str: 起卦过程与本卦图形的全部文本
+    """
+    return "".join(frame.text for frame in render_process_frames(simulation_data))
+
+
+def play_frames(frames, out=None, animate=True):
+    """
+    在终端回放帧
+
+    相邻的无停顿帧合并为一次写入；仅在需要停顿或逐字效果时才拆分输出。
+
+    Args:
+        frames: Frame 列表
+        out: 输出流，默认 sys.stdout
+        animate: 是否保留停顿与打字机效果，False 时整体一次写出
+    """
+    out = out or sys.stdout
+    if not animate:
+        out.write("".join(frame.text for frame in frames))
+        out.flush()
+        return
+
+    pending = []
+    for frame in frames:
+        if frame.char_delay:
+            if pending:
+                out.write("".join(pending))
+                pending = []
+            for char in frame.text:
+                out.write(char)
+                out.flush()
+                time.sleep(frame.char_delay)
+        else:
+            pending.append(frame.text)
+        if frame.delay:
+            if pending:
+                out.write("".join(pending))
+                pending = []
+            out.flush()
+            time.sleep(frame.delay)
+    if pending:
+        out.write("".join(pending))
+    out.flush()
+
+
+if __name__ == "__main__":
+    from dayan_divination import DayanDivination
+
+    data = DayanDivination(verbose=False).simulate()
+    print(render_process(data))
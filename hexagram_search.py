@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+卦象全文检索模块
+Hexagram Full-Text Search
+
+对 hexagrams_data.json 中的卦辞、彖传、象传及各爻爻辞、小象建立字符二元组 (bigram) 倒排索引，
+支持短语与多词查询，返回卦序、爻位、字段与高亮片段。
+
+索引在数据编译阶段生成（python hexagram_search.py build），与数据文件放在一起；
+首次查询时才加载，索引文件缺失或与数据不一致时在内存中重新构建。
+索引基于去除标点后的文本，因此“元亨利贞”同样能匹配“元，亨，利，贞”。
+"""
+
+import hashlib
+import json
+import threading
+import unicodedata
+from pathlib import Path
+
+
+INDEX_VERSION = 1
+DEFAULT_INDEX_PATH = "hexagrams_search_index.json"
+
+# 字段顺序即同分时的排序
+FIELDS = ("judgement", "judgement_detail", "image", "line_text", "line_image")
+FIELD_NAMES = {
+    "judgement": "卦辞",
+    "judgement_detail": "彖传",
+    "image": "象传",
+    "line_text": "爻辞",
+    "line_image": "小象",
+}
+
+
+def _normalize(text):
+    """
+    去除标点与空白
+
+    Returns:
+        tuple: (规范化文本, 各字符在原文中的偏移)
+    """
+    chars, offsets = [], []
+    for i, ch in enumerate(text):
+        if unicodedata.category(ch)[0] in "PZSC":
+            continue
+        chars.append(ch)
+        offsets.append(i)
+    return "".join(chars), offsets
+
+
+def _documents(hexagrams):
+    """将卦象数据展开为文档列表 [(卦序, 爻位或0, 字段, 原文), ...]"""
+    docs = []
+    for number in sorted(hexagrams, key=int):
+        hexagram = hexagrams[number]
+        for field in ("judgement", "judgement_detail", "image"):
+            if hexagram.get(field):
+                docs.append((int(number), 0, field, hexagram[field]))
+        lines = hexagram.get("lines", {})
+        for line in sorted(lines, key=int):
+            for key, field in (("text", "line_text"), ("image", "line_image")):
+                if lines[line].get(key):
+                    docs.append((int(number), int(line), field, lines[line][key]))
+    return docs
+
+
+def _data_digest(data_path):
+    with open(data_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class HexagramSearchIndex:
+    """
+    卦象文本倒排索引
+
+    postings 以 n-gram 为键，值为扁平的 [文档号, 位置, 文档号, 位置, ...] 列表
+    （位置为规范化文本中的字符下标）；查询时按需转换为 {文档号: 位置集合}。
+    """
+
+    def __init__(self, docs, postings, names=None, digest=None):
+        """
+        Args:
+            docs: [(卦序, 爻位或0, 字段, 原文), ...]
+            postings: {n-gram: [文档号, 位置, ...]}
+            names: {卦序: 卦名}
+            digest: 数据文件的 SHA-1，用于判断索引是否过期
+        """
+        self.docs = [tuple(doc) for doc in docs]
+        self.names = {int(k): v for k, v in (names or {}).items()}
+        self.digest = digest
+        self._postings = postings
+        self._decoded = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, hexagrams, digest=None):
+        """
+        由卦象数据构建索引
+
+        Args:
+            hexagrams: hexagrams_data.json 中的 'hexagrams' 字典
+            digest: 数据文件的 SHA-1
+        """
+        docs = _documents(hexagrams)
+        postings = {}
+        for doc_id, (_, _, _, text) in enumerate(docs):
+            normalized, _ = _normalize(text)
+            # 单字与二元组都建索引：单字查询直接命中，多字查询用二元组求交
+            for pos in range(len(normalized)):
+                postings.setdefault(normalized[pos], []).extend((doc_id, pos))
+                if pos + 1 < len(normalized):
+                    postings.setdefault(normalized[pos:pos + 2], []).extend((doc_id, pos))
+        names = {int(k): v.get("name_cn", "") for k, v in hexagrams.items()}
+        return cls(docs, postings, names, digest)
+
+    @classmethod
+    def load(cls, path):
+        """从索引文件加载"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"索引版本不匹配: {path}")
+        return cls(data["docs"], data["postings"], data["names"], data["digest"])
+
+    def save(self, path):
+        """写出索引文件（先写临时文件再原子替换）"""
+        import os
+
+        data = {
+            "version": INDEX_VERSION,
+            "digest": self.digest,
+            "names": self.names,
+            "docs": self.docs,
+            "postings": self._postings,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def _posting(self, gram):
+        """n-gram 的倒排表 {文档号: 位置集合}"""
+        decoded = self._decoded.get(gram)
+        if decoded is None:
+            decoded = {}
+            flat = self._postings.get(gram, ())
+            for i in range(0, len(flat), 2):
+                decoded.setdefault(flat[i], set()).add(flat[i + 1])
+            with self._lock:
+                self._decoded[gram] = decoded
+        return decoded
+
+    def _match(self, term):
+        """
+        查找短语的全部出现位置
+
+        Returns:
+            dict: {文档号: [起始位置, ...]}
+        """
+        if len(term) == 1:
+            return {doc: sorted(positions) for doc, positions in self._posting(term).items()}
+        first = self._posting(term[:2])
+        rest = [self._posting(term[k:k + 2]) for k in range(1, len(term) - 1)]
+        # 先按文档求交，再核对各二元组的位置是否依次相邻
+        candidates = set(first)
+        for posting in rest:
+            candidates &= posting.keys()
+            if not candidates:
+                return {}
+        matches = {}
+        for doc in candidates:
+            starts = [p for p in first[doc]
+                      if all(p + k + 1 in posting[doc] for k, posting in enumerate(rest))]
+            if starts:
+                matches[doc] = sorted(starts)
+        return matches
+
+    def search(self, query, limit=20, mode="all", highlight=("[", "]"), context=16):
+        """
+        检索卦象文本
+
+        Args:
+            query: 查询串；空白分隔多个词，引号内为一个短语，标点会被忽略
+            limit: 最多返回的结果数，None 表示不限
+            mode: "all" 要求包含全部词，"any" 包含任一词即可
+            highlight: 高亮标记 (前缀, 后缀)
+            context: 片段中匹配处前后保留的字符数
+
+        Returns:
+            list: [{
+                'number': 卦序, 'name': 卦名, 'line': 爻位 (卦辞等为None),
+                'field': 字段名, 'field_name': 字段中文名,
+                'count': 匹配次数, 'snippet': 高亮片段
+            }, ...]
+        """
+        terms = [_normalize(term)[0] for term in _split_query(query)]
+        terms = [term for term in terms if term]
+        if not terms:
+            return []
+
+        per_term = [self._match(term) for term in terms]
+        if mode == "all":
+            docs = set(per_term[0])
+            for matches in per_term[1:]:
+                docs &= matches.keys()
+        else:
+            docs = set().union(*per_term)
+
+        results = []
+        for doc in docs:
+            spans = []
+            for term, matches in zip(terms, per_term):
+                spans.extend((p, p + len(term)) for p in matches.get(doc, ()))
+            number, line, field, text = self.docs[doc]
+            results.append({
+                'number': number,
+                'name': self.names.get(number, ""),
+                'line': line or None,
+                'field': field,
+                'field_name': FIELD_NAMES[field],
+                'count': len(spans),
+                'snippet': _snippet(text, spans, highlight, context),
+            })
+        results.sort(key=lambda r: (-r['count'], r['number'], r['line'] or 0, FIELDS.index(r['field'])))
+        return results if limit is None else results[:limit]
+
+
+def _split_query(query):
+    """按空白切分查询，引号（半角或全角）内的内容作为一个短语"""
+    terms, current, quote = [], [], None
+    for ch in query:
+        if quote:
+            if ch == quote:
+                terms.append("".join(current))
+                current, quote = [], None
+            else:
+                current.append(ch)
+        elif ch in "\"“”「":
+            if current:
+                terms.append("".join(current))
+            current, quote = [], {"“": "”", "「": "」"}.get(ch, ch)
+        elif ch.isspace():
+            if current:
+                terms.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    if current:
+        terms.append("".join(current))
+    return terms
+
+
+def _snippet(text, spans, highlight, context):
+    """以第一处匹配为中心截取原文片段，并高亮其中的全部匹配"""
+    _, offsets = _normalize(text)
+    # 规范化位置 -> 原文区间，并合并重叠的区间
+    ranges = sorted((offsets[start], offsets[end - 1] + 1) for start, end in spans)
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    window_start = max(0, merged[0][0] - context)
+    window_end = min(len(text), merged[0][1] + context)
+    prefix, suffix = highlight
+    parts = ["…" if window_start > 0 else ""]
+    cursor = window_start
+    for start, end in merged:
+        if start >= window_end:
+            break
+        end = min(end, window_end)
+        parts.append(text[cursor:start])
+        parts.append(f"{prefix}{text[start:end]}{suffix}")
+        cursor = end
+    parts.append(text[cursor:window_end])
+    parts.append("…" if window_end < len(text) else "")
+    return "".join(parts)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _resolve(path):
+    if not Path(path).is_absolute():
+        return Path(__file__).parent / path
+    return Path(path)
+
+
+def build_index(data_path="hexagrams_data.json", index_path=DEFAULT_INDEX_PATH):
+    """
+    数据编译阶段：由数据文件构建索引并写出
+
+    Returns:
+        HexagramSearchIndex: 构建好的索引
+    """
+    data_path, index_path = _resolve(data_path), _resolve(index_path)
+    with open(data_path, "r", encoding="utf-8") as f:
+        hexagrams = json.load(f).get("hexagrams", {})
+    index = HexagramSearchIndex.build(hexagrams, digest=_data_digest(data_path))
+    index.save(index_path)
+    return index
+
+
+def get_index(data_path="hexagrams_data.json", index_path=DEFAULT_INDEX_PATH):
+    """
+    获取进程内共享的索引（首次调用时加载）
+
+    优先读取预先构建的索引文件；文件缺失或与数据文件不一致时在内存中构建。
+    """
+    key = (str(_resolve(data_path)), str(_resolve(index_path)))
+    index = _indexes.get(key)
+    if index is not None:
+        return index
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            data_path, index_path = _resolve(data_path), _resolve(index_path)
+            digest = _data_digest(data_path)
+            try:
+                index = HexagramSearchIndex.load(index_path)
+                if index.digest != digest:
+                    index = None
+            except (OSError, ValueError, KeyError):
+                index = None
+            if index is None:
+                from hexagram_interpreter import HexagramInterpreter
+                hexagrams = HexagramInterpreter.shared(str(data_path)).hexagrams_data
+                index = HexagramSearchIndex.build(hexagrams, digest=digest)
+            _indexes[key] = index
+    return index
+
+
+def search(query, **kwargs):
+    """在默认数据上检索，参数同 HexagramSearchIndex.search()"""
+    return get_index().search(query, **kwargs)
+
+
+def format_result(result):
+    """将一条检索结果格式化为单行文本"""
+    position = f"第{result['line']}爻{result['field_name']}" if result['line'] else result['field_name']
+    return f"{result['name']}卦 (第{result['number']}卦) {position}: {result['snippet']}"
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="卦象全文检索")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("build", help="构建索引文件（数据更新后运行）")
+    query_parser = sub.add_parser("query", help="检索")
+    query_parser.add_argument("query", help='查询串，如 "利见大人" 或 无咎 君子')
+    query_parser.add_argument("--any", action="store_true", help="包含任一词即可")
+    query_parser.add_argument("-n", "--limit", type=int, default=20, help="最多返回条数")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        index = build_index()
+        print(f"已构建索引: {len(index.docs)} 段文本，{len(index._postings)} 个词元，"
+              f"耗时 {(time.perf_counter() - start) * 1000:.0f} ms")
+    elif args.command == "query":
+        start = time.perf_counter()
+        index = get_index()
+        loaded = time.perf_counter()
+        results = index.search(args.query, limit=None, mode="any" if args.any else "all")
+        searched = time.perf_counter()
+        for result in results[:args.limit]:
+            print(format_result(result))
+        print(f"\n共 {len(results)} 条 (加载 {(loaded - start) * 1000:.1f} ms，"
+              f"检索 {(searched - loaded) * 1000:.2f} ms)")
+    else:
+        parser.print_help()
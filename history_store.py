@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+占卜历史记录模块
+Divination History Store
+
+以 SQLite (WAL 模式) 追加记录每一次占卜：时间、问题、爻象、卦序、模型、耗时与解卦文本。
+写入在后台线程中批量提交，不阻塞占卜响应；按卦序、变爻数与时间建立索引，
+支持“最近一周所有乾卦”之类的查询。
+"""
+
+import atexit
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+from dayan_divination import line_state_to_index
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS divinations (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    question TEXT,
+    line_state INTEGER NOT NULL,
+    original_hexagram INTEGER,
+    changed_hexagram INTEGER,
+    changing_count INTEGER NOT NULL,
+    model TEXT,
+    latency_ms REAL,
+    interpretation TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_divinations_original_ts ON divinations (original_hexagram, ts);
+CREATE INDEX IF NOT EXISTS idx_divinations_changed_ts ON divinations (changed_hexagram, ts);
+CREATE INDEX IF NOT EXISTS idx_divinations_changing_ts ON divinations (changing_count, ts);
+CREATE INDEX IF NOT EXISTS idx_divinations_ts ON divinations (ts);
+"""
+
+_COLUMNS = ("ts", "question", "line_state", "original_hexagram", "changed_hexagram",
+            "changing_count", "model", "latency_ms", "interpretation")
+
+_INSERT = f"INSERT INTO divinations ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+
+
+class HistoryStore:
+    """占卜历史记录（SQLite WAL，后台批量写入）"""
+
+    def __init__(self, path="divination_history.db", batch_size=256,
+                 flush_interval=0.5, max_pending=100000):
+        """
+        初始化历史记录
+
+        Args:
+            path: SQLite 数据库文件路径
+            batch_size: 单次事务最多写入的条数
+            flush_interval: 未攒满一批时的最长等待时间（秒）
+            max_pending: 待写入队列上限，超出时丢弃新记录而不阻塞调用方
+        """
+        self.path = str(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0          # 队列满或写入失败而丢弃的条数
+        self.failed_batches = 0
+        self.last_error = None
+
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        conn.close()
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        """创建数据库连接"""
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(self, question, lines, original_hexagram, changed_hexagram,
+               model, latency_ms, interpretation, ts=None):
+        """
+        记录一次占卜（非阻塞）
+
+        Args:
+            question: 占卜问题
+            lines: 六爻爻值列表（初爻在前）
+            original_hexagram: 本卦卦序
+            changed_hexagram: 之卦卦序，无变爻时为None
+            model: 使用的AI模型
+            latency_ms: 占卜总耗时（毫秒）
+            interpretation: 解卦文本
+            ts: 时间戳，默认当前时间
+
+        Returns:
+            bool: 是否已加入写入队列
+        """
+        if self._closed:
+            return False
+        row = (
+            time.time() if ts is None else ts,
+            question,
+            line_state_to_index(lines),
+            original_hexagram,
+            changed_hexagram,
+            sum(1 for val in lines if val in (6, 9)),
+            model,
+            latency_ms,
+            interpretation,
+        )
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _write_loop(self):
+        """后台写入线程：攒批后一次事务提交"""
+        conn = self._connect()
+        while True:
+            row = self._queue.get()
+            if row is None:
+                break
+            batch = [row]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is None:
+                    stop = True
+                    break
+                batch.append(row)
+            try:
+                with conn:
+                    conn.executemany(_INSERT, batch)
+            except Exception as e:
+                # 磁盘已满、数据库被锁或取值非法：丢弃这一批，写入线程继续运行
+                self.dropped += len(batch)
+                self.failed_batches += 1
+                self.last_error = e
+                print(f"历史记录写入失败，丢弃 {len(batch)} 条: {e}", file=sys.stderr)
+            if stop:
+                break
+        conn.close()
+
+    def close(self):
+        """写完队列中的记录并停止后台线程"""
+        if self._closed:
+            return
+        self._closed = True
+        # 队列满时等待写入线程腾出空间；写入线程已退出时不再等待
+        while self._writer.is_alive():
+            try:
+                self._queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self._writer.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _where(self, hexagram, changing_count, since, until, include_changed):
+        """构建查询条件"""
+        clauses, params = [], []
+        if hexagram is not None:
+            if include_changed:
+                clauses.append("(original_hexagram = ? OR changed_hexagram = ?)")
+                params.extend([hexagram, hexagram])
+            else:
+                clauses.append("original_hexagram = ?")
+                params.append(hexagram)
+        if changing_count is not None:
+            clauses.append("changing_count = ?")
+            params.append(changing_count)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def query(self, hexagram=None, changing_count=None, since=None, until=None,
+              include_changed=False, limit=100):
+        """
+        查询占卜记录（按时间倒序）
+
+        Args:
+            hexagram: 卦序 (1-64)
+            changing_count: 变爻数 (0-6)
+            since: 起始时间戳（含）
+            until: 截止时间戳（不含）
+            include_changed: 是否同时匹配之卦
+            limit: 最多返回条数
+
+        Returns:
+            list: 记录字典列表
+        """
+        where, params = self._where(hexagram, changing_count, since, until, include_changed)
+        sql = f"SELECT id, {', '.join(_COLUMNS)} FROM divinations{where} ORDER BY ts DESC LIMIT ?"
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params + [limit]).fetchall()
+        finally:
+            conn.close()
+        keys = ("id",) + _COLUMNS
+        return [dict(zip(keys, row)) for row in rows]
+
+    def count(self, hexagram=None, changing_count=None, since=None, until=None,
+              include_changed=False):
+        """统计符合条件的记录数，参数同 query()"""
+        where, params = self._where(hexagram, changing_count, since, until, include_changed)
+        conn = self._connect()
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM divinations{where}", params).fetchone()[0]
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from hexagram_interpreter import HexagramInterpreter
+
+    parser = argparse.ArgumentParser(description="查询占卜历史记录")
+    parser.add_argument("--db", default="divination_history.db", help="数据库文件路径")
+    parser.add_argument("--hexagram", help="卦名或卦序，如 乾 或 1")
+    parser.add_argument("--changing", type=int, help="变爻数")
+    parser.add_argument("--days", type=float, help="最近若干天")
+    parser.add_argument("--limit", type=int, default=20, help="最多显示条数")
+    args = parser.parse_args()
+
+    hexagram = None
+    if args.hexagram:
+        hexagram = (int(args.hexagram) if args.hexagram.isdigit()
+                    else HexagramInterpreter().number_by_name(args.hexagram))
+    since = time.time() - args.days * 86400 if args.days else None
+
+    store = HistoryStore(args.db)
+    start = time.perf_counter()
+    total = store.count(hexagram=hexagram, changing_count=args.changing, since=since)
+    rows = store.query(hexagram=hexagram, changing_count=args.changing, since=since, limit=args.limit)
+    elapsed = (time.perf_counter() - start) * 1000
+    for row in rows:
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["ts"]))
+        print(f"{when}  第{row['original_hexagram']}卦  变爻{row['changing_count']}  {row['question'] or '(通占)'}")
+    print(f"\n共 {total} 条，查询耗时 {elapsed:.1f} ms")
+    store.close()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+压测工具
+Load Test
+
+以固定并发持续请求占卜服务，统计吞吐量与延迟分位数。
+配合 fake_ollama.py 使用，可在没有真实模型的情况下比较不同工作进程数下的扩展性：
+
+    python fake_ollama.py --ttft 0.05 --tokens-per-second 500 &
+    python server.py --workers 4 &
+    python loadtest.py --concurrency 64 --duration 10
+"""
+
+import http.client
+import json
+import threading
+import time
+from urllib.parse import quote, urlparse
+
+
+def _request(host, port, stream, question):
+    """发送一次占卜请求，返回是否成功"""
+    conn = http.client.HTTPConnection(host, port, timeout=120)
+    try:
+        if stream:
+            conn.request("GET", f"/divine/stream?question={quote(question)}")
+            response = conn.getresponse()
+            body = response.read()
+            return response.status == 200 and b"event: done" in body
+        body = json.dumps({"question": question}, ensure_ascii=False).encode("utf-8")
+        conn.request("POST", "/divine", body=body, headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        return response.status == 200
+    except OSError:
+        return False
+    finally:
+        conn.close()
+
+
+def percentile(sorted_values, q):
+    """已排序序列的分位数"""
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def run_load(url="http://127.0.0.1:8000", concurrency=32, duration=10.0,
+             stream=False, question="我的事业发展如何？"):
+    """
+    执行压测
+
+    Args:
+        url: 服务地址
+        concurrency: 并发连接数
+        duration: 持续时间（秒）
+        stream: 是否使用 SSE 接口
+        question: 请求的问题
+
+    Returns:
+        dict: {'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms'}
+    """
+    parsed = urlparse(url)
+    host, port = parsed.hostname, parsed.port or 80
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            ok = _request(host, port, stream, question)
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / wall if wall else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="占卜服务压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="服务地址")
+    parser.add_argument("-c", "--concurrency", type=int, default=32, help="并发连接数")
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="持续时间（秒）")
+    parser.add_argument("--stream", action="store_true", help="使用 SSE 接口")
+    args = parser.parse_args()
+
+    report = run_load(args.url, args.concurrency, args.duration, args.stream)
+    print(f"请求数: {report['requests']}  失败: {report['errors']}")
+    print(f"吞吐量: {report['rps']:.1f} req/s")
+    print(f"延迟 p50/p95/p99: {report['p50_ms']:.1f} / {report['p95_ms']:.1f} / {report['p99_ms']:.1f} ms")
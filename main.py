@@ -7,14 +7,20 @@ I-Ching Divination Main Program
 """
 
 import sys
+import random
 import re
+import time
 from pathlib import Path
 
 # 导入自定义模块
-from dayan_divination import DayanDivination
+from dayan_divination import DayanDivination, hexagram_result
 from hexagram_interpreter import HexagramInterpreter
-from ollama_client import OllamaClient
-from prompt_templates import PromptTemplates
+from ollama_client import DeadlineExceeded, OllamaClient
+from prompt_templates import MultiAnswerSplitter, PromptTemplates
+from metrics import NULL_METRICS
+from output_sink import OutputSink
+from profiling import NULL_SESSION, RequestProfiler
+from scheduler import INTERACTIVE
 
 
 def clean_markdown(text):
@@ -45,6 +51,27 @@ def clean_markdown(text):
     return text
 
 
+def _until_deadline(response):
+    """
+    转发流式输出；模型超时时产出一次 None 作为标记后结束
+    """
+    try:
+        yield from response
+    except DeadlineExceeded:
+        yield None
+
+
+def _started(generator):
+    """
+    推进到生成器开头的空 yield 后返回
+
+    未迭代过的生成器被 close() 时不会执行 finally；先推进一步，
+    使调用方在取得首块前断开时也能结束剖析会话、写出捕获记录。
+    """
+    next(generator)
+    return generator
+
+
 class IChing:
     """周易占卜系统"""
     
@@ -52,7 +79,16 @@ class IChing:
                  model="FortuneQwen3_q8:4b",
                  data_path="hexagrams_data.json",
                  verbose=True,
-                 concise=False):
+                 concise=False,
+                 history=None,
+                 metrics=None,
+                 profiler=None,
+                 pregenerated=None,
+                 cache=None,
+                 timeout=None,
+                 scheduler=None,
+                 keep_alive=None,
+                 recorder=None):
         """
         初始化周易占卜系统
         
@@ -62,77 +98,676 @@ class IChing:
             data_path: 卦象数据文件路径
             verbose: 是否显示详细起卦过程
             concise: 是否使用精简输出模式（默认False）
+            history: 可选的 HistoryStore，用于记录每次占卜
+            metrics: 可选的 MetricsRegistry，用于记录各阶段耗时
+            profiler: 可选的 RequestProfiler，按比例抽样剖析请求
+            pregenerated: 可选的 PregeneratedStore，问题为空时直接返回预生成的解卦
+            cache: 可选的 SemanticCache，同一爻象下的相似问题直接返回已生成的解卦
+            timeout: 默认的单次占卜时限（秒），超时返回本地生成的参考解读；None 表示不限
+            scheduler: 可选的 FairScheduler，对模型请求进行按客户端限速与公平排队
+            keep_alive: 可选，每次请求后模型在 Ollama 中驻留的时长（如 "30m"）
+            recorder: 可选的 TrafficRecorder，记录每次占卜的输入与上游 token 时序以便回放
         """
         self.divination = DayanDivination(verbose=verbose)
-        self.interpreter = HexagramInterpreter(data_path=data_path)
-        self.ollama = OllamaClient(base_url=ollama_url, model=model)
+        # 卦象数据为只读，进程内所有实例共享同一份
+        self.interpreter = HexagramInterpreter.shared(data_path=data_path)
+        self.ollama = OllamaClient(base_url=ollama_url, model=model, keep_alive=keep_alive)
         self.verbose = verbose
         self.concise = concise
+        self.history = history
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.profiler = profiler
+        self.pregenerated = pregenerated
+        self.cache = cache
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.warmer = None
+        self.recorder = recorder
+    
+    def _start_profile(self):
+        """开始请求剖析；未配置或未抽中时返回空会话"""
+        if self.profiler is None:
+            return NULL_SESSION
+        return self.profiler.start()
     
-    def divine(self, question="", stream=False):
+    def _record_history(self, question, reading, interpretation, latency_ms):
+        """将一次占卜写入历史记录（未配置时忽略）"""
+        if self.history is None:
+            return
+        original_hex = reading['interpretation']['original_hexagram']
+        changed_hex = reading['interpretation']['changed_hexagram']
+        self.history.record(
+            question=question,
+            lines=reading['divination_result']['original_lines'],
+            original_hexagram=original_hex.get('number') if original_hex else None,
+            changed_hexagram=changed_hex.get('number') if changed_hex else None,
+            model=self.ollama.model,
+            latency_ms=latency_ms,
+            interpretation=interpretation
+        )
+
+    def _begin_capture(self, entry, question, seed):
         """
-        执行完整的占卜流程 (异步优化版)
+        开始捕获一次占卜；为便于回放，未指定种子时生成一个
+        
+        Returns:
+            tuple: (Exchange 或 None, 起卦种子)
+        """
+        if self.recorder is None:
+            return None, seed
+        if seed is None:
+            seed = random.getrandbits(63)
+        return self.recorder.begin(entry, question, seed), seed
+
+    def _deadline(self, timeout):
+        """将时限（秒）换算为截止时刻，未指定时使用实例默认值"""
+        if timeout is None:
+            timeout = self.timeout
+        return None if timeout is None else time.monotonic() + timeout
+
+    def warm_up(self, keep_alive="30m", preload_prompt=False, keep_resident=True):
+        """
+        预热模型：确认模型存在、加载并设置驻留时长，可选预先评估系统提示词，
+        并在空闲期间定期保活（见 warmup.py）
         
         Args:
-            question: 占卜问题
-            stream: 是否流式输出AI响应
+            keep_alive: 模型驻留时长
+            preload_prompt: 是否预先评估精简模板的系统提示词
+            keep_resident: 是否启动后台保活线程
             
         Returns:
-            str: AI解卦结果 (非流式)
-            Generator: 生成器 (流式)
+            dict: 预热结果，失败时 'error' 为错误信息
         """
-        import threading
-        import queue
+        from warmup import warm_up
+
+        if self.warmer is not None:
+            self.warmer.stop()
+        self.warmer, result = warm_up(self.ollama, keep_alive=keep_alive,
+                                      preload_prompt=preload_prompt, keep_resident=keep_resident)
+        return result
+
+    def _admit(self, client):
+        """
+        按客户端限速（未配置调度器时忽略）
+
+        Raises:
+            RateLimited: 客户端超出速率限制
+        """
+        if self.scheduler is not None:
+            self.scheduler.admit(client)
+
+    def _scheduled(self, request, stream, client, priority, on_queue, deadline):
+        """
+        在调度器分配的名额内执行模型请求（未配置调度器时直接执行）
+
+        流式请求在首次迭代时排队，名额保持到生成结束或生成器被关闭；
+        截止时间前未排到时抛出 DeadlineExceeded。
+        """
+        if self.scheduler is None:
+            return request()
+        slot = self.scheduler.slot(self.ollama.base_url, client, priority,
+                                   on_position=on_queue, deadline=deadline)
+        if not stream:
+            with slot:
+                return request()
+        return self._scheduled_stream(slot, request)
+
+    @staticmethod
+    def _scheduled_stream(slot, request):
+        with slot:
+            response = request()
+            try:
+                yield from response
+            finally:
+                response.close()
 
-        # 1. 检查Ollama连接
-        if not self.ollama.check_connection():
-            return "错误: 无法连接到Ollama服务，请确保Ollama正在运行。"
+    def _generate(self, reading, stream, stats, deadline, client=None, priority=INTERACTIVE,
+                  on_queue=None, capture=None):
+        """以精简模板的长度上限与停止序列请求模型"""
+        return self._scheduled(lambda: self.ollama.generate(
+            prompt=reading['user_prompt'],
+            system_prompt=reading['system_prompt'],
+            temperature=0.7,
+            stream=stream,
+            stats=stats,
+            deadline=deadline,
+            max_tokens=PromptTemplates.MAX_TOKENS_CONCISE,
+            stop=PromptTemplates.STOP_SEQUENCES_CONCISE,
+            capture=capture
+        ), stream, client, priority, on_queue, deadline)
+
+    @staticmethod
+    def _fallback(reading):
+        """模型超时时的参考解读"""
+        interpretation = reading['interpretation']
+        return PromptTemplates.build_fallback_reading(
+            hexagram_info=reading['hexagram_info'],
+            interpretation_guide=interpretation['interpretation_guide'],
+            original_text=interpretation['original_text'],
+            changed_text=interpretation['changed_text']
+        )
+
+    def _lookup_cached(self, question, reading):
+        """
+        查找无需请求模型的解卦：问题为空时查预生成结果，否则查相似问题缓存
         
-        # 2. 立即计算卦象结果 (不含显示)
-        #    利用 refactor 后的 simulate 方法瞬间得到结果
-        simulation_data = self.divination.simulate()
+        Returns:
+            str: 解卦文本，未命中时返回None
+        """
+        lines = reading['divination_result']['original_lines']
+        if not question.strip():
+            if self.pregenerated is not None:
+                return self.pregenerated.get(lines)
+            return None
+        if self.cache is not None:
+            return self.cache.get(lines, question)
+        return None
+
+    def _store_cached(self, question, reading, interpretation):
+        """将新生成的解卦放入相似问题缓存（未配置时忽略）"""
+        if self.cache is not None and question.strip() and interpretation:
+            self.cache.put(reading['divination_result']['original_lines'], question, interpretation)
+
+    def prepare(self, question="", lines=None, seed=None):
+        """
+        起卦、解析卦象并构建 Prompt（不调用AI，不显示过程）
+        
+        Args:
+            question: 占卜问题
+            lines: 可选的六爻爻值列表，指定时不起卦而直接使用该爻象
+            seed: 可选的起卦种子，同一种子得到同一爻象
+            
+        Returns:
+            dict: {
+                'simulation_data': 起卦过程数据,
+                'divination_result': 卦象结果,
+                'interpretation': 卦象解析结果,
+                'hexagram_info': 卦象基本信息,
+                'user_prompt': 用户提示词,
+                'system_prompt': 系统提示词
+            }
+        """
+        # 利用 refactor 后的 simulate 方法瞬间得到结果
+        if lines is not None:
+            simulation_data = {"hex_result": hexagram_result(lines), "process_log": []}
+        elif seed is not None:
+            with self.metrics.timer("simulate"):
+                simulation_data = DayanDivination(verbose=False, rng=random.Random(seed)).simulate()
+        else:
+            with self.metrics.timer("simulate"):
+                simulation_data = self.divination.simulate()
         divination_result = simulation_data["hex_result"]
 
-        # 3. 解析卦象
-        interpretation = self.interpreter.interpret_divination_result(divination_result)
+        # 解析卦象
+        with self.metrics.timer("interpret_divination_result"):
+            interpretation = self.interpreter.interpret_divination_result(divination_result)
         
-        # 4. 构建卦象信息与 Prompt
+        # 构建卦象信息与 Prompt
         original_hex = interpretation['original_hexagram']
         changed_hex = interpretation['changed_hexagram']
         
+        hexagram_info = ""
+        user_prompt = system_prompt = ""
+        if original_hex is not None:
+            hexagram_info = f"本卦: {original_hex.get('name_cn', '未知')}卦 (第{original_hex.get('number', '?')}卦)"
+            if changed_hex:
+                hexagram_info += f"\n之卦: {changed_hex.get('name_cn', '未知')}卦 (第{changed_hex.get('number', '?')}卦)"
+            if interpretation['changing_lines']:
+                hexagram_info += f"\n变爻: 第{interpretation['changing_lines']}爻"
+            
+            with self.metrics.timer("build_divination_prompt"):
+                user_prompt, system_prompt = PromptTemplates.build_divination_prompt(
+                    question=question,
+                    hexagram_info=hexagram_info,
+                    interpretation_guide=interpretation['interpretation_guide'],
+                    original_text=interpretation['original_text'],
+                    changed_text=interpretation['changed_text'],
+                    concise=self.concise
+                )
+
+        return {
+            'simulation_data': simulation_data,
+            'divination_result': divination_result,
+            'interpretation': interpretation,
+            'hexagram_info': hexagram_info,
+            'user_prompt': user_prompt,
+            'system_prompt': system_prompt
+        }
+
+    def divine_record(self, question="", timeout=None, client=None, priority=INTERACTIVE, seed=None):
+        """
+        执行一次不显示过程的占卜，返回结构化结果 (供批处理等场景使用)
+        
+        该方法不修改实例状态，可在多个线程中并发调用。
+        
+        Args:
+            question: 占卜问题
+            timeout: 本次占卜时限（秒），None 时使用实例默认值
+            client: 客户端标识，用于限速与公平排队
+            priority: 排队优先级，INTERACTIVE 或 BATCH
+            seed: 可选的起卦种子
+            
+        Returns:
+            dict: 包含起卦结果、卦序、prompt、解卦文本与耗时的字典；
+                  失败时 'error' 字段为错误信息，超时时 'fallback' 为 True
+
+        Raises:
+            RateLimited: 客户端超出速率限制
+        """
+        self._admit(client)
+        capture, seed = self._begin_capture("record", question, seed)
+        profile = self._start_profile()
+        deadline = self._deadline(timeout)
+        start = time.perf_counter()
+        reading = self.prepare(question, seed=seed)
+        prepared = time.perf_counter()
+        profile.stage("prepare")
+        if capture is not None:
+            capture.casting(reading['divination_result']['original_lines'])
+
+        divination_result = reading['divination_result']
+        interpretation = reading['interpretation']
+        original_hex = interpretation['original_hexagram']
+        changed_hex = interpretation['changed_hexagram']
+
+        record = {
+            'question': question,
+            'casting': {
+                'original_lines': divination_result['original_lines'],
+                'original_binary': divination_result['original_binary'],
+                'changed_binary': divination_result['changed_binary'],
+                'changing_lines': divination_result['changing_lines'],
+            },
+            'original_hexagram': original_hex.get('number') if original_hex else None,
+            'changed_hexagram': changed_hex.get('number') if changed_hex else None,
+            'model': self.ollama.model,
+            'prompt': reading['user_prompt'],
+            'system_prompt': reading['system_prompt'],
+            'interpretation': None,
+            'fallback': False,
+            'error': None,
+        }
+
+        generated = cleaned = prepared
+        cached = self._lookup_cached(question, reading)
         if original_hex is None:
-            return f"错误: 无法找到卦象数据。二进制: {divination_result['original_binary']}"
+            record['error'] = f"无法找到卦象数据。二进制: {divination_result['original_binary']}"
+        elif cached is not None:
+            record['interpretation'] = cached
+            generated = cleaned = time.perf_counter()
+            self.metrics.observe_stage("cache_lookup", generated - prepared)
+        else:
+            stats = {}
+            try:
+                response = self._generate(reading, False, stats, deadline, client, priority,
+                                          capture=capture)
+            except DeadlineExceeded:
+                response = None
+            generated = time.perf_counter()
+            profile.stage("generate")
+            if response is None:
+                record['interpretation'] = self._fallback(reading)
+                record['fallback'] = True
+            elif response.startswith("错误:"):
+                record['error'] = response
+            else:
+                record['interpretation'] = clean_markdown(response)
+                self._store_cached(question, reading, record['interpretation'])
+            cleaned = time.perf_counter()
+            profile.stage("clean_markdown")
+            self.metrics.observe_stage("generation", generated - prepared)
+            self.metrics.observe_stage("clean_markdown", cleaned - generated)
+            self.metrics.observe_generation(stats)
+
+        record['timings'] = {
+            'prepare_ms': round((prepared - start) * 1000, 3),
+            'generate_ms': round((generated - prepared) * 1000, 3),
+            'clean_ms': round((cleaned - generated) * 1000, 3),
+            'total_ms': round((cleaned - start) * 1000, 3),
+        }
+        if record['interpretation'] is not None:
+            self._record_history(question, reading, record['interpretation'],
+                                 record['timings']['total_ms'])
+        if capture is not None:
+            capture.finish("error" if record['error'] else "cached" if cached is not None
+                           else "fallback" if record['fallback'] else "ok")
+        profile.finish()
+        return record
+
+    def _clean_stream(self, question, reading, response, stats, start, profile, echo=False,
+                      cacheable=True, capture=None, outcome="ok"):
+        """
+        逐块清理模型的流式输出，结束后记录指标与历史
         
-        hexagram_info = f"本卦: {original_hex.get('name_cn', '未知')}卦 (第{original_hex.get('number', '?')}卦)"
-        if changed_hex:
-            hexagram_info += f"\n之卦: {changed_hex.get('name_cn', '未知')}卦 (第{changed_hex.get('number', '?')}卦)"
-        if interpretation['changing_lines']:
-            hexagram_info += f"\n变爻: 第{interpretation['changing_lines']}爻"
+        模型超过截止时间时改为输出本地生成的参考解读；
+        本生成器被关闭时同时关闭 response，立即断开与模型的连接。
+        打印到终端时经 OutputSink 合并写出，首块立即显示。
         
-        user_prompt, system_prompt = PromptTemplates.build_divination_prompt(
-            question=question,
-            hexagram_info=hexagram_info,
-            interpretation_guide=interpretation['interpretation_guide'],
-            original_text=interpretation['original_text'],
-            changed_text=interpretation['changed_text'],
-            concise=self.concise
-        )
+        Args:
+            response: OllamaClient 返回的流式生成器
+            stats: 传给 generate() 的统计字典
+            start: 本次占卜开始时间 (perf_counter)
+            profile: 剖析会话
+            echo: 是否同时打印到终端
+            cacheable: 完整输出后是否放入相似问题缓存
+            capture: 可选的 Exchange，结束时写出捕获记录
+            outcome: 正常结束时记录的结果 (ok / cached / fallback)
+            
+        Yields:
+            str: 清除Markdown格式后的文本块
+        """
+        parts = []
+        timed = self.metrics.enabled
+        gen_start = time.perf_counter()
+        first_token = True
+        clean_seconds = 0.0
+        chunks = _until_deadline(response)
+        sink = OutputSink(sys.stdout) if echo else None
+        delivered = 0
+        completed = False
+        try:
+            yield  # 由 _started() 消耗
+            for chunk in chunks:
+                if chunk is None:
+                    # 超时：已输出部分之后附上参考解读
+                    cacheable = False
+                    outcome = "fallback"
+                    chunk = self._fallback(reading)
+                    if parts:
+                        chunk = "\n\n" + chunk
+                if timed:
+                    now = time.perf_counter()
+                    if first_token:
+                        self.metrics.observe_stage("time_to_first_token", now - gen_start)
+                        first_token = False
+                    cleaned_chunk = clean_markdown(chunk)
+                    clean_seconds += time.perf_counter() - now
+                else:
+                    cleaned_chunk = clean_markdown(chunk)
+                if sink is not None:
+                    sink.write(cleaned_chunk)
+                parts.append(cleaned_chunk)
+                delivered += 1     # 客户端收到本块后才可能关闭，须在 yield 之前计数
+                yield cleaned_chunk
+            completed = True
+        finally:
+            chunks.close()
+            if sink is not None:
+                sink.close()
+            if capture is not None:
+                capture.finish(outcome if completed else "cancelled", delivered=delivered)
+            profile.stage("stream")
+            profile.finish()
+        if echo:
+            print("\n")
+        if timed:
+            self.metrics.observe_stage("generation", time.perf_counter() - gen_start)
+            self.metrics.observe_stage("clean_markdown", clean_seconds)
+            self.metrics.observe_generation(stats)
+        interpretation = "".join(parts)
+        if cacheable:
+            self._store_cached(question, reading, interpretation)
+        self._record_history(question, reading, interpretation,
+                             (time.perf_counter() - start) * 1000)
+
+    def divine_stream(self, question="", timeout=None, client=None, priority=INTERACTIVE,
+                      on_queue=None, seed=None):
+        """
+        不显示过程的流式占卜 (供服务端等场景使用)
+        
+        与 divine_record 一样不修改实例状态，可在多个线程中并发调用。
+        关闭返回的生成器即取消生成。
+        
+        Args:
+            question: 占卜问题
+            timeout: 本次占卜时限（秒），None 时使用实例默认值
+            client: 客户端标识，用于限速与公平排队
+            priority: 排队优先级，INTERACTIVE 或 BATCH
+            on_queue: 可选回调 (排队位置)，排队等待期间位置变化时在迭代线程中调用
+            seed: 可选的起卦种子
+            
+        Returns:
+            tuple: (reading, Generator)，reading 同 prepare() 的返回值，
+                   生成器逐块产出清除格式后的解卦文本
+
+        Raises:
+            LookupError: 找不到卦象数据
+            RateLimited: 客户端超出速率限制
+        """
+        self._admit(client)
+        capture, seed = self._begin_capture("stream", question, seed)
+        profile = self._start_profile()
+        deadline = self._deadline(timeout)
+        start = time.perf_counter()
+        reading = self.prepare(question, seed=seed)
+        profile.stage("prepare")
+        if capture is not None:
+            capture.casting(reading['divination_result']['original_lines'])
+        if reading['interpretation']['original_hexagram'] is None:
+            profile.finish()
+            if capture is not None:
+                capture.finish("error")
+            raise LookupError(f"无法找到卦象数据。二进制: {reading['divination_result']['original_binary']}")
+
+        stats = {}
+        cached = self._lookup_cached(question, reading)
+        if cached is not None:
+            return reading, _started(self._clean_stream(question, reading, iter((cached,)),
+                                               stats, start, profile, cacheable=False,
+                                               capture=capture, outcome="cached"))
+        response = self._generate(reading, True, stats, deadline, client, priority, on_queue,
+                                  capture=capture)
+        return reading, _started(self._clean_stream(question, reading, response, stats, start, profile,
+                                                    capture=capture))
+
+    def divine_many_stream(self, questions, lines=None, timeout=None, client=None,
+                           priority=INTERACTIVE):
+        """
+        同一卦象下的多个问题合并为一次请求的流式占卜
+        
+        系统提示词与周易原文只需模型评估一次，适合批量与报告场景。
+        不修改实例状态，可在多个线程中并发调用；关闭返回的生成器即取消生成。
+        
+        Args:
+            questions: 问题列表
+            lines: 可选的六爻爻值列表，不指定时起卦一次
+            timeout: 本次占卜时限（秒），None 时使用实例默认值
+            client: 客户端标识，用于限速与公平排队
+            priority: 排队优先级，INTERACTIVE 或 BATCH
+            
+        Returns:
+            tuple: (reading, Generator)，reading 同 prepare() 的返回值（以第一个问题构建），
+                   生成器逐块产出 (问题序号, 清除格式后的文本片段)
+        
+        Raises:
+            ValueError: questions 为空
+            LookupError: 找不到卦象数据
+            RateLimited: 客户端超出速率限制
+        """
+        questions = list(questions)
+        if not questions:
+            raise ValueError("questions 不能为空")
+        self._admit(client)
+        profile = self._start_profile()
+        deadline = self._deadline(timeout)
+        start = time.perf_counter()
+        reading = self.prepare(questions[0], lines=lines)
+        profile.stage("prepare")
+        interpretation = reading['interpretation']
+        if interpretation['original_hexagram'] is None:
+            profile.finish()
+            raise LookupError(f"无法找到卦象数据。二进制: {reading['divination_result']['original_binary']}")
+
+        with self.metrics.timer("build_divination_prompt"):
+            user_prompt, system_prompt = PromptTemplates.build_multi_question_prompt(
+                questions=questions,
+                hexagram_info=reading['hexagram_info'],
+                original_text=interpretation['original_text'],
+                changed_text=interpretation['changed_text']
+            )
+        reading['user_prompt'] = user_prompt
+        reading['system_prompt'] = system_prompt
+
+        stats = {}
+        response = self._scheduled(lambda: self.ollama.generate(
+            prompt=user_prompt,
+            system_prompt=system_prompt,
+            temperature=0.7,
+            stream=True,
+            stats=stats,
+            deadline=deadline,
+            max_tokens=PromptTemplates.MAX_TOKENS_CONCISE * len(questions),
+            stop=PromptTemplates.multi_question_stop(len(questions))
+        ), True, client, priority, None, deadline)
+        return reading, _started(self._split_stream(questions, reading, response, stats, start, profile))
+
+    def _split_stream(self, questions, reading, response, stats, start, profile):
+        """
+        拆分多问题的流式输出，结束后逐个问题记录缓存与历史
+        
+        Yields:
+            tuple: (问题序号, 清除Markdown格式后的文本片段)
+        """
+        splitter = MultiAnswerSplitter(len(questions))
+        answers = [[] for _ in questions]
+        chunks = _until_deadline(response)
+        gen_start = time.perf_counter()
+        timed_out = False
+        try:
+            yield  # 由 _started() 消耗
+            for chunk in chunks:
+                if chunk is None:
+                    timed_out = True
+                    break
+                for index, piece in splitter.feed(chunk):
+                    piece = clean_markdown(piece)
+                    answers[index].append(piece)
+                    yield index, piece
+            for index, piece in splitter.close():
+                piece = clean_markdown(piece)
+                answers[index].append(piece)
+                yield index, piece
+            if timed_out:
+                # 超时：未完成的问题附上参考解读
+                fallback = self._fallback(reading)
+                pending = set(range(len(questions))) - splitter.seen
+                if splitter.current is not None:
+                    pending.add(splitter.current)
+                for index in sorted(pending):
+                    piece = f"\n\n{fallback}" if answers[index] else fallback
+                    answers[index].append(piece)
+                    yield index, piece
+        finally:
+            chunks.close()
+            profile.stage("stream")
+            profile.finish()
+        if self.metrics.enabled:
+            self.metrics.observe_stage("generation", time.perf_counter() - gen_start)
+            self.metrics.observe_generation(stats)
+        latency_ms = (time.perf_counter() - start) * 1000
+        for question, parts in zip(questions, answers):
+            text = "".join(parts).strip()
+            if not text:
+                continue
+            if not timed_out:
+                self._store_cached(question, reading, text)
+            self._record_history(question, reading, text, latency_ms)
+
+    def divine_many(self, questions, lines=None, timeout=None, client=None, priority=INTERACTIVE):
+        """
+        同一卦象下的多个问题合并为一次请求的占卜（非流式）
+        
+        Args:
+            questions: 问题列表
+            lines: 可选的六爻爻值列表，不指定时起卦一次
+            timeout: 本次占卜时限（秒），None 时使用实例默认值
+            client: 客户端标识，用于限速与公平排队
+            priority: 排队优先级，INTERACTIVE 或 BATCH
+            
+        Returns:
+            tuple: (reading, answers)，answers 为与 questions 一一对应的解卦文本，
+                   模型漏答的问题为空字符串
+
+        Raises:
+            ValueError: questions 为空
+        """
+        questions = list(questions)
+        reading, pieces = self.divine_many_stream(questions, lines=lines, timeout=timeout,
+                                                 client=client, priority=priority)
+        answers = [[] for _ in questions]
+        for index, piece in pieces:
+            answers[index].append(piece)
+        return reading, ["".join(parts).strip() for parts in answers]
+
+    def divine(self, question="", stream=False, timeout=None, seed=None):
+        """
+        执行完整的占卜流程 (异步优化版)
+        
+        Args:
+            question: 占卜问题
+            stream: 是否流式输出AI响应
+            timeout: 本次占卜时限（秒，含动画时间），超时返回本地生成的参考解读；
+                     None 时使用实例默认值
+            seed: 可选的起卦种子
+            
+        Returns:
+            str: AI解卦结果 (非流式)
+            Generator: 生成器 (流式)
+        """
+        import threading
+        import queue
+
+        start = time.perf_counter()
+        deadline = self._deadline(timeout)
+        profile = self._start_profile()
+        capture, seed = self._begin_capture("stream" if stream else "record", question, seed)
+
+        # 1-3. 立即计算卦象结果 (不含显示)，解析卦象并构建 Prompt
+        #    起卦只需微秒级，先于连接检查进行，以便命中缓存时无需访问模型
+        reading = self.prepare(question, seed=seed)
+        profile.stage("prepare")
+        if capture is not None:
+            capture.casting(reading['divination_result']['original_lines'])
+        if reading['interpretation']['original_hexagram'] is None:
+            profile.finish()
+            if capture is not None:
+                capture.finish("error")
+            return f"错误: 无法找到卦象数据。二进制: {reading['divination_result']['original_binary']}"
+        cached = self._lookup_cached(question, reading)
+
+        # 4. 检查Ollama连接
+        if cached is None:
+            with self.metrics.timer("check_connection"):
+                connected = self.ollama.check_connection()
+            profile.stage("check_connection")
+            if not connected:
+                profile.finish()
+                if capture is not None:
+                    capture.finish("error")
+                return "错误: 无法连接到Ollama服务，请确保Ollama正在运行。"
+
+        simulation_data = reading['simulation_data']
 
         # 5. 启动后台线程请求 AI
         #    使用 Queue 来传递 AI 的响应结果
         ai_response_queue = queue.Queue()
+        stats = {}
+        submitted = time.perf_counter()
         
         def ai_worker():
+            worker_start = time.perf_counter()
+            self.metrics.observe_stage("queue_wait", worker_start - submitted)
+            if cached is not None:
+                # 命中预生成解卦或相似问题缓存：不请求模型
+                ai_response_queue.put(iter((cached,)) if stream else cached)
+                return
             try:
                 # 获取完整响应（即使前端要求流式，我们也先在后台获取生成器或完整文本）
                 # 这里为了配合前端流式体验，如果是 stream=True，我们将生成器放入 queue
                 # 如果是 stream=False，我们将完整字符串放入 queue
-                res = self.ollama.generate(
-                    prompt=user_prompt,
-                    system_prompt=system_prompt,
-                    temperature=0.7,
-                    stream=stream
-                )
+                res = self._generate(reading, stream, stats, deadline, capture=capture)
+                if not stream:
+                    self.metrics.observe_stage("generation", time.perf_counter() - worker_start)
                 ai_response_queue.put(res)
             except Exception as e:
                 ai_response_queue.put(e)
@@ -153,34 +788,50 @@ class IChing:
             print("正在请AI大师解卦...")
             print("="*60 + "\n")
 
+        profile.stage("play_process")
+
         # 7. 等待 AI 线程完成 (通常动画播放完，AI也差不多好了)
         ai_thread.join()
         
         # 获取结果
         response = ai_response_queue.get()
+        profile.stage("wait_ai")
         
-        if isinstance(response, Exception):
+        fallback = isinstance(response, DeadlineExceeded)
+        if fallback:
+            response = iter((self._fallback(reading),)) if stream else self._fallback(reading)
+        elif isinstance(response, Exception):
+            profile.finish()
+            if capture is not None:
+                capture.finish("error")
             return f"错误: AI生成失败 - {str(response)}"
 
         # 8. 处理并返回输出
         if stream:
             # 流式输出
-            def stream_wrapper():
-                # response 是一个 generator
-                for chunk in response:
-                    cleaned_chunk = clean_markdown(chunk)
-                    if self.verbose:
-                        print(cleaned_chunk, end='', flush=True)
-                    yield cleaned_chunk
-                if self.verbose:
-                    print("\n")
-            return stream_wrapper()
+            return _started(self._clean_stream(question, reading, response, stats,
+                                               start, profile, echo=self.verbose,
+                                               cacheable=cached is None and not fallback,
+                                               capture=capture,
+                                               outcome="fallback" if fallback else "cached" if cached is not None else "ok"))
         else:
             # 一次性输出
-            cleaned_response = clean_markdown(response)
+            with self.metrics.timer("clean_markdown"):
+                cleaned_response = clean_markdown(response)
+            profile.stage("clean_markdown")
+            profile.finish()
+            self.metrics.observe_generation(stats)
+            if not cleaned_response.startswith("错误:"):
+                if cached is None and not fallback:
+                    self._store_cached(question, reading, cleaned_response)
+                self._record_history(question, reading, cleaned_response,
+                                     (time.perf_counter() - start) * 1000)
             if self.verbose:
                 print(cleaned_response)
                 print("\n" + "="*60)
+            if capture is not None:
+                capture.finish("error" if cleaned_response.startswith("错误:") else "fallback" if fallback
+                               else "cached" if cached is not None else "ok")
             return cleaned_response
     
     def quick_divine(self, question=""):
@@ -207,6 +858,33 @@ class IChing:
 
 def main():
     """主函数 - 命令行交互"""
+    import argparse
+
+    from warmup import keep_alive_arg
+
+    parser = argparse.ArgumentParser(description="周易占卜系统")
+    parser.add_argument("--profile-dir", help="启用请求剖析，报告写入该目录")
+    parser.add_argument("--profile-every", type=int, default=1, help="每 N 次占卜剖析一次 (默认: 1)")
+    parser.add_argument("--pregenerated", help="预生成解卦文件，不指定问题时直接使用")
+    parser.add_argument("--keep-alive", type=keep_alive_arg, default="30m",
+                        help="模型在 Ollama 中的驻留时长，如 30m、3600、-1 (默认: 30m)")
+    parser.add_argument("--preload-prompt", action="store_true", help="预热时预先评估系统提示词")
+    parser.add_argument("--no-warmup", action="store_true", help="启动时不预热模型")
+    parser.add_argument("--capture", help="将占卜请求与上游 token 时序追加到该文件 (见 traffic_replay.py)")
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile_dir:
+        profiler = RequestProfiler(directory=args.profile_dir, every=args.profile_every)
+    pregenerated = None
+    if args.pregenerated:
+        from pregenerated import PregeneratedStore
+        pregenerated = PregeneratedStore(args.pregenerated)
+    recorder = None
+    if args.capture:
+        from traffic_capture import TrafficRecorder
+        recorder = TrafficRecorder(args.capture)
+
     print("\n" + "="*60)
     print("           周 易 占 卜 系 统")
     print("="*60)
@@ -217,7 +895,10 @@ def main():
         ollama_url="http://localhost:11434",
         model="FortuneQwen3_q8:4b",
         verbose=True,
-        concise=True  # 默认使用精简模式，可改为False使用详细模式
+        concise=True,  # 默认使用精简模式，可改为False使用详细模式
+        profiler=profiler,
+        pregenerated=pregenerated,
+        recorder=recorder
     )
     
     # 检查连接
@@ -232,9 +913,25 @@ def main():
     print(f"✓ 已连接到Ollama服务")
     print(f"✓ 使用模型: {iching.ollama.model}")
     
+    # 用户输入问题的同时在后台预热模型
+    warmup_result = {}
+    warmup_thread = None
+    if not args.no_warmup:
+        import threading
+
+        def warm():
+            warmup_result.update(iching.warm_up(args.keep_alive, preload_prompt=args.preload_prompt))
+
+        warmup_thread = threading.Thread(target=warm, daemon=True)
+        warmup_thread.start()
+    
     # 获取问题
     print("\n" + "-"*60)
     question = input("请输入您的占卜问题（直接回车则不指定问题）: ").strip()
+    if warmup_thread is not None:
+        warmup_thread.join()
+        if warmup_result.get('error'):
+            print(f"警告: {warmup_result['error']}")
     
     # 执行占卜
     print("\n" + "="*60)
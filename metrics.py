@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+性能指标模块
+Metrics
+
+在进程内以直方图记录占卜各阶段耗时与生成速度，并以 Prometheus 文本格式导出。
+未启用时使用 NULL_METRICS，所有调用均为空操作，开销可忽略。
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+
+# 阶段耗时直方图的默认分桶（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# 生成速度直方图的默认分桶（token/秒）
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 400)
+
+# 指标定义：名称 -> (说明, 标签名, 分桶)
+METRIC_DEFINITIONS = {
+    "iching_stage_seconds": ("占卜各阶段耗时", "stage", LATENCY_BUCKETS),
+    "iching_generation_tokens_per_second": ("模型生成速度 (eval_count / eval_duration)", None, RATE_BUCKETS),
+    "iching_generation_tokens": ("单次生成的 token 数", None, (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)),
+}
+
+
+class Histogram:
+    """累积分桶直方图（线程安全）"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """记录一个观测值"""
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """返回 (累积计数列表, 总和, 总数)"""
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative = []
+        running = 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative, total, count
+
+
+class _Timer:
+    """计时上下文管理器，退出时将耗时记入 iching_stage_seconds"""
+
+    __slots__ = ("registry", "stage", "start")
+
+    def __init__(self, registry, stage):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe_stage(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    enabled = True
+
+    def __init__(self, definitions=None):
+        """
+        Args:
+            definitions: 指标定义，默认 METRIC_DEFINITIONS
+        """
+        self.definitions = dict(definitions or METRIC_DEFINITIONS)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, name, label_value):
+        key = (name, label_value)
+        hist = self._histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.get(key)
+                if hist is None:
+                    hist = Histogram(self.definitions[name][2])
+                    self._histograms[key] = hist
+        return hist
+
+    def observe(self, name, value, label_value=None):
+        """
+        记录观测值
+
+        Args:
+            name: 指标名称（需在 definitions 中定义）
+            value: 观测值
+            label_value: 指标标签值（如阶段名），无标签指标为None
+        """
+        self._histogram(name, label_value).observe(value)
+
+    def observe_stage(self, stage, seconds):
+        """记录某阶段耗时（秒）"""
+        self._histogram("iching_stage_seconds", stage).observe(seconds)
+
+    def timer(self, stage):
+        """
+        阶段计时上下文管理器
+
+        用法:
+            with metrics.timer("simulate"):
+                ...
+        """
+        return _Timer(self, stage)
+
+    def observe_generation(self, stats):
+        """
+        根据 Ollama 最终 done 数据块中的统计字段记录生成速度
+
+        Args:
+            stats: 包含 eval_count / eval_duration (纳秒) 的字典
+        """
+        eval_count = stats.get('eval_count')
+        eval_duration = stats.get('eval_duration')
+        if eval_count:
+            self.observe("iching_generation_tokens", eval_count)
+            if eval_duration:
+                self.observe("iching_generation_tokens_per_second",
+                             eval_count / (eval_duration / 1e9))
+
+    def render(self):
+        """
+        以 Prometheus 文本格式导出全部指标
+
+        Returns:
+            str: exposition 文本
+        """
+        with self._lock:
+            items = sorted(self._histograms.items(), key=lambda kv: (kv[0][0], kv[0][1] or ""))
+
+        lines = []
+        current = None
+        for (name, label_value), hist in items:
+            help_text, label_name, _ = self.definitions[name]
+            if name != current:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                current = name
+            base = f'{label_name}="{label_value}",' if label_name else ""
+            cumulative, total, count = hist.snapshot()
+            for bound, c in zip(hist.buckets, cumulative):
+                lines.append(f'{name}_bucket{{{base}le="{bound}"}} {c}')
+            lines.append(f'{name}_bucket{{{base}le="+Inf"}} {cumulative[-1]}')
+            suffix = f"{{{base.rstrip(',')}}}" if base else ""
+            lines.append(f"{name}_sum{suffix} {total}")
+            lines.append(f"{name}_count{suffix} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class _NullTimer:
+    """空计时器"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class NullMetrics:
+    """未启用指标时使用的空实现"""
+
+    enabled = False
+    _timer = _NullTimer()
+
+    def observe(self, name, value, label_value=None):
+        pass
+
+    def observe_stage(self, stage, seconds):
+        pass
+
+    def timer(self, stage):
+        return self._timer
+
+    def observe_generation(self, stats):
+        pass
+
+    def render(self):
+        return ""
+
+
+NULL_METRICS = NullMetrics()
+
+
+def start_http_server(registry, port=9464, host="0.0.0.0"):
+    """
+    在后台线程中启动 /metrics 导出服务
+
+    Args:
+        registry: MetricsRegistry 实例
+        port: 监听端口
+        host: 监听地址
+
+    Returns:
+        ThreadingHTTPServer: 服务器对象，可调用 shutdown() 停止
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -6,27 +6,83 @@ Ollama Client
 负责与本地部署的Ollama服务通信，发送prompt并获取AI生成的算命结果
 """
 
-import requests
 import json
+import re
+import time
 from typing import Optional, Generator
 
 
+# Ollama 在最终 done 数据块（或非流式响应）中附带的统计字段
+STATS_FIELDS = ("total_duration", "load_duration", "prompt_eval_count",
+                "prompt_eval_duration", "eval_count", "eval_duration")
+
+# 未指定截止时间时的请求超时（秒）
+DEFAULT_TIMEOUT = 120
+CONNECT_TIMEOUT = 5
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class DeadlineExceeded(Exception):
+    """在截止时间前未能完成生成"""
+
+
+def keep_alive_seconds(keep_alive):
+    """
+    将 Ollama 的 keep_alive 取值换算为秒
+
+    Args:
+        keep_alive: 秒数，或 "30m"、"1h30m" 等时长字符串；负数表示常驻
+
+    Returns:
+        float: 秒数，常驻时为 inf，未指定 (None) 时返回None
+
+    Raises:
+        ValueError: 无法解析的取值
+    """
+    if keep_alive is None:
+        return None
+    if isinstance(keep_alive, (int, float)):
+        seconds = float(keep_alive)
+    else:
+        text = str(keep_alive).strip()
+        try:
+            seconds = float(text)
+        except ValueError:
+            sign = -1 if text.startswith("-") else 1
+            body = text.lstrip("+-")
+            parts = _DURATION_PART.findall(body)
+            if not parts or "".join(n + u for n, u in parts) != body:
+                raise ValueError(f"无法解析的 keep_alive: {keep_alive!r}")
+            seconds = sign * sum(float(n) * _DURATION_UNITS[u] for n, u in parts)
+    return float("inf") if seconds < 0 else seconds
+
+
 class OllamaClient:
     """Ollama API客户端"""
     
-    def __init__(self, base_url="http://localhost:11434", model="FortuneQwen3_q8:4b"):
+    def __init__(self, base_url="http://localhost:11434", model="FortuneQwen3_q8:4b",
+                 keep_alive=None):
         """
         初始化Ollama客户端
         
         Args:
             base_url: Ollama服务地址
             model: 使用的模型名称
+            keep_alive: 可选，每次请求后模型在 Ollama 中驻留的时长（如 "30m"、-1），
+                        None 时使用 Ollama 的默认值
         """
         self.base_url = base_url.rstrip('/')
         self.model = model
+        self.keep_alive = keep_alive
         self.api_url = f"{self.base_url}/api/generate"
+        # 最近一次请求模型的时刻 (time.monotonic())，用于判断空闲
+        self.last_request = 0.0
     
-    def generate(self, prompt, system_prompt="", temperature=0.7, stream=False):
+    def generate(self, prompt, system_prompt="", temperature=0.7, stream=False, stats=None,
+                 deadline=None, max_tokens=None, stop=None, capture=None):
         """
         生成AI响应
         
@@ -35,11 +91,23 @@ class OllamaClient:
             system_prompt: 系统提示词
             temperature: 温度参数，控制随机性 (0-1)
             stream: 是否流式输出
+            stats: 可选字典，生成结束后写入 Ollama 返回的统计字段
+                   (eval_count、eval_duration 等，时长单位为纳秒)
+            deadline: 可选的截止时间 (time.monotonic() 时刻)，超过时抛出 DeadlineExceeded
+            max_tokens: 可选的最大生成 token 数 (options.num_predict)
+            stop: 可选的停止序列列表 (options.stop)
+            capture: 可选的 traffic_capture.Exchange，记录请求与各数据块的到达时刻
             
         Returns:
             str: AI生成的文本 (非流式)
-            Generator: 生成器对象 (流式)
+            Generator: 生成器对象 (流式)，关闭生成器会立即断开与 Ollama 的连接
+
+        Raises:
+            DeadlineExceeded: 截止时间已过 (流式时在迭代过程中抛出)
         """
+        # requests 导入较慢，延迟到首次请求时再导入
+        import requests
+
         payload = {
             "model": self.model,
             "prompt": prompt,
@@ -47,41 +115,125 @@ class OllamaClient:
             "temperature": temperature,
             "stream": stream
         }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        options = {}
+        if max_tokens:
+            options["num_predict"] = max_tokens
+        if stop:
+            options["stop"] = list(stop)
+        if options:
+            payload["options"] = options
+        self.last_request = time.monotonic()
         
         try:
             if stream:
-                return self._stream_generate(payload)
+                return self._stream_generate(payload, stats, deadline, capture)
             else:
-                return self._sync_generate(payload)
+                return self._sync_generate(payload, stats, deadline, capture)
+        except DeadlineExceeded:
+            raise
         except requests.exceptions.ConnectionError:
             return f"错误: 无法连接到Ollama服务 ({self.base_url})，请确保Ollama正在运行。"
         except Exception as e:
             return f"错误: {str(e)}"
     
-    def _sync_generate(self, payload):
+    def _sync_generate(self, payload, stats=None, deadline=None, capture=None):
         """同步生成"""
-        response = requests.post(self.api_url, json=payload, timeout=120)
+        import requests
+
+        if capture is not None:
+            capture.request(payload)
+        try:
+            response = requests.post(self.api_url, json=payload, timeout=_timeout(deadline))
+        except requests.exceptions.Timeout as e:
+            if deadline is not None:
+                raise DeadlineExceeded("生成超时") from e
+            raise
         response.raise_for_status()
         
         result = response.json()
+        if stats is not None:
+            _collect_stats(result, stats)
+        if capture is not None:
+            capture.token(result.get('response', ''))
+            capture.done(_collect_stats(result, {}))
         return result.get('response', '')
     
-    def _stream_generate(self, payload):
-        """流式生成"""
-        response = requests.post(self.api_url, json=payload, stream=True, timeout=120)
-        response.raise_for_status()
-        
-        for line in response.iter_lines():
-            if line:
-                try:
-                    chunk = json.loads(line.decode('utf-8'))
-                    if 'response' in chunk:
-                        yield chunk['response']
-                    if chunk.get('done', False):
-                        break
-                except json.JSONDecodeError:
-                    continue
+    def _stream_generate(self, payload, stats=None, deadline=None, capture=None):
+        """
+        流式生成
+
+        读超时取剩余时间，每收到一块再检查一次截止时间；
+        生成器被关闭（消费方不再读取）或超时时立即关闭连接，Ollama 随之停止生成。
+        """
+        import requests
+
+        if capture is not None:
+            capture.request(payload)
+        try:
+            response = requests.post(self.api_url, json=payload, stream=True,
+                                     timeout=_timeout(deadline))
+            response.raise_for_status()
+            try:
+                for line in response.iter_lines():
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise DeadlineExceeded("生成超时")
+                    if line:
+                        try:
+                            chunk = json.loads(line.decode('utf-8'))
+                            if 'response' in chunk:
+                                if capture is not None and chunk['response']:
+                                    capture.token(chunk['response'])
+                                yield chunk['response']
+                            if chunk.get('done', False):
+                                if stats is not None:
+                                    _collect_stats(chunk, stats)
+                                if capture is not None:
+                                    capture.done(_collect_stats(chunk, {}))
+                                break
+                        except json.JSONDecodeError:
+                            continue
+            finally:
+                response.close()
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            # 流式读取中的超时可能表现为 ConnectionError (urllib3 ReadTimeoutError)
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded("生成超时") from e
+            raise
     
+    def load(self, keep_alive=None, stats=None):
+        """
+        加载模型而不生成（空 prompt 请求），并刷新其驻留时长
+
+        Args:
+            keep_alive: 驻留时长，None 时使用实例的 keep_alive；0 表示立即卸载
+            stats: 可选字典，写入 Ollama 返回的统计字段 (load_duration 等)
+
+        Returns:
+            bool: 是否成功
+        """
+        import requests
+
+        payload = {"model": self.model, "prompt": "", "stream": False}
+        keep_alive = self.keep_alive if keep_alive is None else keep_alive
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        self.last_request = time.monotonic()
+        try:
+            response = requests.post(self.api_url, json=payload,
+                                     timeout=(CONNECT_TIMEOUT, DEFAULT_TIMEOUT))
+            response.raise_for_status()
+            if stats is not None:
+                _collect_stats(response.json(), stats)
+            return True
+        except Exception:
+            return False
+
+    def unload(self):
+        """从 Ollama 中卸载模型"""
+        return self.load(keep_alive=0)
+
     def check_connection(self):
         """
         检查Ollama服务是否可用
@@ -89,6 +241,8 @@ class OllamaClient:
         Returns:
             bool: 是否连接成功
         """
+        import requests
+
         try:
             response = requests.get(f"{self.base_url}/api/tags", timeout=5)
             return response.status_code == 200
@@ -102,6 +256,8 @@ class OllamaClient:
         Returns:
             list: 模型名称列表
         """
+        import requests
+
         try:
             response = requests.get(f"{self.base_url}/api/tags", timeout=5)
             response.raise_for_status()
@@ -111,6 +267,29 @@ class OllamaClient:
             return []
 
 
+def _timeout(deadline):
+    """
+    由截止时间计算 requests 的 (连接, 读取) 超时
+
+    Raises:
+        DeadlineExceeded: 截止时间已过
+    """
+    if deadline is None:
+        return (CONNECT_TIMEOUT, DEFAULT_TIMEOUT)
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("生成超时")
+    return (min(CONNECT_TIMEOUT, remaining), remaining)
+
+
+def _collect_stats(chunk, stats):
+    """从响应数据块中提取统计字段，返回 stats"""
+    for key in STATS_FIELDS:
+        if key in chunk:
+            stats[key] = chunk[key]
+    return stats
+
+
 if __name__ == "__main__":
     # 测试代码
     client = OllamaClient(model="FortuneQwen3_q8:4b")
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+合并写出模块
+Coalescing Output Sink
+
+逐 token 调用 print(..., flush=True) 或逐事件写套接字时，每个数据块都是一次系统调用。
+OutputSink 将写入先放入缓冲区，满足任一条件时才写出到底层流：
+- 距缓冲区中最早的数据已过 interval（默认 30 ms）；
+- 缓冲数据达到 max_buffer（默认 4096，str 按字符计，bytes 按字节计）；
+- 首个数据块，或调用方显式要求刷新。
+首个数据块立即写出，因此首 token 的感知延迟不变。
+
+到期的数据通常在写入方下一次 write() 时由写入线程写出；写入方在到期前没有新数据
+（例如等待模型）时，由该输出自己的计时线程写出。各输出互不共享线程，
+一个客户端接收缓慢只会阻塞它自己的输出。
+
+CLI 流式输出、SSE 事件与批处理结果共用此实现。
+"""
+
+import threading
+import time
+
+
+DEFAULT_INTERVAL = 0.03
+DEFAULT_MAX_BUFFER = 4096
+
+
+class OutputSink:
+    """
+    按时间与大小合并写出的输出（线程安全）
+
+    底层流需提供 write()，flush() 可选；写入的数据须与流的类型一致 (str / bytes)。
+    计时线程写出时发生的错误（如客户端断开）会在下一次 write()/flush()/close() 时抛出。
+    """
+
+    def __init__(self, stream, interval=DEFAULT_INTERVAL, max_buffer=DEFAULT_MAX_BUFFER):
+        """
+        Args:
+            stream: 底层输出流
+            interval: 最长合并时间（秒）
+            max_buffer: 缓冲上限，达到即写出
+        """
+        self.stream = stream
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self.writes = 0         # 对底层流的写出次数
+        self.closed = False
+
+        self._parts = []
+        self._size = 0
+        self._first = True
+        self._due = None        # 缓冲区最早数据的写出时刻
+        self._error = None
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._timer = None      # 本输出的计时线程，首次需要延迟写出时启动
+
+    def write(self, data, flush=False):
+        """
+        写入数据
+
+        Args:
+            data: str 或 bytes
+            flush: 是否立即写出（用于控制类事件，不计为首个数据块）
+        """
+        if not data:
+            return
+        with self._lock:
+            self._check()
+            self._parts.append(data)
+            self._size += len(data)
+            if (flush or self._first or self._size >= self.max_buffer
+                    or (self._due is not None and time.monotonic() >= self._due)):
+                if not flush:
+                    self._first = False
+                self._flush_locked()
+            elif self._due is None:
+                self._due = time.monotonic() + self.interval
+                if self._timer is None:
+                    self._timer = threading.Thread(target=self._run_timer, name="output-sink-timer",
+                                                   daemon=True)
+                    self._timer.start()
+                else:
+                    self._cond.notify()
+
+    def flush(self):
+        """立即写出缓冲区"""
+        with self._lock:
+            self._check()
+            self._flush_locked()
+
+    def close(self):
+        """写出剩余数据（不关闭底层流）"""
+        with self._lock:
+            if self.closed:
+                return
+            self._check()
+            self._flush_locked()
+            self.closed = True
+            self._cond.notify()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _check(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        if self.closed:
+            raise ValueError("输出已关闭")
+
+    def _flush_locked(self):
+        self._due = None
+        if not self._parts:
+            return
+        data = self._parts[0][:0].join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        self.stream.write(data)
+        flush = getattr(self.stream, "flush", None)
+        if flush is not None:
+            flush()
+        self.writes += 1
+
+    def _run_timer(self):
+        """计时线程：写入方到期未再写入时写出缓冲区，输出关闭或出错后退出"""
+        with self._cond:
+            while not self.closed and self._error is None:
+                if self._due is None:
+                    self._cond.wait()
+                    continue
+                delay = self._due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                try:
+                    self._flush_locked()
+                except Exception as e:
+                    # 交给写入方的线程处理，丢弃无法写出的数据
+                    self._error = e
+                    self._parts.clear()
+                    self._size = 0
+
+
+if __name__ == "__main__":
+    import io
+    import sys
+
+    class CountingStream(io.StringIO):
+        def __init__(self):
+            super().__init__()
+            self.syscalls = 0
+
+        def flush(self):
+            self.syscalls += 1
+
+    # 模拟 80 token/s 的流式输出 1 秒
+    tokens = ["卦", "象", "显", "示", "，"] * 16
+    for label, sink_factory in (("逐块 flush", None), ("OutputSink", OutputSink)):
+        stream = CountingStream()
+        sink = sink_factory(stream) if sink_factory else None
+        first_latency = None
+        start = time.perf_counter()
+        for token in tokens:
+            if sink is None:
+                stream.write(token)
+                stream.flush()
+            else:
+                sink.write(token)
+            if first_latency is None:
+                first_latency = stream.syscalls and time.perf_counter() - start
+            time.sleep(1 / 80)
+        if sink is not None:
+            sink.close()
+        assert stream.getvalue() == "".join(tokens)
+        print(f"{label:12}: {len(tokens)} 个 token -> {stream.syscalls} 次写出，"
+              f"首 token 写出延迟 {first_latency * 1000:.2f} ms", file=sys.stderr)
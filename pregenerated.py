@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+通占解卦预生成模块
+Pregenerated Interpretations
+
+问题为空时 prompt 只取决于爻象，最多只有 4096 种。本模块离线地为每种爻象
+（可选多个变体）预先生成解卦文本，存入紧凑的索引文件，请求时直接返回并轮换变体。
+
+文件格式（小端）:
+    魔数 b"ICPG" | 版本 u16 | 变体数 u16
+    偏移表 u32 × (4096 × 变体数 + 1)，第 i 项为条目 i 在正文区的起始偏移
+    正文区：UTF-8 文本依次拼接（空条目长度为 0）
+条目编号 = 爻象编号 × 变体数 + 变体序号。
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from dayan_divination import LINE_STATE_COUNT, index_to_line_state, line_state_to_index
+
+
+MAGIC = b"ICPG"
+VERSION = 1
+_HEADER = struct.Struct("<4sHH")
+
+
+def write_store(path, entries, variants):
+    """
+    写出预生成文件（先写临时文件再原子替换）
+
+    Args:
+        path: 输出路径
+        entries: {(爻象编号, 变体序号): 文本}
+        variants: 每种爻象的变体数
+    """
+    count = LINE_STATE_COUNT * variants
+    offsets = array("I", [0]) * (count + 1)
+    blobs = []
+    position = 0
+    for slot in range(count):
+        offsets[slot] = position
+        text = entries.get(divmod(slot, variants))
+        if text:
+            data = text.encode("utf-8")
+            blobs.append(data)
+            position += len(data)
+    offsets[count] = position
+    if offsets.itemsize != 4:
+        raise RuntimeError("当前平台的 array('I') 不是 32 位")
+    if sys.byteorder != "little":
+        offsets.byteswap()
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, variants))
+        f.write(offsets.tobytes())
+        for data in blobs:
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+class PregeneratedStore:
+    """
+    预生成解卦文本（只读，基于 mmap，fork 后的工作进程可共享页面）
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: 预生成文件路径
+
+        Raises:
+            ValueError: 文件格式不正确
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, variants = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"不是有效的预生成文件: {path}")
+        self.variants = variants
+        count = LINE_STATE_COUNT * variants
+        self._offsets = struct.unpack_from(f"<{count + 1}I", self._mm, _HEADER.size)
+        self._base = _HEADER.size + 4 * (count + 1)
+        # 各爻象的轮换计数
+        self._turns = [0] * LINE_STATE_COUNT
+        self._lock = threading.Lock()
+
+    def get_variant(self, state_index, variant):
+        """
+        读取指定爻象的指定变体
+
+        Returns:
+            str: 解卦文本，不存在时返回None
+        """
+        slot = state_index * self.variants + variant
+        start, end = self._offsets[slot], self._offsets[slot + 1]
+        if start == end:
+            return None
+        return self._mm[self._base + start:self._base + end].decode("utf-8")
+
+    def get(self, lines):
+        """
+        获取某爻象的解卦文本，多次调用时在已有变体间轮换
+
+        Args:
+            lines: 六爻爻值列表（初爻在前）
+
+        Returns:
+            str: 解卦文本，未预生成时返回None
+        """
+        state_index = line_state_to_index(lines)
+        with self._lock:
+            turn = self._turns[state_index]
+            self._turns[state_index] = turn + 1
+        for i in range(self.variants):
+            text = self.get_variant(state_index, (turn + i) % self.variants)
+            if text is not None:
+                return text
+        return None
+
+    def coverage(self):
+        """返回已生成的条目数"""
+        return sum(1 for i in range(len(self._offsets) - 1)
+                   if self._offsets[i] != self._offsets[i + 1])
+
+    def close(self):
+        self._mm.close()
+
+
+def pregenerate(iching, path, variants=1, parallelism=4, resume=False, progress=None):
+    """
+    离线预生成全部爻象的通占解卦
+
+    生成结果先逐条追加到 "<path>.partial"，中断后可续跑；全部完成后编译为索引文件。
+
+    Args:
+        iching: IChing 实例（verbose=False）
+        path: 输出文件路径
+        variants: 每种爻象生成的变体数
+        parallelism: 同时进行的AI请求数
+        resume: 是否从 .partial 续跑
+        progress: 可选回调 (已完成数, 总数)
+
+    Returns:
+        tuple: (成功条数, 失败条数)
+    """
+    from main import clean_markdown
+    from scheduler import BATCH
+
+    partial_path = f"{path}.partial"
+    entries = {}
+    if resume and os.path.exists(partial_path):
+        with open(partial_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 崩溃时写了一半的行
+                entries[(item["state"], item["variant"])] = item["text"]
+
+    tasks = [(state, variant) for state in range(LINE_STATE_COUNT)
+             for variant in range(variants) if (state, variant) not in entries]
+    total = LINE_STATE_COUNT * variants
+    failed = 0
+
+    def run(task):
+        state, variant = task
+        reading = iching.prepare(lines=index_to_line_state(state))
+        # 与在线占卜相同的长度上限与停止序列，并以批量优先级排队
+        text = iching._generate(reading, False, {}, None, priority=BATCH)
+        return task, text
+
+    with open(partial_path, "a", encoding="utf-8") as partial, \
+            ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+        for task, text in pool.map(run, tasks):
+            if text.startswith("错误:"):
+                failed += 1
+                continue
+            text = clean_markdown(text)
+            entries[task] = text
+            partial.write(json.dumps({"state": task[0], "variant": task[1], "text": text},
+                                     ensure_ascii=False) + "\n")
+            partial.flush()
+            if progress:
+                progress(len(entries), total)
+
+    write_store(path, entries, variants)
+    if failed == 0:
+        os.remove(partial_path)
+    return len(entries), failed
+
+
+def main():
+    """命令行入口"""
+    import argparse
+
+    from main import IChing
+
+    parser = argparse.ArgumentParser(description="离线预生成通占解卦")
+    parser.add_argument("-o", "--output", default="pregenerated.bin", help="输出文件")
+    parser.add_argument("--variants", type=int, default=1, help="每种爻象的变体数 (默认: 1)")
+    parser.add_argument("-j", "--parallelism", type=int, default=4, help="并发请求数 (默认: 4)")
+    parser.add_argument("--resume", action="store_true", help="从中断处续跑")
+    parser.add_argument("--url", default="http://localhost:11434", help="Ollama服务地址")
+    parser.add_argument("--model", default="FortuneQwen3_q8:4b", help="使用的AI模型")
+    args = parser.parse_args()
+
+    iching = IChing(ollama_url=args.url, model=args.model, verbose=False, concise=True)
+    if not iching.ollama.check_connection():
+        print("错误: 无法连接到Ollama服务")
+        return
+
+    start = time.perf_counter()
+
+    def progress(done, total):
+        if done % 64 == 0 or done == total:
+            print(f"\r已生成 {done}/{total}", end="", flush=True)
+
+    done, failed = pregenerate(iching, args.output, variants=args.variants,
+                               parallelism=args.parallelism, resume=args.resume,
+                               progress=progress)
+    print(f"\n完成 {done} 条，失败 {failed} 条，耗时 {time.perf_counter() - start:.1f} 秒")
+    if failed:
+        print("存在失败条目，可使用 --resume 重新生成缺失部分")
+
+
+if __name__ == "__main__":
+    main()
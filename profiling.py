@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+请求级性能剖析模块
+Request Profiling
+
+按 1/N 的比例抽样占卜请求，用 cProfile 与 tracemalloc 记录 CPU 热点函数、
+内存分配位置与峰值内存，并附带各阶段边界，写入本地目录，
+便于在真实流量下定位 clean_markdown、prompt 构建与流式解析的性能回退。
+"""
+
+import io
+import itertools
+import os
+import threading
+import time
+
+
+class ProfileSession:
+    """一次被抽样请求的剖析会话"""
+
+    def __init__(self, profiler, request_id):
+        # cProfile / tracemalloc 仅在抽中时导入，不影响未启用剖析时的启动速度
+        import cProfile
+        import tracemalloc
+
+        self.profiler = profiler
+        self.request_id = request_id
+        self.stages = []
+        self._tracemalloc = tracemalloc
+        self._cprofile = cProfile.Profile()
+        self._owns_tracemalloc = not tracemalloc.is_tracing()
+        self._finished = False
+
+        if self._owns_tracemalloc:
+            tracemalloc.start(profiler.traceback_depth)
+        tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        self._cprofile.enable()
+
+    def stage(self, name):
+        """记录阶段边界（相对开始时间与当前已分配内存）"""
+        current, _ = self._tracemalloc.get_traced_memory()
+        self.stages.append((name, time.perf_counter() - self._start, current))
+
+    def finish(self):
+        """停止剖析并写出报告"""
+        tracemalloc = self._tracemalloc
+        if self._finished:
+            return
+        self._finished = True
+        self._cprofile.disable()
+        elapsed = time.perf_counter() - self._start
+        try:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+            self.profiler._release()
+        self.profiler._write_report(self, elapsed, snapshot, peak)
+
+
+class _NullSession:
+    """未抽中时使用的空会话"""
+
+    request_id = None
+
+    def stage(self, name):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_SESSION = _NullSession()
+
+
+class RequestProfiler:
+    """请求抽样剖析器"""
+
+    def __init__(self, directory="profiles", every=100, top=30, traceback_depth=10):
+        """
+        初始化剖析器
+
+        Args:
+            directory: 报告输出目录
+            every: 每 N 个请求剖析一次（1 表示每次都剖析）
+            top: 报告中列出的热点函数 / 分配位置数量
+            traceback_depth: tracemalloc 记录的调用栈深度
+        """
+        self.directory = directory
+        self.every = max(1, every)
+        self.top = top
+        self.traceback_depth = traceback_depth
+        self._counter = itertools.count()
+        # tracemalloc 为进程级，同一时间只剖析一个请求
+        self._busy = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        """
+        开始一个请求；抽中时返回 ProfileSession，否则返回 NULL_SESSION
+
+        Returns:
+            ProfileSession | _NullSession
+        """
+        seq = next(self._counter)
+        if seq % self.every != 0 or not self._busy.acquire(blocking=False):
+            return NULL_SESSION
+        request_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{seq}"
+        try:
+            return ProfileSession(self, request_id)
+        except Exception:
+            self._busy.release()
+            raise
+
+    def _release(self):
+        self._busy.release()
+
+    def _write_report(self, session, elapsed, snapshot, peak):
+        """写出文本报告与 pstats 原始数据"""
+        import pstats
+        import tracemalloc
+
+        base = os.path.join(self.directory, session.request_id)
+        session._cprofile.dump_stats(f"{base}.prof")
+
+        out = io.StringIO()
+        out.write(f"请求: {session.request_id}\n")
+        out.write(f"总耗时: {elapsed * 1000:.2f} ms\n")
+        out.write(f"峰值内存: {peak / 1024:.1f} KiB\n\n")
+
+        out.write("== 阶段边界 ==\n")
+        previous = 0.0
+        for name, offset, current in session.stages:
+            out.write(f"{offset * 1000:10.2f} ms  (+{(offset - previous) * 1000:8.2f} ms)  "
+                      f"{current / 1024:10.1f} KiB  {name}\n")
+            previous = offset
+
+        out.write(f"\n== CPU 热点 (按累计耗时前 {self.top}) ==\n")
+        stats = pstats.Stats(session._cprofile, stream=out)
+        stats.sort_stats("cumulative").print_stats(self.top)
+
+        out.write(f"\n== 内存分配位置 (前 {self.top}) ==\n")
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        for stat in snapshot.statistics("lineno")[:self.top]:
+            out.write(f"{stat}\n")
+
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
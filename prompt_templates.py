@@ -6,6 +6,8 @@ Prompt Templates
 包含用于周易占卜的prompt模板
 """
 
+import re
+
 
 class PromptTemplates:
     """Prompt模板集合"""
@@ -39,6 +41,41 @@ class PromptTemplates:
 请写成一段完整、连贯的话，不要分段，不要使用数字序号。内容必须包含：导致上述结论的具体原因分析，并直接引用周易原文中的关键句子作为佐证。请将原文引用自然地融入到你的分析中（例如：“依据卦辞中‘xxx’的描述，说明了……”），让原因和依据浑然一体。
 """
     
+    # 精简模式的生成上限：一句结论 + 一段原因，正常输出约 300-500 token
+    MAX_TOKENS_CONCISE = 768
+    # 模型在两部分之后继续编号或另起分隔线时停止
+    STOP_SEQUENCES_CONCISE = ("\n三、", "\n---")
+    
+    # 多问题模式：同一卦象下的多个问题合并为一次请求，卦象原文只需评估一次。
+    # 卦象原文放在问题之前，使同一卦象的请求共享尽可能长的前缀
+    MULTI_QUESTION_TEMPLATE_CONCISE = """【起卦结果】
+{hexagram_info}
+
+【周易原文】
+{hexagram_texts}
+
+【占卜问题】
+{questions}
+
+---
+
+以上{count}个问题基于同一卦象，请逐一作答，不要使用markdown格式。
+每个回答以单独一行的“【问题N】”开头（N为问题编号），随后严格按照以下格式：
+
+一、结论
+一句话直击重点，给出该问题的最终结论（能成/不能成/具体情况）。
+
+二、原因
+请写成一段完整、连贯的话，不要分段，不要使用数字序号。内容必须包含：导致上述结论的具体原因分析，并直接引用周易原文中的关键句子作为佐证，让原因和依据浑然一体。
+"""
+    
+    # 模型超时时在本地生成的参考解读
+    FALLBACK_TEMPLATE = """一、结论
+{hexagram_summary}。{interpretation_guide}（AI解卦超时，以下为依据周易原文的参考解读。）
+
+二、原因
+{hexagram_texts}"""
+    
     @staticmethod
     def build_divination_prompt(question, hexagram_info, interpretation_guide, 
                                original_text, changed_text="", concise=False):
@@ -56,10 +93,7 @@ class PromptTemplates:
         Returns:
             tuple: (user_prompt, system_prompt)
         """
-        # 组合卦象文本
-        hexagram_texts = original_text
-        if changed_text:
-            hexagram_texts += f"\n\n{'='*50}\n【之卦】\n{changed_text}"
+        hexagram_texts = PromptTemplates._hexagram_texts(original_text, changed_text)
         
         # 强制使用精简模板和系统提示词
         template = PromptTemplates.DIVINATION_TEMPLATE_CONCISE
@@ -72,6 +106,204 @@ class PromptTemplates:
         )
         
         return prompt, system_prompt
+    
+    @staticmethod
+    def _hexagram_texts(original_text, changed_text=""):
+        """组合本卦与之卦文本"""
+        hexagram_texts = original_text
+        if changed_text:
+            hexagram_texts += f"\n\n{'='*50}\n【之卦】\n{changed_text}"
+        return hexagram_texts
+    
+    @staticmethod
+    def build_multi_question_prompt(questions, hexagram_info, original_text, changed_text=""):
+        """
+        构建多问题占卜prompt（同一卦象下的 K 个问题）
+        
+        Args:
+            questions: 问题列表
+            hexagram_info: 卦象基本信息
+            original_text: 本卦文本
+            changed_text: 之卦文本（可选）
+            
+        Returns:
+            tuple: (user_prompt, system_prompt)，回答可用 MultiAnswerSplitter 拆分
+        """
+        numbered = "\n".join(
+            f"问题{i}：{question if question else '无具体问题，请通占'}"
+            for i, question in enumerate(questions, 1)
+        )
+        prompt = PromptTemplates.MULTI_QUESTION_TEMPLATE_CONCISE.format(
+            hexagram_info=hexagram_info,
+            hexagram_texts=PromptTemplates._hexagram_texts(original_text, changed_text),
+            questions=numbered,
+            count=len(questions)
+        )
+        return prompt, PromptTemplates.SYSTEM_PROMPT_CONCISE
+    
+    @staticmethod
+    def multi_question_stop(count):
+        """多问题模式的停止序列：模型自行编出多余的问题时停止"""
+        return (f"【问题{count + 1}】", "\n三、")
+    
+    @staticmethod
+    def build_fallback_reading(hexagram_info, interpretation_guide, original_text, changed_text=""):
+        """
+        构建不依赖模型的参考解读（模型未能在截止时间前完成时使用）
+        
+        Args:
+            hexagram_info: 卦象基本信息
+            interpretation_guide: 解卦指引
+            original_text: 本卦文本
+            changed_text: 之卦文本（可选）
+            
+        Returns:
+            str: 与精简模板两部分格式一致的解读文本
+        """
+        hexagram_texts = original_text.strip()
+        if changed_text:
+            hexagram_texts += f"\n\n【之卦】\n{changed_text.strip()}"
+        return PromptTemplates.FALLBACK_TEMPLATE.format(
+            hexagram_summary="，".join(line.strip() for line in hexagram_info.splitlines() if line.strip()),
+            interpretation_guide=interpretation_guide,
+            hexagram_texts=hexagram_texts
+        )
+
+
+# 回答标记，如“【问题2】”，兼容“问题2：”“**【问题２】**”“[问题 2]”等变体，须位于行首
+_ANSWER_MARKER = re.compile(
+    r"^[ \t]*[*#]*[ \t]*[【\[]?[ \t]*问题[ \t]*([0-9０-９]+)[ \t]*[】\]]?[ \t]*\**[ \t]*[:：]?[ \t]*\n?",
+    re.MULTILINE
+)
+# 回答标记的任意前缀；行尾出现时需等待后续文本才能判断
+_ANSWER_MARKER_PREFIX = re.compile(
+    r"[ \t]*[*#]*[ \t]*[【\[]?[ \t]*(问(题[ \t]*[0-9０-９]*[ \t]*[】\]]?[ \t]*\**[ \t]*[:：]?[ \t]*)?)?"
+)
+
+
+class MultiAnswerSplitter:
+    """
+    多问题回答的流式拆分器
+    
+    逐块喂入模型输出，按行首的“【问题N】”标记拆分为各问题的回答片段。
+    标记可能被切分在两个数据块之间，因此行尾疑似标记开头的少量文本会暂缓输出；
+    首个标记之前的内容被丢弃，若模型完全没有输出标记，则全部视为第 1 个问题的回答。
+    """
+    
+    def __init__(self, count):
+        """
+        Args:
+            count: 问题数量，超出范围的编号不视为标记
+        """
+        self.count = count
+        self._buffer = ""
+        self._line_start = True
+        self._current = None
+        self._fresh = False
+        self._preamble = []
+        self.seen = set()
+    
+    @property
+    def current(self):
+        """正在输出的问题序号（从0开始），尚未出现标记时为None"""
+        return self._current
+    
+    def feed(self, chunk):
+        """
+        喂入一块模型输出
+        
+        Returns:
+            list: [(问题序号(从0开始), 文本片段), ...]
+        """
+        self._buffer += chunk
+        return self._process(final=False)
+    
+    def _process(self, final):
+        out = []
+        pos = 0
+        for match in _ANSWER_MARKER.finditer(self._buffer):
+            if match.start() == 0 and not self._line_start:
+                continue
+            if match.end() == len(self._buffer) and not final:
+                # 标记延伸到缓冲区末尾，可能尚未完整（如“【问题1”之后还有“2】”）
+                self._emit(out, self._buffer[pos:match.start()])
+                self._buffer = self._buffer[match.start():]
+                self._line_start = True
+                return out
+            number = int(match.group(1).translate(_FULLWIDTH_DIGITS))
+            if not 1 <= number <= self.count:
+                continue
+            self._emit(out, self._buffer[pos:match.start()])
+            self._current = number - 1
+            self._fresh = True
+            self.seen.add(self._current)
+            pos = match.end()
+
+        rest = self._buffer[pos:]
+        newline = rest.rfind("\n")
+        tail = rest[newline + 1:]
+        if newline >= 0:
+            tail_at_line_start = True
+        elif pos == 0:
+            tail_at_line_start = self._line_start
+        else:
+            tail_at_line_start = self._buffer[pos - 1] == "\n"
+
+        if tail and tail_at_line_start and not final and _ANSWER_MARKER_PREFIX.fullmatch(tail):
+            self._emit(out, rest[:newline + 1])
+            self._buffer = tail
+            self._line_start = True
+        else:
+            self._emit(out, rest)
+            self._buffer = ""
+            self._line_start = rest.endswith("\n") if rest else tail_at_line_start
+        return out
+    
+    def close(self):
+        """
+        输出结束，返回剩余片段
+        
+        Returns:
+            list: [(问题序号(从0开始), 文本片段), ...]
+        """
+        out = self._process(final=True)
+        if self._current is None and self._preamble:
+            # 模型没有输出任何标记
+            text = "".join(self._preamble).strip()
+            if text:
+                self.seen.add(0)
+                out.append((0, text))
+        return out
+    
+    def _emit(self, out, text):
+        if not text:
+            return
+        if self._current is None:
+            self._preamble.append(text)
+            return
+        if self._fresh:
+            text = text.lstrip()
+            if not text:
+                return
+            self._fresh = False
+        out.append((self._current, text))
+    
+    @staticmethod
+    def split(text, count):
+        """
+        一次性拆分完整输出
+        
+        Returns:
+            list: 各问题的回答文本，缺失的为空字符串
+        """
+        splitter = MultiAnswerSplitter(count)
+        answers = [[] for _ in range(count)]
+        for index, piece in splitter.feed(text) + splitter.close():
+            answers[index].append(piece)
+        return ["".join(parts).strip() for parts in answers]
+
+
+_FULLWIDTH_DIGITS = str.maketrans("０１２３４５６７８９", "0123456789")
 
 
 if __name__ == "__main__":
@@ -88,4 +320,21 @@ if __name__ == "__main__":
     print(system)
     print("\n" + "="*60)
     print("\n用户提示词:")
-    print(prompt)
\ No newline at end of file
+    print(prompt)
+    print("\n" + "="*60)
+    prompt, _ = PromptTemplates.build_multi_question_prompt(
+        ["事业如何？", "感情如何？"], "乾卦，六爻安静", "乾:元,亨,利,贞。")
+    print("\n多问题提示词:")
+    print(prompt)
+    
+    # 逐字喂入，验证标记被切分时也能正确拆分
+    output = "好的。\n**【问题1】**\n一、结论\n能成。\n\n【问题２】：\n一、结论\n不能成。"
+    splitter = MultiAnswerSplitter(2)
+    pieces = [p for ch in output for p in splitter.feed(ch)] + splitter.close()
+    answers = ["", ""]
+    for index, text in pieces:
+        answers[index] += text
+    print("\n拆分结果:", [a.strip() for a in answers])
+    print("\n" + "="*60)
+    print("\n超时参考解读:")
+    print(PromptTemplates.build_fallback_reading("本卦: 乾卦 (第1卦)", "六爻安静，以本卦卦辞占。", "乾:元,亨,利,贞。"))
\ No newline at end of file
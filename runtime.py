@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+运行时预加载模块
+Runtime Preloading
+
+提供快速启动所需的工具：
+- preload(): 在父进程中一次性导入重量级模块并加载卦象数据、预计算表，
+  之后 fork 的工作进程以写时复制方式共享这些内存页；
+- measure_startup(): 借助 `python -X importtime` 测量导入与启动耗时。
+"""
+
+import gc
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+def preload(data_path="hexagrams_data.json", freeze=True):
+    """
+    预加载运行时（应在 fork 工作进程之前调用）
+
+    Args:
+        data_path: 卦象数据JSON文件路径
+        freeze: 是否调用 gc.freeze()，避免子进程中的垃圾回收触碰共享页
+
+    Returns:
+        HexagramInterpreter: 共享的卦象解释器
+    """
+    import requests  # noqa: F401  预先导入，子进程无需再次导入
+
+    from hexagram_interpreter import HexagramInterpreter
+    from hexagram_renderer import precompute_figures
+
+    interpreter = HexagramInterpreter.shared(data_path)
+    precompute_figures()
+
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    return interpreter
+
+
+def parse_importtime(stderr_text):
+    """
+    解析 `python -X importtime` 的输出
+
+    Args:
+        stderr_text: 子进程的标准错误输出
+
+    Returns:
+        list: [(模块名, 自身耗时us, 累计耗时us), ...]，保持原始顺序
+    """
+    records = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # 表头行
+        records.append((parts[2].rstrip(), int(parts[0]), int(parts[1])))
+    return records
+
+
+def measure_startup(module="main", python=None, top=10):
+    """
+    测量模块导入与 IChing 初始化耗时
+
+    在独立子进程中运行 `python -X importtime`，避免受当前进程已导入模块的影响。
+
+    Args:
+        module: 要导入的模块名
+        python: Python 解释器路径，默认当前解释器
+        top: 报告中列出的最慢顶层导入数量
+
+    Returns:
+        dict: {
+            'import_ms': 导入总耗时,
+            'init_ms': IChing 初始化耗时,
+            'top': [(模块名, 累计耗时ms), ...]
+        }
+    """
+    python = python or sys.executable
+    script = (
+        "import time\n"
+        "t0 = time.perf_counter()\n"
+        f"import {module}\n"
+        "t1 = time.perf_counter()\n"
+        "from main import IChing\n"
+        "IChing(verbose=False)\n"
+        "t2 = time.perf_counter()\n"
+        "print((t1 - t0) * 1000, (t2 - t1) * 1000)\n"
+    )
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", script],
+        capture_output=True, text=True, cwd=str(Path(__file__).parent), check=True
+    )
+    import_ms, init_ms = (float(v) for v in proc.stdout.split())
+
+    # 仅统计顶层导入（缩进最少的行）的累计耗时
+    records = parse_importtime(proc.stderr)
+    top_level = [(name.strip(), cumulative / 1000) for name, _, cumulative in records
+                 if not name.startswith("  ")]
+    top_level.sort(key=lambda item: item[1], reverse=True)
+    return {
+        'import_ms': import_ms,
+        'init_ms': init_ms,
+        'top': top_level[:top],
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="测量导入与启动耗时 (python -X importtime)")
+    parser.add_argument("--module", default="main", help="要测量的模块 (默认: main)")
+    parser.add_argument("--top", type=int, default=10, help="列出最慢的顶层导入数量")
+    args = parser.parse_args()
+
+    report = measure_startup(args.module, top=args.top)
+    print(f"导入 {args.module}: {report['import_ms']:.1f} ms")
+    print(f"IChing 初始化: {report['init_ms']:.1f} ms")
+    print("\n最慢的顶层导入 (累计):")
+    for name, ms in report['top']:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    start = time.perf_counter()
+    preload(freeze=False)
+    print(f"\n预加载运行时: {(time.perf_counter() - start) * 1000:.1f} ms")
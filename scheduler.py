@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+"""
+生成请求调度模块
+Generation Scheduler
+
+在请求模型之前进行准入与排队，防止单个重度客户端（如批处理任务）挤占交互用户：
+- 令牌桶：按客户端限制请求速率，超出时抛出 RateLimited（服务端返回 429）；
+- 加权公平队列：每个模型后端一条队列，按虚拟完成时间 (self-clocked fair queueing) 出队，
+  同一客户端的请求依次排在自己之前的请求之后，交互请求的权重高于批处理请求，
+  因此交互请求优先但批处理不会被饿死；
+- 每个模型后端可单独配置并发上限；
+- 等待期间通过回调报告排队位置，供 SSE 接口推送给客户端。
+
+多进程服务在派生工作进程前创建 SharedSchedulerState：并发名额、虚拟时钟、
+各客户端的虚拟完成时间与令牌桶放在共享内存中，各进程的队首按全局最小完成时间放行，
+因此并发上限与限速对所有工作进程合计生效。
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from ollama_client import DeadlineExceeded
+
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+DEFAULT_WEIGHTS = {INTERACTIVE: 8.0, BATCH: 1.0}
+
+
+class RateLimited(Exception):
+    """客户端超出速率限制"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"请求过于频繁，请在 {retry_after:.1f} 秒后重试")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒补充，最多积累 burst 个"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now=None):
+        """
+        取一个令牌
+
+        Returns:
+            float: 0 表示成功，否则为需要等待的秒数
+        """
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class SharedSchedulerState:
+    """
+    跨工作进程共享的调度状态（须在 fork 之前创建）
+
+    客户端按哈希映射到固定数量的槽位，哈希冲突的两个客户端共用令牌桶与完成时间。
+    """
+
+    def __init__(self, workers, backends, client_slots=65536):
+        """
+        Args:
+            workers: 工作进程编号的数量（平滑轮换时新旧两代同时存在，应为进程数的 2 倍）
+            backends: {后端地址: 并发上限}
+            client_slots: 客户端哈希槽位数
+        """
+        import multiprocessing
+        from multiprocessing.sharedctypes import RawArray
+
+        self.workers = workers
+        self.backends = list(backends)
+        self.client_slots = client_slots
+        self._lock = multiprocessing.Lock()
+        n = len(self.backends)
+        self._limits = RawArray("i", [backends[name] for name in self.backends])
+        self._active = RawArray("i", n * workers)           # 各进程占用的名额
+        self._heads = RawArray("d", [math.inf] * (n * workers))  # 各进程队首的虚拟完成时间
+        self._virtual_time = RawArray("d", n)
+        self._last_finish = RawArray("d", n * client_slots)
+        self._tokens = RawArray("d", client_slots)
+        self._updated = RawArray("d", client_slots)          # 0 表示未使用
+
+    def backend_index(self, name):
+        """后端在共享状态中的序号，未登记时返回None（该后端按进程内状态调度）"""
+        try:
+            return self.backends.index(name)
+        except ValueError:
+            return None
+
+    def _client(self, client):
+        return zlib.crc32(str(client).encode("utf-8")) % self.client_slots
+
+    def take(self, client, rate, burst):
+        """
+        从客户端的共享令牌桶取一个令牌
+
+        Returns:
+            float: 0 表示成功，否则为需要等待的秒数
+        """
+        slot = self._client(client)
+        now = time.monotonic()
+        with self._lock:
+            if self._updated[slot] == 0:
+                tokens = burst
+            else:
+                tokens = min(burst, self._tokens[slot] + (now - self._updated[slot]) * rate)
+            self._updated[slot] = now
+            if tokens >= 1:
+                self._tokens[slot] = tokens - 1
+                return 0.0
+            self._tokens[slot] = tokens
+            return (1 - tokens) / rate
+
+    def finish_tag(self, backend, client, cost):
+        """计算并登记请求的虚拟完成时间"""
+        index = backend * self.client_slots + self._client(client)
+        with self._lock:
+            finish = max(self._virtual_time[backend], self._last_finish[index]) + cost
+            self._last_finish[index] = finish
+            return finish
+
+    def dispatch(self, backend, worker, queue):
+        """
+        发布本进程的队首并放行：队首是全局最小完成时间且总占用未达上限时出队
+
+        Args:
+            queue: 本进程该后端的 _Request 最小堆
+
+        Returns:
+            list: 本次放行的请求
+        """
+        base = backend * self.workers
+        own = base + worker
+        granted = []
+        with self._lock:
+            while queue:
+                tag = queue[0].key[0]
+                self._heads[own] = tag
+                if sum(self._active[base:base + self.workers]) >= self._limits[backend]:
+                    break
+                head = min(range(base, base + self.workers), key=lambda i: (self._heads[i], i))
+                if head != own:
+                    break
+                granted.append(heapq.heappop(queue))
+                self._active[own] += 1
+                self._virtual_time[backend] = tag
+            if not queue:
+                self._heads[own] = math.inf
+        return granted
+
+    def release(self, backend, worker):
+        """归还一个名额"""
+        with self._lock:
+            self._active[backend * self.workers + worker] -= 1
+
+    def reset_worker(self, worker):
+        """清除已退出进程占用的名额与队首（由管理进程在回收时调用）"""
+        with self._lock:
+            for backend in range(len(self.backends)):
+                self._active[backend * self.workers + worker] = 0
+                self._heads[backend * self.workers + worker] = math.inf
+
+    def stats(self, backend):
+        with self._lock:
+            base = backend * self.workers
+            return {'limit': self._limits[backend],
+                    'active': sum(self._active[base:base + self.workers])}
+
+
+class _Request:
+    __slots__ = ("key", "client", "granted", "cancelled")
+
+    def __init__(self, key, client):
+        self.key = key          # (虚拟完成时间, 序号)
+        self.client = client
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+
+class _Backend:
+    """单个模型后端的队列与并发状态"""
+
+    def __init__(self, limit, shared_index=None):
+        self.limit = limit
+        self.shared_index = shared_index    # 在 SharedSchedulerState 中的序号
+        self.active = 0
+        self.queue = []          # _Request 最小堆
+        self.virtual_time = 0.0
+        self.last_finish = {}    # 客户端 -> 最近一个请求的虚拟完成时间
+
+
+class FairScheduler:
+    """
+    按模型后端的加权公平队列（线程安全）
+    """
+
+    # 使用共享状态时，等待其他进程释放名额的轮询间隔（秒）
+    POLL_INTERVAL = 0.02
+
+    def __init__(self, concurrency=2, backend_concurrency=None, rate=None, burst=None,
+                 weights=None, shared=None, worker=0):
+        """
+        Args:
+            concurrency: 每个模型后端默认的并发上限
+            backend_concurrency: 可选的 {后端地址: 并发上限}
+            rate: 每个客户端每秒允许的请求数，None 表示不限速
+            burst: 令牌桶容量，默认为 max(1, rate)
+            weights: 各优先级的权重，默认交互 8 : 批处理 1
+            shared: 可选的 SharedSchedulerState，登记在其中的后端与限速由所有进程共享
+            worker: 本进程在共享状态中的编号
+        """
+        self.concurrency = concurrency
+        self.backend_concurrency = dict(backend_concurrency or {})
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate or 1.0)
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        self.shared = shared
+        self.worker = worker
+
+        self._cond = threading.Condition()
+        self._backends = {}
+        self._buckets = {}
+        self._seq = itertools.count()
+
+    def admit(self, client):
+        """
+        准入检查（令牌桶）
+
+        Raises:
+            RateLimited: 超出速率限制
+        """
+        if self.rate is None:
+            return
+        if self.shared is not None:
+            wait = self.shared.take(client, self.rate, self.burst)
+            if wait:
+                raise RateLimited(wait)
+            return
+        with self._cond:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                if len(self._buckets) >= 10000:
+                    self._prune_buckets()
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            wait = bucket.take()
+        if wait:
+            raise RateLimited(wait)
+
+    def _prune_buckets(self):
+        """清理已补满（长时间未使用）的令牌桶"""
+        now = time.monotonic()
+        for client, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst:
+                del self._buckets[client]
+
+    def _backend(self, name):
+        backend = self._backends.get(name)
+        if backend is None:
+            limit = self.backend_concurrency.get(name, self.concurrency)
+            shared_index = self.shared.backend_index(name) if self.shared is not None else None
+            backend = self._backends[name] = _Backend(limit, shared_index)
+        return backend
+
+    def _finish_tag(self, backend, client, cost):
+        """计算并登记请求的虚拟完成时间（调用方持有锁）"""
+        if backend.shared_index is not None:
+            return self.shared.finish_tag(backend.shared_index, client, cost)
+        start = max(backend.virtual_time, backend.last_finish.get(client, 0.0))
+        finish = backend.last_finish[client] = start + cost
+        return finish
+
+    def _dispatch(self, backend):
+        """在并发上限内按虚拟完成时间放行排队请求（调用方持有锁）"""
+        if backend.shared_index is not None:
+            granted = self.shared.dispatch(backend.shared_index, self.worker, backend.queue)
+            for request in granted:
+                request.granted = True
+            backend.active += len(granted)
+            if granted:
+                self._cond.notify_all()
+            return
+        granted = False
+        while backend.active < backend.limit and backend.queue:
+            request = heapq.heappop(backend.queue)
+            request.granted = True
+            backend.active += 1
+            backend.virtual_time = request.key[0]
+            granted = True
+        if granted:
+            # 完成时间不晚于当前虚拟时间的记录已不影响排队，可以丢弃
+            if len(backend.last_finish) > 1024:
+                backend.last_finish = {c: f for c, f in backend.last_finish.items()
+                                       if f > backend.virtual_time}
+            self._cond.notify_all()
+
+    @staticmethod
+    def _position(backend, request):
+        return 1 + sum(1 for other in backend.queue if other.key < request.key)
+
+    @contextmanager
+    def slot(self, backend_name, client=None, priority=INTERACTIVE, on_position=None, deadline=None):
+        """
+        排队获取一个生成名额，退出上下文时释放
+
+        Args:
+            backend_name: 模型后端标识（如 Ollama 地址）
+            client: 客户端标识
+            priority: INTERACTIVE 或 BATCH
+            on_position: 可选回调 (排队位置)，位置变化时在等待线程中调用
+            deadline: 可选的截止时间 (time.monotonic() 时刻)
+
+        Raises:
+            DeadlineExceeded: 截止时间前未能获得名额
+        """
+        weight = self.weights.get(priority, 1.0)
+        with self._cond:
+            backend = self._backend(backend_name)
+            finish = self._finish_tag(backend, client, 1.0 / weight)
+            request = _Request((finish, next(self._seq)), client)
+            heapq.heappush(backend.queue, request)
+            self._dispatch(backend)
+
+        try:
+            self._wait(backend, request, on_position, deadline)
+            yield
+        finally:
+            with self._cond:
+                if request.granted:
+                    backend.active -= 1
+                    if backend.shared_index is not None:
+                        self.shared.release(backend.shared_index, self.worker)
+                elif not request.cancelled:
+                    backend.queue.remove(request)
+                    heapq.heapify(backend.queue)
+                request.cancelled = True
+                self._dispatch(backend)
+
+    def _wait(self, backend, request, on_position, deadline):
+        last_position = None
+        with self._cond:
+            while not request.granted:
+                timeout = None
+                if deadline is not None:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        raise DeadlineExceeded("排队超时")
+                position = self._position(backend, request)
+                if on_position is not None and position != last_position:
+                    last_position = position
+                    # 回调可能写网络，不在锁内执行
+                    self._cond.release()
+                    try:
+                        on_position(position)
+                    finally:
+                        self._cond.acquire()
+                    continue
+                if backend.shared_index is not None:
+                    # 其他进程释放名额时无法唤醒本进程，定期重试
+                    timeout = self.POLL_INTERVAL if timeout is None else min(timeout, self.POLL_INTERVAL)
+                    self._cond.wait(timeout)
+                    self._dispatch(backend)
+                else:
+                    self._cond.wait(timeout)
+
+    def stats(self):
+        """各后端的并发与排队情况（共享后端的 active 与 limit 为所有进程合计）"""
+        with self._cond:
+            result = {}
+            for name, b in self._backends.items():
+                result[name] = {'limit': b.limit, 'active': b.active, 'queued': len(b.queue)}
+                if b.shared_index is not None:
+                    result[name].update(self.shared.stats(b.shared_index))
+            return result
+
+
+if __name__ == "__main__":
+    # 模拟：一个批处理客户端先提交 20 个请求，随后 3 个交互用户各提交 1 个
+    scheduler = FairScheduler(concurrency=2)
+    order = []
+    lock = threading.Lock()
+
+    def job(client, priority, delay):
+        time.sleep(delay)
+        with scheduler.slot("ollama", client, priority,
+                            on_position=lambda p: print(f"  {client} 排队位置 {p}") if priority == INTERACTIVE else None):
+            with lock:
+                order.append(client)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=job, args=("batch", BATCH, 0)) for _ in range(20)]
+    threads += [threading.Thread(target=job, args=(f"user{i}", INTERACTIVE, 0.02)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print("执行顺序:", " ".join(order))
+
+    limiter = FairScheduler(rate=2, burst=2)
+    results = []
+    for _ in range(4):
+        try:
+            limiter.admit("client")
+            results.append("ok")
+        except RateLimited as e:
+            results.append(f"429({e.retry_after:.2f}s)")
+    print("限速:", results)
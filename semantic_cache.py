@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+相似问题缓存模块
+Semantic Cache
+
+同一爻象下，“我的事业如何”与“事业发展怎么样”应当得到同一份解卦。
+本模块在本地以字符 n-gram 词频向量表示问题（不依赖外部向量服务），
+按爻象分区存放已生成的解卦，问题的余弦相似度达到阈值时直接返回缓存结果。
+
+- 规范化：NFKC 全半角统一、小写、去除标点空白、正反问（“该不该”）与常见虚词；
+- 向量只用字符二元组，单字与虚词不参与相似度，避免“我该不该换工作”与“我该不该离婚”
+  仅凭共同的句式相似；
+- 否定词（不/没/别）、人称代词的先后与时间词构成问题签名，签名不同一律视为不同问题，
+  “他喜欢我吗”与“他不喜欢我吗”“她喜欢我吗”“我喜欢他吗”互不命中，
+  “我明年能结婚吗”与“我今年能结婚吗”互不命中；
+  只提到自己（我/我们）与省略主语视为相同；
+- 规范化后为空的问题（如“？？”）既不缓存也不查找；
+- 容量：总条目数与单个爻象的条目数均有上限，按最近最少使用（LRU）淘汰；
+- 每次查找只与同一爻象分区内的少量条目比较，耗时在亚毫秒级。
+"""
+
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from itertools import count
+
+from dayan_divination import line_state_to_index
+
+
+# 不影响问题含义的常见虚词与套话（按长度优先匹配）
+STOPWORDS = (
+    "请问", "帮我", "帮忙", "看看", "看一下", "算一下", "算算", "一下",
+    "如何", "怎么样", "怎样", "怎么", "是否", "能否",
+    "会", "的", "了", "吗", "呢", "吧", "啊", "呀", "么",
+)
+_STOPWORD_RE = re.compile("|".join(sorted(map(re.escape, STOPWORDS), key=len, reverse=True)))
+
+# 正反问（该不该、有没有、可不可以），与“吗”同义
+_QUESTION_FORM_RE = re.compile(r"(.)[不没]\1")
+
+# 人称代词（“其他/其它”不是代词）；别人须在否定词“别”之前识别
+_PRONOUN_RE = re.compile(r"别人|[我你您他她它咱]们|(?<!其)[他它]|[我你您她咱俺]")
+_PRONOUN_ALIASES = {"您": "你", "您们": "你们", "咱": "我", "俺": "我", "咱们": "我们"}
+_FIRST_PERSON = frozenset(("我", "我们"))
+
+NEGATIONS = "不没别"
+
+# 时间词：今年、明年、下个月、三个月、2027年、年底 等
+_TIME_RE = re.compile(
+    r"[\d一二三四五六七八九十两半几]+个?(?:年|月|周|星期|礼拜|天|日|号)"
+    r"|[今明后去前]年|[今明后昨前]天|[今明昨]晚"
+    r"|[上下这本]个?(?:月|周|星期|礼拜|季度)|年[初底中内]|月[初底中]")
+
+
+def _split_question(question):
+    """
+    Returns:
+        tuple: (规范化文本, 签名)，签名为 (人称代词序列, 否定词序列, 时间词序列)
+    """
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = "".join(ch for ch in text if unicodedata.category(ch)[0] not in "PZSC")
+    text = _QUESTION_FORM_RE.sub("", text)
+    times = tuple(_TIME_RE.findall(text))
+    text = _TIME_RE.sub("", text)
+    pronouns = tuple(_PRONOUN_ALIASES.get(p, p) for p in _PRONOUN_RE.findall(text))
+    if all(p in _FIRST_PERSON for p in pronouns):
+        pronouns = ()   # 只提到自己时与省略主语相同
+    text = _STOPWORD_RE.sub("", _PRONOUN_RE.sub("", text))
+    negations = tuple(ch for ch in text if ch in NEGATIONS)
+    return text, (pronouns, negations, times)
+
+
+def normalize_question(question):
+    """
+    规范化问题文本
+
+    Returns:
+        str: 去除标点、空白、正反问、时间词、人称代词与虚词后的文本
+    """
+    return _split_question(question)[0]
+
+
+def question_signature(question):
+    """
+    问题签名：人称代词、否定词与时间词的先后顺序，签名不同的问题不会互相命中
+
+    Returns:
+        tuple: (人称代词序列, 否定词序列, 时间词序列)
+    """
+    return _split_question(question)[1]
+
+
+def _ngrams(text, sizes):
+    grams = Counter()
+    for n in sizes:
+        for i in range(len(text) - n + 1):
+            grams[text[i:i + n]] += 1
+    if not grams and text:
+        grams[text] += 1    # 规范化后不足 n 个字时整体作为一项
+    return grams
+
+
+def question_ngrams(question, sizes=(2,)):
+    """
+    提取规范化问题的字符 n-gram 词频
+
+    Returns:
+        Counter: {n-gram: 次数}
+    """
+    return _ngrams(normalize_question(question), sizes)
+
+
+class SemanticCache:
+    """
+    按爻象分区的相似问题缓存（线程安全）
+    """
+
+    def __init__(self, threshold=0.55, max_entries=10000, max_per_state=64, ngram_sizes=(2,)):
+        """
+        Args:
+            threshold: 余弦相似度阈值，签名相同且达到该值即视为同一问题
+            max_entries: 缓存总条目上限
+            max_per_state: 单个爻象分区的条目上限
+            ngram_sizes: 使用的字符 n-gram 长度
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_per_state = max_per_state
+        self.ngram_sizes = tuple(ngram_sizes)
+
+        self._partitions = {}          # 爻象编号 -> OrderedDict(条目id -> (grams, 签名, 文本))
+        self._lru = OrderedDict()      # 条目id -> 爻象编号，最近使用的在末尾
+        self._ids = count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._lru)
+
+    @staticmethod
+    def _similarity(query, grams):
+        """
+        两个词频向量的余弦相似度
+
+        不做 IDF 加权：缓存较小时 IDF 近乎均匀，缓存较大时反而压低“事业”“感情”
+        这类常见的主题词，使同一主题的换种说法更难命中。
+        """
+        if not query or not grams:
+            return 0.0
+        dot = sum(tf * grams.get(gram, 0) for gram, tf in query.items())
+        if dot == 0:
+            return 0.0
+        norm_q = math.sqrt(sum(tf * tf for tf in query.values()))
+        norm_e = math.sqrt(sum(tf * tf for tf in grams.values()))
+        return dot / (norm_q * norm_e)
+
+    def get(self, lines, question):
+        """
+        查找相似问题的缓存解卦
+
+        Args:
+            lines: 六爻爻值列表
+            question: 占卜问题
+
+        Returns:
+            str: 缓存的解卦文本，未命中时返回None
+        """
+        state = line_state_to_index(lines)
+        text, signature = _split_question(question)
+        query = _ngrams(text, self.ngram_sizes)
+        with self._lock:
+            partition = self._partitions.get(state) if text else None
+            best_id, best_score = None, self.threshold
+            if partition:
+                for entry_id, (grams, entry_signature, _) in partition.items():
+                    if entry_signature != signature:
+                        continue
+                    score = self._similarity(query, grams)
+                    if score >= best_score:
+                        best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._lru.move_to_end(best_id)
+            partition.move_to_end(best_id)
+            return partition[best_id][2]
+
+    def put(self, lines, question, interpretation):
+        """
+        缓存一次解卦结果
+
+        Args:
+            lines: 六爻爻值列表
+            question: 占卜问题
+            interpretation: 解卦文本
+        """
+        state = line_state_to_index(lines)
+        text, signature = _split_question(question)
+        if not text:
+            return      # 规范化后为空（只有标点、虚词等）：无法判断是否同一问题
+        grams = _ngrams(text, self.ngram_sizes)
+        with self._lock:
+            partition = self._partitions.setdefault(state, OrderedDict())
+            entry_id = next(self._ids)
+            partition[entry_id] = (grams, signature, interpretation)
+            self._lru[entry_id] = state
+
+            if len(partition) > self.max_per_state:
+                self._evict(next(iter(partition)))
+            while len(self._lru) > self.max_entries:
+                self._evict(next(iter(self._lru)))
+
+    def _evict(self, entry_id):
+        """移除一个条目（调用方持有锁）"""
+        state = self._lru.pop(entry_id)
+        partition = self._partitions[state]
+        partition.pop(entry_id)
+        if not partition:
+            del self._partitions[state]
+
+    def stats(self):
+        """返回命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._lru),
+                'partitions': len(self._partitions),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+if __name__ == "__main__":
+    import time
+
+    lines = [7, 8, 9, 7, 6, 8]
+    cache = SemanticCache()
+    cache.put(lines, "我的事业如何？", "一、结论\n事业可成。")
+
+    for q in ("事业发展怎么样", "请问我的事业会怎样呢", "我的感情如何？"):
+        print(f"{q!r:24} -> {cache.get(lines, q)!r}")
+    print(f"{'请问我的事业会怎样呢'!r:24} (不同爻象) -> {cache.get([7] * 6, '请问我的事业会怎样呢')!r}")
+
+    # 回归检查：(已缓存的问题, 应命中的问题, 不应命中的问题)
+    cases = (
+        ("我该不该换工作", ("要不要换工作", "换工作好吗"), ("我该不该离婚", "我该不该换房子")),
+        ("他喜欢我吗", ("他是不是喜欢我",), ("他不喜欢我吗", "她喜欢我吗", "我喜欢他吗")),
+        ("我的事业如何？", ("事业发展怎么样", "请问我的事业会怎样呢", "我们的事业怎么样"),
+         ("我的感情如何？", "事业和感情如何")),
+        ("我明年能结婚吗", ("明年能不能结婚",), ("我今年能结婚吗", "我后年能结婚吗", "下个月能结婚吗")),
+        ("？？", (), ("！！", "...", "？？")),
+    )
+    for cached, same, different in cases:
+        check = SemanticCache()
+        check.put(lines, cached, cached)
+        assert len(check) == (1 if normalize_question(cached) else 0), f"{cached!r} 缓存条目数错误"
+        for q in same:
+            assert check.get(lines, q) == cached, f"{q!r} 应命中 {cached!r}"
+        for q in different:
+            assert check.get(lines, q) is None, f"{q!r} 不应命中 {cached!r}"
+    print("回归检查通过")
+
+    # 填充后的查找耗时
+    import random
+    topics = ["事业", "感情", "财运", "健康", "学业", "考试", "婚姻", "出行", "投资", "官司"]
+    for i in range(10000):
+        state_lines = [random.choice((6, 7, 8, 9)) for _ in range(6)]
+        cache.put(state_lines, f"{random.choice(topics)}{random.choice(topics)}第{i}问", "...")
+    start = time.perf_counter()
+    for _ in range(1000):
+        cache.get(lines, "我的事业发展前景如何")
+    print(f"\n{len(cache)} 条缓存，平均查找 {(time.perf_counter() - start) * 1000:.3f} us")
+    print(cache.stats())
@@ -0,0 +1,627 @@
+# -*- coding: utf-8 -*-
+"""
+占卜 HTTP 服务
+Divination HTTP Server
+
+提供 JSON 与 SSE 两种占卜接口，并支持预派生 (pre-fork) 多进程模式：
+主进程预加载卦象数据与预计算表后派生 N 个工作进程，
+并为每个工作进程槽位创建一个以 SO_REUSEPORT 绑定到同一端口的监听套接字，
+由内核在各槽位之间分配连接。监听套接字始终由主进程持有，
+重启或轮换后的工作进程继承同一个套接字，因此不会因关闭监听队列而丢失连接。
+主进程负责重启崩溃的工作进程、在 SIGHUP 时平滑轮换，并可将工作进程绑定到 CPU 核。
+
+接口:
+    POST /divine                 {"question": "..."} -> JSON 结果（含本卦图形）
+    GET  /divine/stream?question=...  -> SSE: hexagram / queue / token / done 事件
+    GET  /healthz                健康检查
+    GET  /metrics                Prometheus 指标（启用 --metrics 时，按工作进程统计）
+
+启用调度 (--concurrency / --rate) 后，客户端以 X-Client-Id 请求头（缺省为来源 IP）标识，
+超出速率时返回 429 与 Retry-After；批处理客户端可以 priority=batch（查询参数或 JSON 字段）
+声明低优先级，交互请求优先获得模型名额。等待名额期间 SSE 接口发送 queue 事件报告排队位置。
+"""
+
+import json
+import math
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from hexagram_renderer import render_hexagram
+from main import IChing
+from output_sink import OutputSink
+from prompt_templates import PromptTemplates
+from scheduler import BATCH, INTERACTIVE, FairScheduler, RateLimited, SharedSchedulerState
+
+
+class DivinationHandler(BaseHTTPRequestHandler):
+    """占卜请求处理器（HTTP/1.0，每个请求后关闭连接，便于平滑退出）"""
+
+    server_version = "IChingServer/1.0"
+    # 慢客户端的读写超时（秒）
+    timeout = 120
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, obj, status=200, headers=None):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_rate_limited(self, error):
+        retry_after = max(1, math.ceil(error.retry_after))
+        self._send_json({"error": str(error), "retry_after": retry_after}, status=429,
+                        headers={"Retry-After": str(retry_after)})
+
+    def _client_id(self):
+        """客户端标识：X-Client-Id 请求头，缺省为来源 IP"""
+        return self.headers.get("X-Client-Id") or self.client_address[0]
+
+    @staticmethod
+    def _priority(value):
+        return BATCH if str(value).strip().lower() == BATCH else INTERACTIVE
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/healthz":
+            self._send_json({"status": "ok", "pid": os.getpid()})
+        elif url.path == "/metrics" and self.server.metrics is not None:
+            body = self.server.metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif url.path == "/divine/stream":
+            query = parse_qs(url.query)
+            question = query.get("question", [""])[0]
+            priority = self._priority(query.get("priority", [INTERACTIVE])[0])
+            self._stream_divination(question.strip(), priority)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/divine":
+            self._send_json({"error": "not found"}, status=404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError):
+            self._send_json({"error": "请求体必须是 JSON"}, status=400)
+            return
+
+        try:
+            record = self.server.iching.divine_record(
+                str(body.get("question", "")).strip(), client=self._client_id(),
+                priority=self._priority(body.get("priority", INTERACTIVE)))
+        except RateLimited as e:
+            self._send_rate_limited(e)
+            return
+        record["figure"] = render_hexagram(record["casting"]["original_lines"])
+        self._send_json(record, status=502 if record.get("error") else 200)
+
+    def _send_event(self, event, data, flush=True):
+        """发送一个 SSE 事件；token 事件 (flush=False) 经合并后写出"""
+        payload = json.dumps(data, ensure_ascii=False)
+        self._events.write(f"event: {event}\ndata: {payload}\n\n".encode("utf-8"), flush=flush)
+
+    def _stream_divination(self, question, priority=INTERACTIVE):
+        """以 SSE 流式返回占卜结果"""
+        iching = self.server.iching
+        try:
+            reading, chunks = iching.divine_stream(
+                question, client=self._client_id(), priority=priority,
+                on_queue=lambda position: self._send_event("queue", {"position": position}))
+        except RateLimited as e:
+            self._send_rate_limited(e)
+            return
+        except LookupError as e:
+            self._send_json({"error": str(e)}, status=500)
+            return
+
+        self._events = OutputSink(self.wfile)
+        result = reading["divination_result"]
+        interpretation = reading["interpretation"]
+        changed_hex = interpretation["changed_hexagram"]
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self._send_event("hexagram", {
+                "question": question,
+                "original_lines": result["original_lines"],
+                "changing_lines": result["changing_lines"],
+                "original_hexagram": interpretation["original_hexagram"].get("number"),
+                "changed_hexagram": changed_hex.get("number") if changed_hex else None,
+                "hexagram_info": reading["hexagram_info"],
+                "figure": render_hexagram(result["original_lines"]),
+            })
+            for chunk in chunks:
+                self._send_event("token", {"text": chunk}, flush=False)
+            self._send_event("done", {})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            try:
+                self._send_event("error", {"error": f"AI生成失败 - {e}"})
+            except OSError:
+                pass
+        finally:
+            # 客户端断开时（包括首块之前）关闭上游生成，捕获记录记为 cancelled
+            chunks.close()
+            try:
+                self._events.close()
+            except OSError:
+                pass
+
+
+class DivinationHTTPServer(ThreadingHTTPServer):
+    """占卜 HTTP 服务器"""
+
+    # 非守护线程：server_close() 会等待进行中的请求完成，实现平滑退出
+    daemon_threads = False
+
+    def __init__(self, address, iching, metrics=None, sock=None):
+        """
+        Args:
+            address: (host, port)
+            iching: IChing 实例（verbose=False）
+            metrics: 可选的 MetricsRegistry
+            sock: 已绑定并监听的套接字（由主进程创建），优先于 address
+        """
+        super().__init__(address, DivinationHandler, bind_and_activate=sock is None)
+        self.iching = iching
+        self.metrics = metrics
+        if sock is not None:
+            self.socket.close()
+            self.socket = sock
+            self.server_address = sock.getsockname()
+
+
+def bind_listener(host, port, reuse_port=False, backlog=1024):
+    """
+    创建监听套接字
+
+    Args:
+        host: 监听地址
+        port: 监听端口
+        reuse_port: 是否设置 SO_REUSEPORT（允许多个套接字绑定同一端口）
+        backlog: 监听队列长度
+
+    Returns:
+        socket.socket: 已开始监听的套接字
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def create_iching(ollama_url, model, metrics=None, pregenerated=None, cache=None, timeout=None,
+                  scheduler=None, keep_alive=None, recorder=None):
+    """创建服务端使用的 IChing 实例"""
+    return IChing(ollama_url=ollama_url, model=model, verbose=False, concise=True,
+                  metrics=metrics, pregenerated=pregenerated, cache=cache, timeout=timeout,
+                  scheduler=scheduler, keep_alive=keep_alive, recorder=recorder)
+
+
+def open_recorder(path):
+    """打开流量捕获文件，未指定时返回None"""
+    if not path:
+        return None
+    from traffic_capture import TrafficRecorder
+    return TrafficRecorder(path)
+
+
+def warm_model(ollama_url, model, keep_alive, preload_prompt=False):
+    """启动时预热模型（加载与可选的系统提示词评估），结果打印到标准错误"""
+    from ollama_client import OllamaClient
+    from warmup import ModelWarmer
+
+    warmer = ModelWarmer(OllamaClient(base_url=ollama_url, model=model), keep_alive=keep_alive,
+                         system_prompt=PromptTemplates.SYSTEM_PROMPT_CONCISE if preload_prompt else None)
+    result = warmer.warm_up()
+    if result['error']:
+        print(f"模型预热失败: {result['error']}", file=sys.stderr)
+    else:
+        print(f"模型已预热: 加载 {result['load_ms']:.0f} ms，共 {result['total_ms']:.0f} ms", file=sys.stderr)
+    return result
+
+
+def open_pregenerated(path):
+    """打开预生成解卦文件，未指定时返回None"""
+    if not path:
+        return None
+    from pregenerated import PregeneratedStore
+    return PregeneratedStore(path)
+
+
+def create_cache(threshold, size=10000):
+    """创建相似问题缓存，未指定阈值时返回None"""
+    if threshold is None:
+        return None
+    from semantic_cache import SemanticCache
+    return SemanticCache(threshold=threshold, max_entries=size)
+
+
+def create_scheduler(concurrency=None, rate=None, burst=None, shared=None, worker=0):
+    """
+    创建生成请求调度器，未指定并发与速率时返回None
+
+    Args:
+        shared: 可选的 SharedSchedulerState，多进程时使并发上限与限速由所有工作进程共享
+        worker: 本进程在共享状态中的编号
+    """
+    if concurrency is None and rate is None:
+        return None
+    return FairScheduler(concurrency=concurrency or 2, rate=rate, burst=burst,
+                         shared=shared, worker=worker)
+
+
+def create_shared_scheduler(ollama_url, workers, concurrency=None, rate=None):
+    """
+    创建各工作进程共享的调度状态（须在 fork 之前调用），未指定并发与速率时返回None
+
+    平滑轮换时新旧两代工作进程同时存在，因此预留 2 倍于进程数的编号。
+    """
+    if concurrency is None and rate is None:
+        return None
+    return SharedSchedulerState(workers=2 * workers,
+                                backends={ollama_url.rstrip('/'): concurrency or 2})
+
+
+class Supervisor:
+    """
+    预派生多进程管理器
+
+    信号:
+        SIGTERM / SIGINT  平滑停止全部工作进程
+        SIGHUP            平滑轮换：先启动新一批工作进程，再让旧进程处理完请求后退出
+    """
+
+    def __init__(self, host="0.0.0.0", port=8000, workers=None, ollama_url="http://localhost:11434",
+                 model="FortuneQwen3_q8:4b", pin_cpus=False, metrics=False, graceful_timeout=30.0,
+                 pregenerated=None, cache_threshold=None, cache_size=10000, timeout=None,
+                 concurrency=None, rate=None, burst=None, keep_alive=None, warmup=False,
+                 preload_prompt=False, capture=None):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口
+            workers: 工作进程数，默认等于可用 CPU 数
+            ollama_url: Ollama服务地址
+            model: 使用的AI模型
+            pin_cpus: 是否将各工作进程绑定到不同 CPU 核
+            metrics: 是否在各工作进程中启用 /metrics
+            graceful_timeout: 平滑退出的最长等待时间（秒），超时后强制结束
+            pregenerated: 预生成解卦文件路径，在父进程中映射后由各工作进程共享
+            cache_threshold: 相似问题缓存的相似度阈值，None 表示不启用（每个工作进程各自缓存）
+            cache_size: 每个工作进程的缓存条目上限
+            timeout: 单次占卜时限（秒），超时返回参考解读；None 表示不限
+            concurrency: 所有工作进程合计同时请求模型的上限，None 且未限速时不排队
+            rate: 每个客户端每秒请求数上限（所有工作进程共享计数），None 表示不限
+            burst: 限速的突发容量，默认为 max(1, rate)
+            keep_alive: 模型在 Ollama 中的驻留时长，None 时使用 Ollama 的默认值；
+                        指定时由槽位 0 的工作进程在空闲期间定期保活
+            warmup: 是否在派生工作进程前预热模型
+            preload_prompt: 预热时是否预先评估系统提示词
+            capture: 流量捕获文件路径，各工作进程追加写入同一文件
+        """
+        self.cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        self.host = host
+        self.port = port
+        self.num_workers = workers or len(self.cpus)
+        self.ollama_url = ollama_url
+        self.model = model
+        self.pin_cpus = pin_cpus
+        self.metrics = metrics
+        self.graceful_timeout = graceful_timeout
+        self.pregenerated_path = pregenerated
+        self._pregenerated = None
+        self.cache_threshold = cache_threshold
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.keep_alive = keep_alive
+        self.warmup = warmup
+        self.preload_prompt = preload_prompt
+        self.capture_path = capture
+
+        self.reuse_port = hasattr(socket, "SO_REUSEPORT")
+        self._sockets = []       # slot -> 监听套接字
+        self._workers = {}       # pid -> slot，当前代的工作进程
+        self._retiring = {}      # pid -> 开始退出的时间，上一代的工作进程
+        self._spawned_at = {}    # slot -> 最近一次启动时间
+        self._shared = None      # 各工作进程共享的调度状态
+        self._indices = {}       # pid -> 在共享调度状态中的编号
+        self._free_indices = set()
+        self._stopping = False
+        self._reload = False
+
+    def run(self):
+        """启动并管理工作进程，直至收到停止信号"""
+        from runtime import preload
+
+        preload()
+        self._pregenerated = open_pregenerated(self.pregenerated_path)
+        self._shared = create_shared_scheduler(self.ollama_url, self.num_workers,
+                                               self.concurrency, self.rate)
+        self._free_indices = set(range(2 * self.num_workers))
+        if self.warmup:
+            warm_model(self.ollama_url, self.model, self.keep_alive, self.preload_prompt)
+        if self.reuse_port:
+            self._sockets = [bind_listener(self.host, self.port, reuse_port=True)
+                             for _ in range(self.num_workers)]
+        else:
+            # 不支持 SO_REUSEPORT 时所有工作进程共享同一个监听套接字
+            self._sockets = [bind_listener(self.host, self.port)] * self.num_workers
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+
+        for slot in range(self.num_workers):
+            self._spawn(slot)
+        print(f"已启动 {self.num_workers} 个工作进程，监听 {self.host}:{self.port}", file=sys.stderr)
+
+        while not self._stopping:
+            if self._reload:
+                self._reload = False
+                self._roll()
+            self._reap()
+            time.sleep(0.1)
+
+        self._shutdown()
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_reload(self, signum, frame):
+        self._reload = True
+
+    def _spawn(self, slot):
+        """派生一个工作进程并等待其就绪"""
+        index = self._take_index()
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            code = 0
+            try:
+                self._worker_main(slot, ready_w, index)
+            except Exception as e:
+                print(f"工作进程 {os.getpid()} 异常退出: {e}", file=sys.stderr)
+                code = 1
+            finally:
+                os._exit(code)
+
+        os.close(ready_w)
+        ready, _, _ = select.select([ready_r], [], [], 10.0)
+        if not ready or not os.read(ready_r, 1):
+            print(f"工作进程 {pid} (槽位 {slot}) 启动失败", file=sys.stderr)
+        os.close(ready_r)
+        self._workers[pid] = slot
+        self._indices[pid] = index
+        self._spawned_at[slot] = time.monotonic()
+        return pid
+
+    def _take_index(self):
+        """分配共享调度状态中的进程编号"""
+        while not self._free_indices:
+            # 多次快速轮换时上一代进程仍未退出：强制结束最早的一个以腾出编号
+            pid = min(self._retiring, key=self._retiring.get)
+            self._kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            del self._retiring[pid]
+            self._release_index(pid)
+        index = min(self._free_indices)
+        self._free_indices.remove(index)
+        return index
+
+    def _release_index(self, pid):
+        """回收已退出进程的编号，并清除其在共享调度状态中占用的名额"""
+        index = self._indices.pop(pid, None)
+        if index is None:
+            return
+        if self._shared is not None:
+            self._shared.reset_worker(index)
+        self._free_indices.add(index)
+
+    def _worker_main(self, slot, ready_w, index):
+        """工作进程入口"""
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        if self.pin_cpus and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, {self.cpus[slot % len(self.cpus)]})
+
+        registry = None
+        if self.metrics:
+            from metrics import MetricsRegistry
+            registry = MetricsRegistry()
+        iching = create_iching(self.ollama_url, self.model, metrics=registry,
+                               pregenerated=self._pregenerated,
+                               cache=create_cache(self.cache_threshold, self.cache_size),
+                               timeout=self.timeout,
+                               scheduler=create_scheduler(self.concurrency, self.rate, self.burst,
+                                                          shared=self._shared, worker=index),
+                               keep_alive=self.keep_alive,
+                               recorder=open_recorder(self.capture_path))
+        if slot == 0 and self.keep_alive is not None:
+            # 保活只需一个进程负责；其余进程的请求同样携带 keep_alive
+            from warmup import ModelWarmer
+            ModelWarmer(iching.ollama, keep_alive=self.keep_alive).start()
+        sock = self._sockets[slot]
+        for other in set(self._sockets) - {sock}:
+            other.close()
+        server = DivinationHTTPServer((self.host, self.port), iching, metrics=registry, sock=sock)
+
+        def stop(signum, frame):
+            # shutdown() 会阻塞到 serve_forever 退出，必须在其他线程中调用
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        os.write(ready_w, b"1")
+        os.close(ready_w)
+
+        server.serve_forever()
+        server.server_close()
+
+    def _reap(self):
+        """回收已退出的工作进程，并重启意外退出的当前代进程"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            self._release_index(pid)
+            if pid in self._retiring:
+                del self._retiring[pid]
+                continue
+            slot = self._workers.pop(pid, None)
+            if slot is not None and not self._stopping:
+                print(f"工作进程 {pid} 意外退出 (状态 {status})，正在重启槽位 {slot}", file=sys.stderr)
+                # 启动后立即崩溃时稍作等待，避免频繁重启
+                if time.monotonic() - self._spawned_at.get(slot, 0) < 1.0:
+                    time.sleep(1.0)
+                self._spawn(slot)
+
+        # 强制结束超时未退出的旧进程
+        now = time.monotonic()
+        for pid, since in list(self._retiring.items()):
+            if now - since > self.graceful_timeout:
+                self._kill(pid, signal.SIGKILL)
+
+    def _roll(self):
+        """平滑轮换：新进程就绪后再让旧进程退出"""
+        old = dict(self._workers)
+        self._workers = {}
+        for slot in range(self.num_workers):
+            self._spawn(slot)
+        now = time.monotonic()
+        for pid in old:
+            self._retiring[pid] = now
+            self._kill(pid, signal.SIGTERM)
+        print(f"已轮换 {len(old)} 个工作进程", file=sys.stderr)
+
+    def _kill(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _shutdown(self):
+        """平滑停止全部工作进程"""
+        now = time.monotonic()
+        for pid in list(self._workers):
+            self._retiring[pid] = now
+            self._kill(pid, signal.SIGTERM)
+        self._workers = {}
+        while self._retiring:
+            self._reap()
+            time.sleep(0.05)
+        for sock in set(self._sockets):
+            sock.close()
+
+
+def serve(host="0.0.0.0", port=8000, ollama_url="http://localhost:11434",
+          model="FortuneQwen3_q8:4b", metrics=False, pregenerated=None,
+          cache_threshold=None, cache_size=10000, timeout=None, concurrency=None,
+          rate=None, burst=None, keep_alive=None, warmup=False, preload_prompt=False,
+          capture=None):
+    """单进程模式（开发调试或不支持 fork 的平台）"""
+    registry = None
+    if metrics:
+        from metrics import MetricsRegistry
+        registry = MetricsRegistry()
+    iching = create_iching(ollama_url, model, registry, open_pregenerated(pregenerated),
+                           create_cache(cache_threshold, cache_size), timeout,
+                           create_scheduler(concurrency, rate, burst), keep_alive,
+                           open_recorder(capture))
+    if warmup:
+        warm_model(ollama_url, model, keep_alive, preload_prompt)
+    if keep_alive is not None:
+        from warmup import ModelWarmer
+        ModelWarmer(iching.ollama, keep_alive=keep_alive).start()
+    server = DivinationHTTPServer((host, port), iching, metrics=registry)
+    print(f"服务已启动: http://{host}:{port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    """命令行入口"""
+    import argparse
+
+    from warmup import keep_alive_arg
+
+    parser = argparse.ArgumentParser(description="周易占卜 HTTP 服务")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口 (默认: 8000)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="工作进程数，默认等于 CPU 数；0 表示单进程模式")
+    parser.add_argument("--pin-cpus", action="store_true", help="将工作进程绑定到不同 CPU 核")
+    parser.add_argument("--metrics", action="store_true", help="启用 /metrics")
+    parser.add_argument("--url", default="http://localhost:11434", help="Ollama服务地址")
+    parser.add_argument("--model", default="FortuneQwen3_q8:4b", help="使用的AI模型")
+    parser.add_argument("--pregenerated", help="预生成解卦文件 (pregenerated.py 生成)，问题为空时直接返回")
+    parser.add_argument("--cache-threshold", type=float,
+                        help="启用相似问题缓存，余弦相似度达到该值即复用解卦 (建议 0.55)")
+    parser.add_argument("--cache-size", type=int, default=10000, help="相似问题缓存条目上限 (默认: 10000)")
+    parser.add_argument("--timeout", type=float, help="单次占卜时限（秒），超时返回依据原文的参考解读")
+    parser.add_argument("--concurrency", type=int,
+                        help="所有工作进程合计同时请求模型的上限，超出时按客户端加权公平排队 (默认: 2，启用 --rate 时生效)")
+    parser.add_argument("--rate", type=float, help="每个客户端每秒请求数上限（所有工作进程共享计数），超出返回 429")
+    parser.add_argument("--burst", type=float, help="限速的突发容量 (默认: max(1, rate))")
+    parser.add_argument("--keep-alive", type=keep_alive_arg, default="30m",
+                        help="模型在 Ollama 中的驻留时长，空闲期间定期保活，如 30m、3600、-1 (默认: 30m)")
+    parser.add_argument("--no-warmup", action="store_true", help="启动时不预热模型")
+    parser.add_argument("--preload-prompt", action="store_true", help="预热时预先评估系统提示词")
+    parser.add_argument("--capture", help="将占卜请求与上游 token 时序追加到该文件，供 traffic_replay.py 回放")
+    args = parser.parse_args()
+
+    if args.workers == 0 or not hasattr(os, "fork"):
+        serve(args.host, args.port, args.url, args.model, metrics=args.metrics,
+              pregenerated=args.pregenerated, cache_threshold=args.cache_threshold,
+              cache_size=args.cache_size, timeout=args.timeout,
+              concurrency=args.concurrency, rate=args.rate, burst=args.burst,
+              keep_alive=args.keep_alive, warmup=not args.no_warmup,
+              preload_prompt=args.preload_prompt, capture=args.capture)
+        return
+
+    Supervisor(host=args.host, port=args.port, workers=args.workers, ollama_url=args.url,
+               model=args.model, pin_cpus=args.pin_cpus, metrics=args.metrics,
+               pregenerated=args.pregenerated, cache_threshold=args.cache_threshold,
+               cache_size=args.cache_size, timeout=args.timeout,
+               concurrency=args.concurrency, rate=args.rate, burst=args.burst,
+               keep_alive=args.keep_alive, warmup=not args.no_warmup,
+               preload_prompt=args.preload_prompt, capture=args.capture).run()
+
+
+if __name__ == "__main__":
+    main()
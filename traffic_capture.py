@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+流量捕获模块
+Traffic Capture
+
+记录线上占卜请求，供 traffic_replay.py 在本地模型替身上回放、比较不同版本的性能。
+每次占卜写出一行 JSON：
+
+    t              到达时刻 (time.time())
+    entry          入口：record (divine_record) / stream (divine_stream / divine)
+    question       问题
+    seed           起卦种子，回放时以同一种子得到同一爻象
+    line_state     爻象编号 (0-4095)，用于校验回放的起卦结果
+    model / system_prompt / prompt / options   发给 Ollama 的请求
+    upstream       {'sent_ms': 请求发出时刻, 'tokens': [[距发出的秒数, 文本], ...], 'stats': done 统计}
+                   未请求模型（缓存命中等）时为 null
+    outcome        ok / cached / fallback / error / cancelled
+    delivered      流式请求交给客户端的文本块数，cancelled 时即断开前收到的块数；非流式为 null
+    latency_ms     占卜总耗时
+
+多个工作进程可写同一文件：以 O_APPEND 打开，每条记录一次 write。
+"""
+
+import json
+import os
+import time
+
+
+CAPTURE_VERSION = 1
+
+
+class Exchange:
+    """一次占卜的捕获记录（由 IChing 与 OllamaClient 依次填写）"""
+
+    def __init__(self, recorder, entry, question, seed):
+        self.recorder = recorder
+        self.started = time.monotonic()
+        self._sent = None
+        self._finished = False
+        self.record = {
+            'v': CAPTURE_VERSION,
+            't': time.time(),
+            'entry': entry,
+            'question': question,
+            'seed': seed,
+            'line_state': None,
+            'model': None,
+            'system_prompt': None,
+            'prompt': None,
+            'options': None,
+            'upstream': None,
+            'outcome': None,
+            'delivered': None,
+            'latency_ms': None,
+        }
+
+    def casting(self, lines):
+        """记录起卦结果"""
+        from dayan_divination import line_state_to_index
+        self.record['line_state'] = line_state_to_index(lines)
+
+    def request(self, payload):
+        """记录发给 Ollama 的请求（由 OllamaClient 在发出前调用）"""
+        self._sent = time.monotonic()
+        self.record.update(model=payload.get('model'), system_prompt=payload.get('system', ''),
+                           prompt=payload.get('prompt', ''), options=payload.get('options') or {})
+        self.record['upstream'] = {
+            'sent_ms': round((self._sent - self.started) * 1000, 3),
+            'tokens': [],
+            'stats': {},
+        }
+
+    def token(self, text):
+        """记录一个上游数据块的到达"""
+        self.record['upstream']['tokens'].append([round(time.monotonic() - self._sent, 6), text])
+
+    def done(self, stats):
+        """记录上游 done 统计"""
+        self.record['upstream']['stats'] = dict(stats)
+
+    def finish(self, outcome="ok", delivered=None):
+        """
+        写出记录（只写一次）
+
+        Args:
+            outcome: 结果 (ok / cached / fallback / error / cancelled)
+            delivered: 流式请求已交给客户端的文本块数
+        """
+        if self._finished:
+            return
+        self._finished = True
+        self.record['outcome'] = outcome
+        self.record['delivered'] = delivered
+        self.record['latency_ms'] = round((time.monotonic() - self.started) * 1000, 3)
+        self.recorder.write(self.record)
+
+
+class TrafficRecorder:
+    """
+    捕获文件写入器（线程安全，可多进程共用同一文件）
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: JSONL 捕获文件路径（追加写入）
+        """
+        self.path = path
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def begin(self, entry, question, seed):
+        """
+        开始记录一次占卜
+
+        Returns:
+            Exchange: 由调用方填写并在结束时 finish()
+        """
+        return Exchange(self, entry, question, seed)
+
+    def write(self, record):
+        os.write(self._fd, (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def load_capture(path):
+    """
+    读取捕获文件，按到达时刻排序
+
+    Returns:
+        list: 记录字典列表（忽略无法解析的行，例如写入中断的最后一行）
+    """
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and record.get('v') == CAPTURE_VERSION:
+                records.append(record)
+    records.sort(key=lambda r: r['t'])
+    return records
+
+
+if __name__ == "__main__":
+    import sys
+    from collections import Counter
+
+    if len(sys.argv) != 2:
+        print("用法: python traffic_capture.py <捕获文件>")
+        sys.exit(1)
+
+    records = load_capture(sys.argv[1])
+    if not records:
+        print("没有记录")
+        sys.exit(0)
+    span = records[-1]['t'] - records[0]['t']
+    tokens = sum(len(r['upstream']['tokens']) for r in records if r['upstream'])
+    print(f"{len(records)} 条记录，跨度 {span:.1f} 秒，上游数据块 {tokens} 个")
+    print("入口:", dict(Counter(r['entry'] for r in records)))
+    print("结果:", dict(Counter(r['outcome'] for r in records)))
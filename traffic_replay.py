@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+流量回放工具
+Traffic Replay
+
+在本地模型替身 (fake_ollama) 上回放 traffic_capture 录制的占卜请求：
+- 按录制的到达间隔发起请求，可用 --speed 整体加速（间隔与 token 节奏同时缩放）；
+- 替身按 prompt 找到对应的录制记录，以录制的上游 token 到达时刻逐块返回；
+  prompt 因模板改动而变化时，按 prompt 中与录制问题完全相同的一行匹配，
+  仍找不到时使用替身的默认输出（计入 script_unmatched）；
+- 录制时命中相似问题缓存或预生成解卦的请求 (outcome 为 cached)，回放时同样命中，不请求模型；
+- 录制时中途断开的流式请求 (outcome 为 cancelled)，回放时收到录制的块数 (delivered) 后即关闭；
+- 以录制的种子起卦，并校验爻象与录制时一致；
+- 统计延迟分位数、首块延迟与吞吐量，compare 子命令比较两个代码版本。
+
+    python traffic_replay.py run capture.jsonl --speed 4
+    python traffic_replay.py compare capture.jsonl --baseline ../iching-v1.2 --candidate . --speed 4
+
+compare 在各版本目录中以子进程运行 `python traffic_replay.py run`，
+因此两个版本都需包含本工具与 traffic_capture.py。
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+from loadtest import percentile
+from traffic_capture import load_capture
+
+
+# compare 输出的指标：(键, 名称, 越大越好)
+METRICS = (
+    ('rps', "吞吐量 (req/s)", True),
+    ('chars_per_s', "输出 (字/s)", True),
+    ('latency_p50_ms', "延迟 p50 (ms)", False),
+    ('latency_p95_ms', "延迟 p95 (ms)", False),
+    ('latency_p99_ms', "延迟 p99 (ms)", False),
+    ('ttft_p50_ms', "首块 p50 (ms)", False),
+    ('ttft_p95_ms', "首块 p95 (ms)", False),
+    ('errors', "失败数", False),
+)
+
+
+def recorded_plan(record, speed=1.0):
+    """
+    由录制记录得到替身的 token 计划
+
+    Returns:
+        list: [(token, 等待秒数), ...]，未请求模型的记录返回None
+    """
+    upstream = record.get('upstream')
+    if not upstream:
+        return None
+    plan = []
+    previous = 0.0
+    for offset, text in upstream['tokens']:
+        plan.append((text, max(0.0, offset - previous) / speed))
+        previous = offset
+    return plan
+
+
+class RecordedHits:
+    """
+    回放缓存命中：作为 IChing 的 cache 与 pregenerated，
+    只在回放录制时命中缓存的记录时返回占位解卦，其余请求照常请求模型
+    """
+
+    TEXT = "（录制时命中缓存）"
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def expect(self, record):
+        """在回放线程中登记即将回放的记录"""
+        self._local.cached = record['outcome'] == 'cached'
+
+    def get(self, lines, question=""):
+        if not getattr(self._local, 'cached', False):
+            return None
+        self._local.cached = False
+        with self._lock:
+            self.hits += 1
+        return self.TEXT
+
+    def put(self, lines, question, interpretation):
+        pass
+
+
+class ReplayScript:
+    """
+    fake_ollama 的 script 回调：按请求 prompt 取出录制的 token 节奏（线程安全）
+    """
+
+    def __init__(self, records, speed=1.0):
+        self._by_prompt = {}
+        self._by_question = {}
+        self._lock = threading.Lock()
+        self.matched = 0
+        self.fuzzy = 0
+        self.unmatched = 0
+        for record in records:
+            plan = recorded_plan(record, speed)
+            if plan is None:
+                continue
+            key = (record['system_prompt'], record['prompt'])
+            self._by_prompt.setdefault(key, deque()).append(plan)
+            question = record['question'].strip()
+            if question:
+                self._by_question.setdefault(question, deque()).append(plan)
+
+    def __call__(self, payload):
+        prompt = payload.get('prompt', '')
+        with self._lock:
+            plans = self._by_prompt.get((payload.get('system', ''), prompt))
+            if plans:
+                self.matched += 1
+                return plans.popleft()
+            # 模板改动后按问题匹配：只认 prompt 中与录制问题完全相同的一行
+            for line in prompt.splitlines():
+                plans = self._by_question.get(line.strip())
+                if plans:
+                    self.fuzzy += 1
+                    return plans.popleft()
+            self.unmatched += 1
+            return None
+
+
+def start_replay_backend(records, speed=1.0):
+    """
+    启动按录制节奏应答的进程内替身
+
+    Returns:
+        tuple: (server, ReplayScript)
+    """
+    from fake_ollama import FakeOllamaConfig, start_fake_ollama
+
+    script = ReplayScript(records, speed)
+    models = sorted({r['model'] for r in records if r.get('model')}) or ["FortuneQwen3_q8:4b"]
+    server = start_fake_ollama(config=FakeOllamaConfig(models=models, script=script))
+    return server, script
+
+
+def _replay_one(iching, record, results, lock):
+    """回放一条记录并记入 results"""
+    iching.cache.expect(record)
+    start = time.perf_counter()
+    first = None
+    chars = 0
+    error = None
+    lines = None
+    try:
+        if record['entry'] == 'stream':
+            reading, stream = iching.divine_stream(record['question'], seed=record['seed'])
+            lines = reading['divination_result']['original_lines']
+            chunks = stream
+            if record['outcome'] == 'cancelled':
+                # 录制时客户端收到 delivered 块后断开；旧记录没有该字段，只能区分是否在首块之前
+                delivered = record.get('delivered')
+                if delivered is None and not record['upstream']:
+                    delivered = 0
+                if delivered is not None:
+                    chunks = islice(stream, delivered)
+            try:
+                for chunk in chunks:
+                    if first is None:
+                        first = time.perf_counter()
+                    chars += len(chunk)
+            finally:
+                stream.close()
+        else:
+            result = iching.divine_record(record['question'], seed=record['seed'])
+            lines = result['casting']['original_lines']
+            error = result['error']
+            chars = len(result['interpretation'] or "")
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    end = time.perf_counter()
+
+    from dayan_divination import line_state_to_index
+    mismatch = (lines is not None and record.get('line_state') is not None
+                and line_state_to_index(lines) != record['line_state'])
+    with lock:
+        results.append({
+            'latency': end - start,
+            'ttft': None if first is None else first - start,
+            'chars': chars,
+            'error': error,
+            'mismatch': mismatch,
+        })
+
+
+def run_replay(records, ollama_url=None, model=None, speed=1.0, timeout=None):
+    """
+    回放录制的请求
+
+    Args:
+        records: load_capture() 的结果
+        ollama_url: 模型服务地址，None 时启动进程内替身按录制节奏应答
+        model: 使用的模型，默认取录制中的模型
+        speed: 加速倍数（到达间隔与 token 节奏都除以该值）
+        timeout: 单次占卜时限（秒）
+
+    Returns:
+        dict: 回放报告
+    """
+    from main import IChing
+
+    script = None
+    if ollama_url is None:
+        server, script = start_replay_backend(records, speed)
+        ollama_url = f"http://127.0.0.1:{server.server_address[1]}"
+    model = model or next((r['model'] for r in records if r.get('model')), "FortuneQwen3_q8:4b")
+    hits = RecordedHits()
+    iching = IChing(ollama_url=ollama_url, model=model, verbose=False, concise=True, timeout=timeout,
+                    cache=hits, pregenerated=hits)
+
+    results = []
+    lock = threading.Lock()
+    threads = []
+    base = records[0]['t'] if records else 0.0
+    started = time.perf_counter()
+    for record in records:
+        delay = started + (record['t'] - base) / speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        thread = threading.Thread(target=_replay_one, args=(iching, record, results, lock), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies = sorted(r['latency'] for r in results)
+    ttfts = sorted(r['ttft'] for r in results if r['ttft'] is not None)
+    report = {
+        'requests': len(results),
+        'errors': sum(1 for r in results if r['error']),
+        'state_mismatches': sum(1 for r in results if r['mismatch']),
+        'speed': speed,
+        'wall_s': wall,
+        'rps': len(results) / wall if wall else 0.0,
+        'chars_per_s': sum(r['chars'] for r in results) / wall if wall else 0.0,
+        'latency_p50_ms': percentile(latencies, 0.50) * 1000,
+        'latency_p95_ms': percentile(latencies, 0.95) * 1000,
+        'latency_p99_ms': percentile(latencies, 0.99) * 1000,
+        'ttft_p50_ms': percentile(ttfts, 0.50) * 1000,
+        'ttft_p95_ms': percentile(ttfts, 0.95) * 1000,
+        'cache_hits': hits.hits,
+    }
+    if script is not None:
+        report.update(script_matched=script.matched, script_fuzzy=script.fuzzy,
+                      script_unmatched=script.unmatched)
+    return report
+
+
+def run_version(code_dir, capture_path, speed=1.0, timeout=None):
+    """
+    在指定代码目录中以子进程回放，各版本使用各自的替身实例
+
+    Returns:
+        dict: 该版本的回放报告
+    """
+    records = load_capture(capture_path)
+    server, script = start_replay_backend(records, speed)
+    try:
+        command = [sys.executable, "traffic_replay.py", "run", os.path.abspath(capture_path),
+                   "--url", f"http://127.0.0.1:{server.server_address[1]}",
+                   "--speed", str(speed), "--json"]
+        if timeout is not None:
+            command += ["--timeout", str(timeout)]
+        output = subprocess.run(command, cwd=code_dir, check=True, capture_output=True,
+                                text=True).stdout
+    finally:
+        server.shutdown()
+        server.server_close()
+    report = json.loads(output)
+    report.update(script_matched=script.matched, script_fuzzy=script.fuzzy,
+                  script_unmatched=script.unmatched)
+    return report
+
+
+def format_report(report):
+    """单次回放报告的文本形式"""
+    lines = [
+        f"请求数: {report['requests']}  失败: {report['errors']}  爻象不一致: {report['state_mismatches']}"
+        f"  (加速 {report['speed']:g}x，耗时 {report['wall_s']:.1f} 秒)",
+        f"吞吐量: {report['rps']:.2f} req/s，{report['chars_per_s']:.0f} 字/s",
+        f"延迟 p50/p95/p99: {report['latency_p50_ms']:.0f} / {report['latency_p95_ms']:.0f}"
+        f" / {report['latency_p99_ms']:.0f} ms",
+        f"首块 p50/p95: {report['ttft_p50_ms']:.0f} / {report['ttft_p95_ms']:.0f} ms"
+        f"，录制的缓存命中 {report['cache_hits']} 次",
+    ]
+    if 'script_matched' in report:
+        lines.append(f"录制节奏匹配: {report['script_matched']} 精确，{report['script_fuzzy']} 按问题，"
+                     f"{report['script_unmatched']} 未匹配")
+    return "\n".join(lines)
+
+
+def format_comparison(baseline, candidate):
+    """两个版本报告的差异表"""
+    rows = [f"{'指标':<16}{'基线':>12}{'候选':>12}{'变化':>10}"]
+    for key, name, higher_is_better in METRICS:
+        old, new = baseline[key], candidate[key]
+        delta = (new - old) / old if old else 0.0
+        better = (delta > 0) == higher_is_better if delta else None
+        mark = "" if better is None else (" ↑" if better else " ↓")
+        rows.append(f"{name:<16}{old:>12.1f}{new:>12.1f}{delta:>+9.1%}{mark}")
+    return "\n".join(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="在本地模型替身上回放录制的流量")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="回放并输出报告")
+    run_parser.add_argument("capture", help="捕获文件")
+    run_parser.add_argument("--url", help="模型服务地址，不指定时启动进程内替身")
+    run_parser.add_argument("--speed", type=float, default=1.0, help="加速倍数 (默认: 1)")
+    run_parser.add_argument("--timeout", type=float, help="单次占卜时限（秒）")
+    run_parser.add_argument("--json", action="store_true", help="以 JSON 输出报告")
+
+    compare_parser = subparsers.add_parser("compare", help="比较两个代码版本")
+    compare_parser.add_argument("capture", help="捕获文件")
+    compare_parser.add_argument("--baseline", required=True, help="基线版本的代码目录")
+    compare_parser.add_argument("--candidate", default=".", help="候选版本的代码目录 (默认: 当前目录)")
+    compare_parser.add_argument("--speed", type=float, default=1.0, help="加速倍数 (默认: 1)")
+    compare_parser.add_argument("--timeout", type=float, help="单次占卜时限（秒）")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run_replay(load_capture(args.capture), ollama_url=args.url, speed=args.speed,
+                            timeout=args.timeout)
+        print(json.dumps(report) if args.json else format_report(report))
+    else:
+        reports = []
+        for label, code_dir in (("基线", args.baseline), ("候选", args.candidate)):
+            report = run_version(code_dir, args.capture, speed=args.speed, timeout=args.timeout)
+            print(f"[{label}] {code_dir}\n{format_report(report)}\n")
+            reports.append(report)
+        print(format_comparison(*reports))
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+模型预热模块
+Model Warm-up
+
+启动或长时间空闲后的第一次占卜需要等待 Ollama 加载模型。本模块在启动时：
+1. 通过 list_models 确认配置的模型已下载；
+2. 发送空 prompt 的加载请求，并以 keep_alive 指定模型的驻留时长；
+3. 可选地以精简模板的系统提示词请求 1 个 token，使其进入 Ollama 的 prompt 缓存；
+之后可启动后台线程，在空闲期间定期发送轻量的加载请求，使模型保持驻留。
+
+    python warmup.py --keep-alive 30m          # 测量冷启动与预热后的首 token 延迟
+"""
+
+import threading
+import time
+
+from ollama_client import keep_alive_seconds
+from prompt_templates import PromptTemplates
+
+
+DEFAULT_KEEP_ALIVE = "30m"
+
+
+def keep_alive_arg(text):
+    """
+    命令行 keep_alive 参数：纯数字按秒传给 Ollama，否则校验为时长字符串
+
+    Raises:
+        ValueError: 无法解析的取值
+    """
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    keep_alive_seconds(text)
+    return text
+
+
+def model_present(ollama):
+    """检查 ollama.model 是否在 list_models 中（未写标签时按 :latest 匹配）"""
+    names = set(ollama.list_models())
+    model = ollama.model
+    return model in names or (":" not in model and f"{model}:latest" in names)
+
+
+def measure_ttft(ollama, prompt="请用一句话解释乾卦。", system_prompt="", max_tokens=8):
+    """
+    测量一次流式请求的首 token 延迟
+
+    Returns:
+        float: 秒数，请求失败时返回None
+    """
+    start = time.perf_counter()
+    response = ollama.generate(prompt=prompt, system_prompt=system_prompt, stream=True,
+                               max_tokens=max_tokens)
+    try:
+        for _ in response:
+            return time.perf_counter() - start
+    except Exception:
+        return None
+    finally:
+        response.close()
+    return None
+
+
+class ModelWarmer:
+    """
+    模型预热与保活
+    """
+
+    def __init__(self, ollama, keep_alive=DEFAULT_KEEP_ALIVE, system_prompt=None,
+                 ping_interval=None):
+        """
+        Args:
+            ollama: OllamaClient 实例，其 keep_alive 会被设为同一取值，使每次生成都刷新驻留时长
+            keep_alive: 模型驻留时长（秒或 "30m" 等时长字符串，负数表示常驻）
+            system_prompt: 可选，预热时预先评估的系统提示词
+            ping_interval: 空闲多久（秒）发送一次保活请求，默认为驻留时长的一半
+        """
+        self.ollama = ollama
+        self.keep_alive = keep_alive
+        self.system_prompt = system_prompt
+        if ping_interval is None:
+            seconds = keep_alive_seconds(keep_alive)
+            ping_interval = max(1.0, seconds / 2) if 0 < seconds < float("inf") else None
+        self.ping_interval = ping_interval
+        self.pings = 0
+        ollama.keep_alive = keep_alive
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def warm_up(self):
+        """
+        执行预热
+
+        Returns:
+            dict: {'model_present', 'loaded', 'load_ms', 'prompt_eval_ms', 'total_ms', 'error'}
+        """
+        start = time.perf_counter()
+        result = {'model_present': False, 'loaded': False, 'load_ms': None,
+                  'prompt_eval_ms': None, 'total_ms': None, 'error': None}
+        if not model_present(self.ollama):
+            result['error'] = f"模型 {self.ollama.model} 不在 {self.ollama.base_url} 的模型列表中"
+        else:
+            result['model_present'] = True
+            stats = {}
+            result['loaded'] = self.ollama.load(self.keep_alive, stats=stats)
+            if not result['loaded']:
+                result['error'] = "模型加载请求失败"
+            else:
+                result['load_ms'] = stats.get('load_duration', 0) / 1e6
+                if self.system_prompt:
+                    stats = {}
+                    response = self.ollama.generate(prompt="。", system_prompt=self.system_prompt,
+                                                    stats=stats, max_tokens=1)
+                    if not response.startswith("错误:"):
+                        result['prompt_eval_ms'] = stats.get('prompt_eval_duration', 0) / 1e6
+        result['total_ms'] = (time.perf_counter() - start) * 1000
+        return result
+
+    def start(self):
+        """启动后台保活线程（驻留时长为 0 或常驻时不需要）"""
+        if self.ping_interval is None or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="model-keepalive", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台保活线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            idle = time.monotonic() - self.ollama.last_request
+            if self._stop.wait(max(0.0, self.ping_interval - idle)):
+                return
+            # 期间有真实请求时，其 keep_alive 已刷新驻留时长，无需再发
+            if time.monotonic() - self.ollama.last_request >= self.ping_interval:
+                if self.ollama.load(self.keep_alive):
+                    self.pings += 1
+
+
+def warm_up(ollama, keep_alive=DEFAULT_KEEP_ALIVE, preload_prompt=False, keep_resident=True):
+    """
+    预热模型并按需启动保活
+
+    Args:
+        ollama: OllamaClient 实例
+        keep_alive: 模型驻留时长
+        preload_prompt: 是否预先评估精简模板的系统提示词
+        keep_resident: 是否在空闲期间定期保活
+
+    Returns:
+        tuple: (ModelWarmer, 预热结果字典)
+    """
+    warmer = ModelWarmer(ollama, keep_alive=keep_alive,
+                         system_prompt=PromptTemplates.SYSTEM_PROMPT_CONCISE if preload_prompt else None)
+    result = warmer.warm_up()
+    if keep_resident and result['loaded']:
+        warmer.start()
+    return warmer, result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from ollama_client import OllamaClient
+
+    parser = argparse.ArgumentParser(description="测量冷启动与预热后的首 token 延迟")
+    parser.add_argument("--url", help="Ollama服务地址，不指定时使用进程内替身")
+    parser.add_argument("--model", default="FortuneQwen3_q8:4b", help="使用的AI模型")
+    parser.add_argument("--keep-alive", type=keep_alive_arg, default=DEFAULT_KEEP_ALIVE,
+                        help="模型驻留时长，如 30m、3600、-1 (默认: 30m)")
+    parser.add_argument("--preload-prompt", action="store_true", help="预热时预先评估系统提示词")
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        from fake_ollama import FakeOllamaConfig, start_fake_ollama
+        server = start_fake_ollama(config=FakeOllamaConfig(ttft=0.05, load_time=1.5))
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        print(f"使用进程内 Ollama 替身 {url}（加载耗时 1.5 秒）")
+
+    ollama = OllamaClient(base_url=url, model=args.model)
+    system_prompt = PromptTemplates.SYSTEM_PROMPT_CONCISE
+
+    ollama.unload()
+    cold = measure_ttft(ollama, system_prompt=system_prompt)
+    ollama.unload()
+    warmer = ModelWarmer(ollama, keep_alive=args.keep_alive,
+                         system_prompt=system_prompt if args.preload_prompt else None)
+    result = warmer.warm_up()
+    warm = measure_ttft(ollama, system_prompt=system_prompt)
+
+    if result['error']:
+        print(f"预热失败: {result['error']}")
+    else:
+        print(f"预热耗时 {result['total_ms']:.0f} ms（加载 {result['load_ms']:.0f} ms）")
+    if cold is None or warm is None:
+        print("测量失败，请检查 Ollama 服务与模型")
+    else:
+        print(f"首 token 延迟: 冷启动 {cold * 1000:.0f} ms，预热后 {warm * 1000:.0f} ms")